@@ -0,0 +1,443 @@
+"""
+bot_loadtest.py - offline load test for telegram_dashboard_bot_v2
+
+- Generates a synthetic archive tree in a temp dir (ALIS_ROOT): router_log.csv
+  with --router-rows rows, PAYMENTS.csv, CLIENT_QUOTES.csv, pipeline events,
+  a CASES tree for file search.
+- Builds the real Application (build_application) on a fake Bot API transport:
+  no network, every API call is answered locally (optional --net-ms delay).
+- Replays a script of updates through the Application's update processor
+  and process_update (same ordering and handler routing as production) plus _notification_tick, --rounds times;
+  --burst N sends every step N times concurrently (rapid button presses).
+- Reports p50/p95/p99/max per step (first round separately as "cold"),
+  the bot's own source/handler histograms and peak RSS.
+
+Linux only (peak RSS from getrusage). Examples:
+  python bot_loadtest.py --router-rows 100000 --rounds 20
+  python bot_loadtest.py --router-rows 1000000 --rounds 5 --burst 5 --json out.json
+  python bot_loadtest.py --script steps.txt
+
+Script: one step per line, "#" comments allowed:
+  cmd:<command> [args]   /start, /health, ...
+  cb:<callback_data>     button press (dashboard, quotes, payables, ...)
+  text:<message>         text message (search / AI mode)
+  tick                   one _notification_tick plus one SLA wake-up
+  append:<n>             append n fresh rows to router_log.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+CHAT_ID = 424242
+DASHBOARD_MESSAGE_ID = 1
+FAKE_TOKEN = "123456:LOADTEST"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "ALIS", "username": "alis_loadtest_bot"}
+USER = {"id": CHAT_ID, "is_bot": False, "first_name": "Load"}
+
+DEFAULT_SCRIPT = """
+cmd:start
+cb:dashboard
+cb:mail
+cb:payables
+cb:risk_report
+cb:quotes
+cb:quotes_report
+cb:quotes_draft_generate
+cb:invoices
+cb:status
+cb:search
+text:faktura
+text:wycena kuchni
+cb:ai_open
+text:что по оплатам
+text:откуда цифры по рискам
+text:клиент client17
+cb:notify_menu
+tick
+append:50
+cb:dashboard
+tick
+cmd:health
+"""
+
+ROUTER_HEADER = [
+    "ts_utc", "decision", "status", "file", "meta", "from", "subject",
+    "payment_risk", "project_type", "urgency", "quality",
+]
+DECISIONS = ["KLIENTS"] * 45 + ["FIRMA"] * 30 + ["CAR"] * 5 + ["REVIEW"] * 20
+RISKS = ["n/a"] * 70 + ["low"] * 15 + ["medium"] * 10 + ["high"] * 5
+QUALITIES = ["unknown"] * 60 + ["good"] * 30 + ["vague"] * 10
+SUBJECTS = {
+    "KLIENTS": ["Wycena kuchni {n}", "Zapytanie o meble {n}", "Re: wycena szafy {n}", "Instrukcje do zamówienia {n}"],
+    "FIRMA": ["Faktura VAT {n}/2026", "Receipt from OpenAI #{n}", "Wyciąg bankowy {n}", "ZUS składka {n}"],
+    "CAR": ["Serwis auta {n}", "Polisa OC {n}"],
+    "REVIEW": ["Dokument {n}", "Fwd: skan {n}"],
+}
+
+
+# =========================
+# Synthetic data
+# =========================
+
+def _router_row(rnd: random.Random, ts: datetime, n: int) -> list[str]:
+    decision = rnd.choice(DECISIONS)
+    client = rnd.randrange(2000)
+    sender = "centrum@meble.pl" if rnd.random() < 0.03 else f"client{client}@example.pl"
+    subject = rnd.choice(SUBJECTS[decision]).format(n=rnd.randrange(5000))
+    return [
+        ts.isoformat(), decision, "MOVED", f"{n:07d}.pdf", f"{n:07d}.meta.json",
+        f"Client {client} <{sender}>", subject,
+        rnd.choice(RISKS), "kitchen", "normal", rnd.choice(QUALITIES),
+    ]
+
+
+def write_router_log(path: Path, rows: int, days: int, rnd: random.Random) -> None:
+    """rows evenly spread over the last `days` days, oldest first (append order)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    end = datetime.now(timezone.utc)
+    step = timedelta(days=days) / max(1, rows)
+    ts = end - timedelta(days=days)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(ROUTER_HEADER)
+        for n in range(rows):
+            w.writerow(_router_row(rnd, ts, n))
+            ts += step
+
+
+def append_router_rows(path: Path, rows: int, rnd: random.Random) -> None:
+    now = datetime.now(timezone.utc)
+    with path.open("a", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        for _ in range(rows):
+            w.writerow(_router_row(rnd, now, rnd.randrange(10**6, 10**7)))
+
+
+def write_payments(path: Path, rows: int, rnd: random.Random) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    today = date.today()
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["name", "amount", "deadline", "status", "type"])
+        for n in range(rows):
+            deadline = today + timedelta(days=rnd.randint(-30, 60))
+            status = "pending" if rnd.random() < 0.7 else "paid"
+            w.writerow([f"Płatność {n}", f"{rnd.randint(50, 20000)}", deadline.isoformat(), status, rnd.choice(["ZUS", "VAT", "FAKTURA"])])
+
+
+def write_quotes(path: Path, headers: list[str], rows: int, rnd: random.Random) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    today = date.today()
+    with path.open("w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=headers)
+        w.writeheader()
+        for n in range(rows):
+            client = rnd.randrange(2000)
+            w.writerow({
+                "quote_id": f"Q-{n:06d}",
+                "client": f"Client {client}",
+                "subject": f"Wycena kuchni {n}",
+                "amount": "" if rnd.random() < 0.2 else str(rnd.randint(2000, 90000)),
+                "currency": "PLN",
+                "date": (today - timedelta(days=rnd.randint(0, 120))).isoformat(),
+                "status": rnd.choice(["open", "sent", "won", "lost", "expired"]),
+                "due_date": "",
+                "email_from": f"client{client}@example.pl",
+                "email_subject": f"Wycena kuchni {n}",
+                "notes": "",
+            })
+
+
+def write_pipeline_events(path: Path, runs: int = 3) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    t = datetime.now(timezone.utc) - timedelta(hours=runs)
+    with path.open("w", encoding="utf-8") as f:
+        for r in range(runs):
+            run_id = f"loadtest-{r}"
+            def ev(**kw):
+                f.write(json.dumps({"ts_utc": t.strftime("%Y-%m-%dT%H:%M:%SZ"), "run_id": run_id, **kw}) + "\n")
+            ev(event="run_start")
+            for stage in ("IMPORT_GMAIL", "ROUTER", "INDEX"):
+                ev(event="stage_start", stage=stage)
+                ev(event="stage_stop", stage=stage, ok=True, exit_code=0, attempts=1, duration_ms=900, count=12)
+            ev(event="run_done", duration_ms=3100)
+            t += timedelta(hours=1)
+
+
+def write_case_files(root: Path, files: int, rnd: random.Random) -> None:
+    names = ["Wycena_{n}.pdf", "Faktura_{n}.pdf", "Wyciąg_{n}.pdf", "Umowa_{n}.docx", "Projekt_{n}.dwg"]
+    for n in range(files):
+        d = root / "CASES" / "01_KLIENTS" / f"Client_{n % 200:03d}"
+        d.mkdir(parents=True, exist_ok=True)
+        (d / rnd.choice(names).format(n=n)).touch()
+
+
+# =========================
+# Fake transport / updates
+# =========================
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally (no network); counts calls per method."""
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1000)
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data=None, **_timeouts) -> tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        params = request_data.parameters if request_data is not None else {}
+
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint in {"sendMessage", "editMessageText"}:
+            result = {
+                "message_id": int(params.get("message_id") or next(self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id") or CHAT_ID), "type": "private"},
+                "from": BOT_USER,
+                "text": str(params.get("text") or ""),
+            }
+        elif endpoint == "getUpdates":
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+class UpdateFactory:
+    def __init__(self, bot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    def _message(self, text: str, message_id: int, sender: dict = USER, **extra) -> dict:
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": CHAT_ID, "type": "private", "first_name": "Load"},
+            "from": sender,
+            "text": text,
+            **extra,
+        }
+
+    def make(self, kind: str, arg: str) -> Update:
+        uid = next(self._ids)
+        if kind == "cb":
+            payload = {
+                "update_id": uid,
+                "callback_query": {
+                    "id": str(uid),
+                    "from": USER,
+                    "chat_instance": "loadtest",
+                    "data": arg,
+                    "message": self._message("dashboard", DASHBOARD_MESSAGE_ID, sender=BOT_USER),
+                },
+            }
+        elif kind == "cmd":
+            name = arg.split()[0]
+            payload = {
+                "update_id": uid,
+                "message": self._message(
+                    f"/{arg}", 10_000 + uid,
+                    entities=[{"type": "bot_command", "offset": 0, "length": len(name) + 1}],
+                ),
+            }
+        elif kind == "text":
+            payload = {"update_id": uid, "message": self._message(arg, 10_000 + uid)}
+        else:
+            raise ValueError(f"unknown step kind: {kind}")
+        return Update.de_json(payload, self.bot)
+
+
+def load_script(path: Optional[str]) -> list[str]:
+    text = Path(path).read_text(encoding="utf-8") if path else DEFAULT_SCRIPT
+    return [ln.strip() for ln in text.splitlines() if ln.strip() and not ln.strip().startswith("#")]
+
+
+# =========================
+# Measurement
+# =========================
+
+def _percentile(sorted_ms: list[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, max(0, math.ceil(q * len(sorted_ms)) - 1))]
+
+
+def summarize(samples: dict[str, list[float]]) -> dict[str, dict]:
+    out = {}
+    for label, values in samples.items():
+        s = sorted(values)
+        out[label] = {
+            "n": len(s),
+            "p50": round(_percentile(s, 0.50), 2),
+            "p95": round(_percentile(s, 0.95), 2),
+            "p99": round(_percentile(s, 0.99), 2),
+            "max": round(s[-1], 2) if s else 0.0,
+        }
+    return out
+
+
+def format_table(title: str, stats: dict[str, dict]) -> str:
+    lines = [title, f"{'step':<34}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+    for label, st in stats.items():
+        lines.append(f"{label[:33]:<34}{st['n']:>6}{st['p50']:>10.1f}{st['p95']:>10.1f}{st['p99']:>10.1f}{st['max']:>10.1f}")
+    return "\n".join(lines)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+# =========================
+# Replay
+# =========================
+
+async def replay(bot, args, script: list[str], rnd: random.Random) -> dict:
+    transport = FakeTelegramRequest(latency_s=args.net_ms / 1000.0)
+    application = bot.build_application(FAKE_TOKEN, request=transport)
+    await application.initialize()
+    factory = UpdateFactory(application.bot)
+    context = SimpleNamespace(bot=application.bot, application=application, job=None, job_queue=None, args=[])
+    lag_task = asyncio.create_task(bot.loop_lag_monitor(bot.METRICS, 0.05))
+
+    async def run_step(step: str) -> float:
+        kind, _, arg = step.partition(":")
+        t0 = time.perf_counter()
+        if kind == "tick":
+            await bot._notification_tick(context)
+            await bot._sla_fire(context)
+        elif kind == "append":
+            await asyncio.to_thread(append_router_rows, bot.ROUTER_LOG, int(arg or 1), rnd)
+        else:
+            # same path as the polling loop: through the update processor
+            update = factory.make(kind, arg)
+            await application.update_processor.process_update(update, application.process_update(update))
+        return (time.perf_counter() - t0) * 1000.0
+
+    cold: dict[str, list[float]] = {}
+    warm: dict[str, list[float]] = {}
+    t_start = time.perf_counter()
+    try:
+        for round_no in range(args.rounds):
+            target = cold if round_no == 0 else warm
+            for step in script:
+                n = 1 if step.startswith(("append", "tick")) else args.burst
+                results = await asyncio.gather(*(run_step(step) for _ in range(n)))
+                target.setdefault(step, []).extend(results)
+    finally:
+        lag_task.cancel()
+        await application.shutdown()
+    return {
+        "cold": summarize(cold),
+        "warm": summarize(warm),
+        "wall_s": round(time.perf_counter() - t_start, 2),
+        "api_calls": dict(transport.calls),
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Offline load test for telegram_dashboard_bot_v2")
+    ap.add_argument("--router-rows", type=int, default=10_000)
+    ap.add_argument("--router-days", type=int, default=90)
+    ap.add_argument("--payments", type=int, default=500)
+    ap.add_argument("--quotes", type=int, default=2_000)
+    ap.add_argument("--files", type=int, default=2_000, help="files under CASES (search index)")
+    ap.add_argument("--rounds", type=int, default=10)
+    ap.add_argument("--burst", type=int, default=1, help="concurrent copies of every update")
+    ap.add_argument("--net-ms", type=float, default=0.0, help="simulated Bot API latency per call")
+    ap.add_argument("--script", help="step file (default: built-in tour of all screens)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--root", help="data dir (default: temp dir, removed afterwards)")
+    ap.add_argument("--keep", action="store_true", help="keep the generated data dir")
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args()
+
+    root = Path(args.root) if args.root else Path(tempfile.mkdtemp(prefix="alis_loadtest_"))
+    os.environ["ALIS_ROOT"] = str(root)
+    os.environ["ALIS_FINANCE_DB"] = str(root / "finance.sqlite3")
+    # paths in the bot module derive from ALIS_ROOT at import time
+    import telegram_dashboard_bot_v2 as bot
+
+    rnd = random.Random(args.seed)
+    t0 = time.perf_counter()
+    write_router_log(bot.ROUTER_LOG, args.router_rows, args.router_days, rnd)
+    write_payments(bot.PAYMENTS_CSV, args.payments, rnd)
+    write_quotes(bot.CLIENT_QUOTES_CSV, bot._csv_headers_quotes(), args.quotes, rnd)
+    write_pipeline_events(bot.PIPELINE_EVENTS)
+    write_case_files(root, args.files, rnd)
+    bot.CHAT_ID_FILE.parent.mkdir(parents=True, exist_ok=True)
+    bot.CHAT_ID_FILE.write_text(str(CHAT_ID), encoding="utf-8")
+    bot._set_chat_state(CHAT_ID, {"dashboard_message_id": DASHBOARD_MESSAGE_ID, "notify_enabled": True})
+    gen_s = time.perf_counter() - t0
+    rss_after_gen = peak_rss_mb()
+
+    print(f"data: {root} ({args.router_rows} router rows, generated in {gen_s:.1f}s)")
+    script = load_script(args.script)
+    try:
+        result = asyncio.run(replay(bot, args, script, rnd))
+    finally:
+        bot._CHAT_STATE.flush()
+        if not args.root and not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    result["peak_rss_after_generation_mb"] = round(rss_after_gen, 1)
+    result["config"] = vars(args)
+
+    print()
+    print(format_table("Cold (round 1)", result["cold"]))
+    if result["warm"]:
+        print()
+        print(format_table(f"Warm (rounds 2..{args.rounds}, burst={args.burst})", result["warm"]))
+    print()
+    print(bot.METRICS.render_text(limit=30))
+    print()
+    print(f"wall: {result['wall_s']}s  api calls: {result['api_calls']}")
+    print(f"peak RSS: {result['peak_rss_mb']} MB (after data generation: {result['peak_rss_after_generation_mb']} MB)")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,261 @@
+"""
+In-process metrics for the Telegram dashboard bot.
+
+- Histogram: fixed millisecond buckets (Prometheus-style cumulative export),
+  percentiles estimated from buckets.
+- Metrics: named histograms per kind ("handler", "source", "loop"), thread-safe,
+  with timer() context manager and timed() decorator.
+- loop_lag_monitor(): asyncio task that measures event-loop lag.
+- CallbackProfiler: cProfile of the next N callbacks (event-loop thread plus
+  instrumented data sources running in worker threads).
+- start_http_server(): optional local endpoint serving Prometheus text format.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import functools
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q: float) -> float:
+        """Upper bucket bound holding the q-quantile, capped at the observed max"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(float(BUCKETS_MS[i]), self.max_ms) if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self.profiler: Optional["CallbackProfiler"] = None
+
+    def observe(self, kind: str, name: str, seconds: float) -> None:
+        with self._lock:
+            h = self.histograms.get((kind, name))
+            if h is None:
+                h = self.histograms[(kind, name)] = Histogram()
+            h.observe(seconds * 1000.0)
+
+    @contextmanager
+    def timer(self, kind: str, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(kind, name, time.perf_counter() - t0)
+
+    def timed(self, kind: str = "source", name: Optional[str] = None):
+        """Decorator for sync functions; also profiled while a CallbackProfiler is active"""
+        def deco(fn):
+            label = name or fn.__name__.lstrip("_")
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    prof = self.profiler
+                    if prof is not None and prof.active:
+                        return prof.runcall(fn, *args, **kwargs)
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(kind, label, time.perf_counter() - t0)
+            return wrapper
+        return deco
+
+    def snapshot(self) -> list[tuple[str, str, Histogram]]:
+        with self._lock:
+            return [(k, n, h) for (k, n), h in sorted(self.histograms.items())]
+
+    # -----------------------------
+    # rendering
+    # -----------------------------
+
+    def render_text(self, extra: Optional[dict] = None, limit: int = 12) -> str:
+        lines: list[str] = []
+        by_kind: dict[str, list] = {}
+        for kind, name, h in self.snapshot():
+            by_kind.setdefault(kind, []).append((name, h))
+        for kind in sorted(by_kind):
+            rows = sorted(by_kind[kind], key=lambda x: x[1].percentile(0.95), reverse=True)[:limit]
+            lines.append(f"[{kind}] n / p50 / p95 / p99 / max (ms)")
+            for name, h in rows:
+                lines.append(
+                    f"{name}: {h.count} / {h.percentile(0.5):.0f} / {h.percentile(0.95):.0f}"
+                    f" / {h.percentile(0.99):.0f} / {h.max_ms:.0f}"
+                )
+            lines.append("")
+        for key, value in (extra or {}).items():
+            lines.append(f"{key}: {value}")
+        return "\n".join(lines).strip() or "(нет данных)"
+
+    def render_prometheus(self, gauges: Optional[dict[str, float]] = None, prefix: str = "alis_bot") -> str:
+        out: list[str] = []
+        declared: set[str] = set()
+        for kind, name, h in self.snapshot():
+            metric = f"{prefix}_{kind}_latency_ms"
+            if metric not in declared:
+                out.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            label = name.replace("\\", "\\\\").replace('"', '\\"')
+            cum = 0
+            for bound, n in zip(BUCKETS_MS, h.counts):
+                cum += n
+                out.append(f'{metric}_bucket{{name="{label}",le="{bound}"}} {cum}')
+            out.append(f'{metric}_bucket{{name="{label}",le="+Inf"}} {h.count}')
+            out.append(f'{metric}_sum{{name="{label}"}} {h.sum_ms:.3f}')
+            out.append(f'{metric}_count{{name="{label}"}} {h.count}')
+        for key, value in (gauges or {}).items():
+            out.append(f"# TYPE {prefix}_{key} gauge")
+            out.append(f"{prefix}_{key} {float(value)}")
+        return "\n".join(out) + "\n"
+
+
+async def loop_lag_monitor(metrics: Metrics, interval_s: float = 1.0) -> None:
+    """Sleep interval_s repeatedly; anything beyond it is time the loop was blocked"""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval_s)
+        metrics.observe("loop", "lag", max(0.0, loop.time() - t0 - interval_s))
+
+
+class CallbackProfiler:
+    """
+    cProfile of the next N callbacks; worker-thread work is profiled via Metrics.timed.
+
+    On Python 3.12+ cProfile sits on sys.monitoring, which allows one active
+    profiler per process: a profiler that cannot be enabled (another one is
+    running on some thread) is skipped and the call runs unprofiled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self.chat_id: Optional[int] = None
+        self._profiles: list[cProfile.Profile] = []
+        self._local = threading.local()
+
+    @property
+    def active(self) -> bool:
+        return self.remaining > 0
+
+    def start(self, n: int, chat_id: int) -> None:
+        with self._lock:
+            self.remaining = max(0, n)
+            self.chat_id = chat_id
+            self._profiles = []
+
+    @staticmethod
+    def _enable(prof: cProfile.Profile) -> bool:
+        try:
+            prof.enable()
+        except ValueError:
+            # "Another profiling tool is already active" (3.12+)
+            return False
+        return True
+
+    def runcall(self, fn: Callable, *args, **kwargs):
+        if getattr(self._local, "busy", False):
+            # already inside a profiled call on this thread (one profiler per thread)
+            return fn(*args, **kwargs)
+        prof = cProfile.Profile()
+        if not self._enable(prof):
+            return fn(*args, **kwargs)
+        self._local.busy = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            prof.disable()
+            self._local.busy = False
+            with self._lock:
+                self._profiles.append(prof)
+
+    @contextmanager
+    def callback(self):
+        """Profile one callback on the event-loop thread"""
+        if not self.active or getattr(self._local, "busy", False):
+            yield
+            return
+        prof = cProfile.Profile()
+        if not self._enable(prof):
+            yield
+            return
+        self._local.busy = True
+        try:
+            yield
+        finally:
+            prof.disable()
+            self._local.busy = False
+            with self._lock:
+                self._profiles.append(prof)
+                self.remaining = max(0, self.remaining - 1)
+
+    def report(self, top: int = 20) -> str:
+        """Top functions by cumulative time over everything captured so far"""
+        with self._lock:
+            profiles = [p for p in self._profiles if p.getstats()]
+            self._profiles = []
+        if not profiles:
+            return "(профиль пуст)"
+        buf = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=buf)
+        for p in profiles[1:]:
+            stats.add(p)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+        return buf.getvalue()
+
+
+def start_http_server(port: int, render: Callable[[], str], host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve render() as text/plain on http://host:port/metrics (daemon thread)"""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in {"/", "/metrics"}:
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,173 @@
+"""
+Write-behind store for per-chat UI state (telegram_ui_state.json).
+
+- Reads and writes hit an in-memory dict; the file is loaded once.
+- Changes are flushed by a background thread: flush_delay_s after the last
+  change, but never later than max_delay_s after the first unsaved change.
+- Flush is atomic (temp file + replace) and compact (no indentation).
+  A failed write removes its temp file and is retried with a growing delay
+  (flush_delay_s doubled per failure, at most RETRY_MAX_S).
+- ttl_s: per-key TTL for dict values of {record_key: "...Z" timestamp}
+  (e.g. notify_payment_alerts dedup records); expired records are dropped
+  on load and on every flush instead of growing until a size trim.
+
+Same on-disk layout as before: {"<chat_id>": {...state...}}.
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+RETRY_MAX_S = 60.0
+
+
+def _ts_epoch(value) -> Optional[float]:
+    s = str(value or "").strip()
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    try:
+        dt = datetime.fromisoformat(s)
+    except Exception:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class ChatStateStore:
+    def __init__(self, path: Path, flush_delay_s: float = 2.0, max_delay_s: float = 10.0,
+                 ttl_s: Optional[dict[str, float]] = None):
+        self.path = Path(path)
+        self.flush_delay_s = flush_delay_s
+        self.max_delay_s = max_delay_s
+        self.ttl_s = dict(ttl_s or {})
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()  # snapshot + replace as one step
+        self._data: Optional[dict[str, dict]] = None
+        self._dirty_since: Optional[float] = None
+        self._last_change = 0.0
+        self._retry_at = 0.0
+        self._failures = 0
+        self._thread: Optional[threading.Thread] = None
+        self.flushes = 0
+        atexit.register(self.flush)
+
+    # -----------------------------
+    # load / flush
+    # -----------------------------
+
+    def _loaded(self) -> dict[str, dict]:
+        if self._data is None:
+            try:
+                raw = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception:
+                raw = {}
+            data = raw if isinstance(raw, dict) else {}
+            self._data = {k: v for k, v in data.items() if isinstance(v, dict)}
+            self._expire(time.time())
+        return self._data
+
+    def _expire(self, now: float) -> None:
+        for state in (self._data or {}).values():
+            for key, ttl in self.ttl_s.items():
+                records = state.get(key)
+                if not isinstance(records, dict):
+                    continue
+                stale = [k for k, ts in records.items() if (_ts_epoch(ts) or 0.0) < now - ttl]
+                for k in stale:
+                    records.pop(k, None)
+
+    def flush(self) -> bool:
+        """Write pending changes now (atomic). Returns True if a file was written."""
+        with self._write_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> bool:
+        # Held under _write_lock so a newer snapshot can never be overwritten
+        # by an older one (flusher thread vs. shutdown flush()).
+        with self._lock:
+            if self._dirty_since is None or self._data is None:
+                return False
+            self._expire(time.time())
+            payload = json.dumps(self._data, ensure_ascii=False, separators=(",", ":"))
+            self._dirty_since = None
+        tmp = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            if tmp is not None:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+            with self._lock:
+                self._failures += 1
+                delay = min(RETRY_MAX_S, self.flush_delay_s * 2 ** self._failures)
+                self._retry_at = time.monotonic() + delay
+                if self._dirty_since is None:
+                    self._dirty_since = time.monotonic()
+            print(f"UI state flush failed ({e}); retry in {delay:.0f}s")
+            return False
+        with self._lock:
+            self._failures = 0
+            self._retry_at = 0.0
+        self.flushes += 1
+        return True
+
+    def _flusher(self) -> None:
+        while True:
+            with self._lock:
+                while self._dirty_since is None:
+                    self._wake.wait()
+                due = min(self._last_change + self.flush_delay_s, self._dirty_since + self.max_delay_s)
+                due = max(due, self._retry_at)
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._wake.wait(wait)
+                    continue
+            self.flush()
+
+    # -----------------------------
+    # API
+    # -----------------------------
+
+    def get(self, chat_id) -> dict:
+        """Copy of one chat's state (nested dicts copied too)"""
+        with self._lock:
+            cur = self._loaded().get(str(chat_id), {})
+            return {k: (dict(v) if isinstance(v, dict) else v) for k, v in cur.items()}
+
+    def update(self, chat_id, patch: dict) -> None:
+        """Patch one chat's state in memory; the file is written later"""
+        with self._lock:
+            data = self._loaded()
+            cur = data.setdefault(str(chat_id), {})
+            changed = False
+            for k, v in patch.items():
+                if cur.get(k, object()) != v:
+                    cur[k] = dict(v) if isinstance(v, dict) else v
+                    changed = True
+            if not changed:
+                return
+            now = time.monotonic()
+            self._last_change = now
+            if self._dirty_since is None:
+                self._dirty_since = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flusher, name="chat-state-flush", daemon=True)
+                self._thread.start()
+            self._wake.notify()
@@ -0,0 +1,259 @@
+"""
+Per-client timeline index across router_log.csv, CLIENT_QUOTES.csv and PAYMENTS.csv.
+
+Key = sender e-mail address (lowercase) or, when there is no address, the
+diacritic-folded name. Each client has one time-ordered timeline of events:
+emails (with document path), quotes and payments.
+
+Updates are incremental:
+- router_log.csv is append-only -> only bytes after the last offset are parsed
+- quotes / payments are small hand-edited CSVs -> re-read only when
+  (mtime_ns, size) changes, replacing just that source's events
+Lookups cost O(client history), not O(all data).
+"""
+
+from __future__ import annotations
+
+import bisect
+import csv
+import io
+import sys
+import threading
+from email.utils import parseaddr
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "MAIL"))
+from text_search import TrigramIndex, normalize
+
+ROOT = Path(r"C:\Users\alimg\Dropbox\Archiwum 3.0")
+
+DECISION_DIRS = {
+    "KLIENTS": Path("CASES") / "01_KLIENTS" / "_INBOX",
+    "FIRMA": Path("CASES") / "02_FIRMA" / "_INBOX",
+    "CAR": Path("CASES") / "03_CAR" / "_INBOX",
+    "REVIEW": Path("CASES") / "_REVIEW",
+}
+
+
+def client_key(sender: str) -> str:
+    """'Jan Kowalski <JAN@x.pl>' -> 'jan@x.pl'; 'Łukasz Nowak' -> 'lukasz nowak'"""
+    name, addr = parseaddr(sender or "")
+    addr = addr.strip().lower()
+    if "@" in addr:
+        return addr
+    return normalize(name or sender)
+
+
+def client_label(sender: str) -> str:
+    name, addr = parseaddr(sender or "")
+    return (name or addr or sender or "").strip().strip('"') or "Unknown"
+
+
+def _stat_sig(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+class ClientIndex:
+    def __init__(self, root: Path = ROOT):
+        self.root = Path(root)
+        self.router_log = self.root / "00_INBOX" / "_ROUTER_LOGS" / "router_log.csv"
+        self.quotes_csv = self.root / "FINANCE" / "CLIENT_QUOTES.csv"
+        self.payments_csv = self.root / "FINANCE" / "PAYMENTS.csv"
+
+        self._lock = threading.Lock()
+        self.timelines: dict[str, list] = {}
+        self.labels: dict[str, str] = {}
+        self._names = TrigramIndex()
+        self._name_keys: list[str] = []
+        self._seq = 0
+
+        self._router_offset = 0
+        self._router_header: list[str] = []
+        self._router_sig: Optional[tuple] = None
+        self._source_sigs: dict[str, Optional[tuple]] = {}
+        self._source_keys: dict[str, set] = {"quote": set(), "payment": set()}
+        self.version = 0
+
+    # -----------------------------
+    # building
+    # -----------------------------
+
+    def _add_event(self, key: str, label: str, event: dict) -> None:
+        if not key:
+            return
+        if key not in self.timelines:
+            self.timelines[key] = []
+            self.labels[key] = label
+            self._names.add(f"{label} {key}")
+            self._name_keys.append(key)
+        self._seq += 1
+        bisect.insort(self.timelines[key], (event.get("ts") or "", self._seq, event))
+
+    def _drop_source(self, source: str) -> None:
+        for key in self._source_keys.get(source, set()):
+            tl = self.timelines.get(key)
+            if tl:
+                tl[:] = [item for item in tl if item[2].get("kind") != source]
+        self._source_keys[source] = set()
+
+    def _refresh_router(self) -> bool:
+        sig = _stat_sig(self.router_log)
+        if sig is None or sig == self._router_sig:
+            return False
+        if sig[1] < self._router_offset:
+            # rotated / rewritten: start over for e-mails
+            self._router_offset = 0
+            self._router_header = []
+            for tl in self.timelines.values():
+                tl[:] = [item for item in tl if item[2].get("kind") != "email"]
+
+        with self.router_log.open("rb") as f:
+            f.seek(self._router_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end <= 0:
+            return False
+        chunk = data[:end].decode("utf-8", errors="replace")
+        self._router_offset += end
+        self._router_sig = sig
+
+        reader = csv.reader(io.StringIO(chunk, newline=""))
+        for values in reader:
+            if not self._router_header:
+                self._router_header = values
+                continue
+            row = dict(zip(self._router_header, values))
+            sender = row.get("from") or ""
+            decision = (row.get("decision") or "").upper()
+            file_name = (row.get("file") or "").strip()
+            doc_dir = DECISION_DIRS.get(decision)
+            self._add_event(client_key(sender), client_label(sender), {
+                "kind": "email",
+                "ts": (row.get("ts_utc") or "").strip(),
+                "title": (row.get("subject") or file_name).strip(),
+                "decision": decision,
+                "path": str(doc_dir / file_name) if doc_dir and file_name else "",
+            })
+        return True
+
+    def _refresh_csv(self, source: str, path: Path, to_event) -> bool:
+        sig = _stat_sig(path)
+        if sig == self._source_sigs.get(source):
+            return False
+        self._source_sigs[source] = sig
+        self._drop_source(source)
+        if sig is None:
+            return True
+        try:
+            with path.open("r", encoding="utf-8", errors="replace", newline="") as f:
+                for row in csv.DictReader(f):
+                    key, label, event = to_event(row)
+                    if key:
+                        self._add_event(key, label, event)
+                        self._source_keys[source].add(key)
+        except Exception:
+            pass
+        return True
+
+    @staticmethod
+    def _quote_event(row: dict) -> tuple:
+        sender = (row.get("email_from") or "").strip() or (row.get("client") or "").strip()
+        return (client_key(sender), (row.get("client") or "").strip() or client_label(sender), {
+            "kind": "quote",
+            "ts": (row.get("date") or "").strip(),
+            "title": (row.get("subject") or row.get("email_subject") or "").strip(),
+            "amount": (row.get("amount") or "").strip(),
+            "currency": (row.get("currency") or "").strip() or "PLN",
+            "status": (row.get("status") or "").strip().lower(),
+            "quote_id": (row.get("quote_id") or "").strip(),
+        })
+
+    @staticmethod
+    def _payment_event(row: dict) -> tuple:
+        name = (row.get("name") or "").strip()
+        return (client_key(name), name, {
+            "kind": "payment",
+            "ts": (row.get("deadline") or "").strip(),
+            "title": name,
+            "amount": (row.get("amount") or "").strip(),
+            "status": (row.get("status") or "").strip().lower(),
+        })
+
+    def refresh(self) -> bool:
+        """Pick up changes in all sources (cheap stat() when nothing changed)"""
+        with self._lock:
+            changed = self._refresh_router()
+            changed |= self._refresh_csv("quote", self.quotes_csv, self._quote_event)
+            changed |= self._refresh_csv("payment", self.payments_csv, self._payment_event)
+            if changed:
+                self.version += 1
+            return changed
+
+    # -----------------------------
+    # lookups
+    # -----------------------------
+
+    def find(self, query: str, limit: int = 5) -> list[str]:
+        """Client keys matching an address, exact name or fuzzy name"""
+        q = (query or "").strip()
+        if not q:
+            return []
+        key = client_key(q)
+        if key in self.timelines:
+            return [key]
+        return [self._name_keys[doc_id] for doc_id, _ in self._names.search(q, limit=limit)]
+
+    def timeline(self, key: str, limit: Optional[int] = None) -> list[dict]:
+        """Events of one client, newest first"""
+        items = self.timelines.get(key) or []
+        picked = items if limit is None else items[-limit:]
+        return [event for _, _, event in reversed(picked)]
+
+    def recent_clients(self, limit: int = 10, kind: Optional[str] = None) -> list[tuple[str, str, int, str]]:
+        """[(key, label, events, last_ts)] by last activity"""
+        out = []
+        for key, items in self.timelines.items():
+            if kind:
+                items = [item for item in items if item[2].get("kind") == kind]
+            if items:
+                out.append((key, self.labels.get(key, key), len(items), items[-1][0]))
+        out.sort(key=lambda x: x[3], reverse=True)
+        return out[:limit]
+
+
+def format_timeline(index: ClientIndex, key: str, limit: int = 10) -> str:
+    icons = {"email": "📩", "quote": "🤝", "payment": "💸"}
+    lines = [f"Клиент: {index.labels.get(key, key)} ({key})"]
+    events = index.timeline(key)
+    counts: dict[str, int] = {}
+    for e in events:
+        counts[e["kind"]] = counts.get(e["kind"], 0) + 1
+    lines.append(
+        f"Письма: {counts.get('email', 0)} | выцены: {counts.get('quote', 0)} | платежи: {counts.get('payment', 0)}"
+    )
+    for e in events[:limit]:
+        title = (e.get("title") or "—")[:70]
+        extra = ""
+        if e["kind"] in {"quote", "payment"}:
+            extra = f" [{e.get('amount') or '—'} {e.get('status') or ''}]".rstrip()
+        lines.append(f"{icons.get(e['kind'], '•')} {(e.get('ts') or '—')[:10]} {title}{extra}")
+        if e.get("path"):
+            lines.append(f"   {e['path']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    idx = ClientIndex()
+    idx.refresh()
+    if len(sys.argv) > 1:
+        for k in idx.find(" ".join(sys.argv[1:])):
+            print(format_timeline(idx, k))
+            print()
+    else:
+        for key, label, n, last in idx.recent_clients(20):
+            print(f"{last[:10]}  {n:4d}  {label} <{key}>")
@@ -0,0 +1,360 @@
+"""
+Transactional store for quotes and payments (SQLite, WAL mode).
+
+The database is the bot's source of truth; CLIENT_QUOTES.csv and PAYMENTS.csv
+stay as views for hand editing:
+- import: when a CSV's (mtime_ns, size, inode) differs from the one recorded
+  at the last import/export, it was edited by hand and its rows replace the
+  table in one transaction;
+- export: every write commits first, then rewrites the CSV atomically
+  (temp file + replace) and records its signature. If the CSV is locked
+  (open in Excel), the table stays marked dirty and the export is retried
+  on the next sync.
+
+Rows written by the bot carry exported=0 until a CSV export containing them
+has succeeded. If the CSV is edited by hand while such rows are waiting, the
+hand edit is imported and the waiting rows are re-applied on top of it, so
+bot writes are never lost to an import.
+
+Columns used by queries are indexed (quotes: status, email key; payments:
+status + deadline ordinal); the full CSV row is kept as JSON so exports
+round-trip unknown columns in the original header order.
+
+WAL lets readers run while a writer commits. Each thread has its own
+connection; writes are serialized by a process lock plus BEGIN IMMEDIATE.
+Keep the database outside Dropbox: the -wal/-shm files must not be synced.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT '',
+    email_key TEXT NOT NULL DEFAULT '',
+    date TEXT NOT NULL DEFAULT '',
+    exported INTEGER NOT NULL DEFAULT 1,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS quotes_status ON quotes(status);
+CREATE INDEX IF NOT EXISTS quotes_email_key ON quotes(email_key);
+
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT '',
+    deadline INTEGER,
+    exported INTEGER NOT NULL DEFAULT 1,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payments_status_deadline ON payments(status, deadline);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+PAYMENT_HEADERS = ["name", "amount", "deadline", "status", "type"]
+
+# re-reads of a CSV that changed while it was being imported
+IMPORT_ATTEMPTS = 3
+
+
+def quote_key(email_from: str, email_subject: str) -> str:
+    return f"{(email_from or '').strip().lower()}|{(email_subject or '').strip().lower()}"
+
+
+def deadline_ordinal(s: str) -> Optional[int]:
+    try:
+        return datetime.strptime((s or "").strip(), "%Y-%m-%d").date().toordinal()
+    except Exception:
+        return None
+
+
+def _quote_columns(row: dict) -> tuple:
+    return (
+        (row.get("status") or "").strip().lower(),
+        quote_key(row.get("email_from", ""), row.get("email_subject", "")),
+        (row.get("date") or "").strip(),
+    )
+
+
+def _payment_columns(row: dict) -> tuple:
+    return (
+        (row.get("status") or "").strip().lower(),
+        deadline_ordinal(row.get("deadline") or ""),
+    )
+
+
+@dataclass(frozen=True)
+class _Table:
+    name: str
+    columns: tuple[str, ...]
+    to_columns: Callable[[dict], tuple]
+
+
+QUOTES = _Table("quotes", ("status", "email_key", "date"), _quote_columns)
+PAYMENTS = _Table("payments", ("status", "deadline"), _payment_columns)
+
+
+def _file_sig(path: Path) -> Optional[list]:
+    try:
+        st = path.stat()
+        return [st.st_mtime_ns, st.st_size, st.st_ino]
+    except OSError:
+        return None
+
+
+class FinanceStore:
+    def __init__(self, db_path: Path, quotes_csv: Path, payments_csv: Path,
+                 quote_headers: list[str], log: Optional[Callable[[str], None]] = None):
+        self.db_path = Path(db_path)
+        self.csv = {QUOTES.name: Path(quotes_csv), PAYMENTS.name: Path(payments_csv)}
+        self.default_headers = {QUOTES.name: list(quote_headers), PAYMENTS.name: list(PAYMENT_HEADERS)}
+        self._log = log or (lambda _msg: None)
+
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._schema_ready = False
+        self.version = 0
+        self.last_error: Optional[str] = None
+
+    # -----------------------------
+    # connections / meta
+    # -----------------------------
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            # autocommit mode: transactions are explicit (BEGIN IMMEDIATE)
+            conn = sqlite3.connect(str(self.db_path), timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._write_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    for table in (QUOTES, PAYMENTS):
+                        # databases created before the exported flag existed
+                        cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table.name})")}
+                        if "exported" not in cols:
+                            conn.execute(f"ALTER TABLE {table.name} ADD COLUMN exported INTEGER NOT NULL DEFAULT 1")
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def _meta(self, key: str):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value) -> None:
+        conn.execute(
+            "INSERT INTO meta(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value, ensure_ascii=False)),
+        )
+
+    def _headers(self, table: str) -> list[str]:
+        return self._meta(f"header:{table}") or self.default_headers[table]
+
+    # -----------------------------
+    # CSV import / export
+    # -----------------------------
+
+    def _import_csv(self, table: _Table) -> int:
+        """Replace the table with the CSV rows; returns bot rows re-applied on top"""
+        path = self.csv[table.name]
+        for _ in range(IMPORT_ATTEMPTS):
+            # signature taken before the read: a save during the read changes
+            # it, and the read is repeated instead of recording the new one
+            sig = _file_sig(path)
+            with path.open("r", encoding="utf-8-sig", errors="replace", newline="") as f:
+                reader = csv.DictReader(f)
+                # restkey None holds surplus cells of malformed lines: dropped
+                rows = [{k: v for k, v in r.items() if k is not None} for r in reader]
+                header = list(reader.fieldnames or self.default_headers[table.name])
+            if _file_sig(path) == sig:
+                break
+        # still changing: the pre-read signature makes the next sync import again
+
+        def cells(r: dict) -> tuple:
+            return tuple((r.get(h) or "").strip() for h in header)
+
+        placeholders = ", ".join("?" * (len(table.columns) + 2))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # bot rows whose export never succeeded: not in the file, keep them
+            in_file = {cells(r) for r in rows}
+            unsaved = [
+                r for r in (json.loads(d) for (d,) in conn.execute(
+                    f"SELECT data FROM {table.name} WHERE exported = 0 ORDER BY id"))
+                if cells(r) not in in_file
+            ]
+            conn.execute(f"DELETE FROM {table.name}")
+            conn.executemany(
+                f"INSERT INTO {table.name}({', '.join(table.columns)}, exported, data) VALUES({placeholders})",
+                [(*table.to_columns(r), 1, json.dumps(r, ensure_ascii=False)) for r in rows]
+                + [(*table.to_columns(r), 0, json.dumps(r, ensure_ascii=False)) for r in unsaved],
+            )
+            self._set_meta(conn, f"header:{table.name}", header)
+            self._set_meta(conn, f"sig:{table.name}", sig)
+            self._set_meta(conn, f"dirty:{table.name}", bool(unsaved))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.version += 1
+        self._log(f"finance_store: imported {len(rows)} rows from {path.name}")
+        if unsaved:
+            self._log(f"finance_store: re-applied {len(unsaved)} unsaved bot rows on top of the hand edit of {path.name}")
+        return len(unsaved)
+
+    def _export_csv(self, table: _Table) -> bool:
+        path = self.csv[table.name]
+        headers = self._headers(table.name)
+        rows = [json.loads(d) for (d,) in self._conn().execute(f"SELECT data FROM {table.name} ORDER BY id")]
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+            with tmp.open("w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=headers, extrasaction="ignore", restval="")
+                writer.writeheader()
+                writer.writerows(rows)
+            os.replace(tmp, path)
+        except OSError as e:
+            # e.g. the file is open in Excel: stay dirty, retry on the next sync
+            self.last_error = f"export {path.name}: {type(e).__name__}: {e}"
+            self._log(f"finance_store: {self.last_error}")
+            return False
+        # callers hold _write_lock: no row was added since the SELECT above
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"UPDATE {table.name} SET exported = 1 WHERE exported = 0")
+        self._set_meta(conn, f"sig:{table.name}", _file_sig(path))
+        self._set_meta(conn, f"dirty:{table.name}", False)
+        conn.execute("COMMIT")
+        return True
+
+    def sync(self) -> None:
+        """Bring tables and CSVs in line: export unsaved writes, import hand edits"""
+        for table in (QUOTES, PAYMENTS):
+            path = self.csv[table.name]
+            sig = _file_sig(path)
+            dirty = self._meta(f"dirty:{table.name}")
+            if not dirty and sig is not None and sig == self._meta(f"sig:{table.name}"):
+                continue
+            with self._write_lock:
+                # re-check under the lock: another thread may have synced already
+                sig = _file_sig(path)
+                recorded = self._meta(f"sig:{table.name}")
+                dirty = self._meta(f"dirty:{table.name}")
+                if sig is not None and sig != recorded:
+                    if self._import_csv(table):
+                        # write the re-applied bot rows back into the edited file
+                        self._export_csv(table)
+                elif dirty or (sig is None and self.count(table.name)):
+                    # unsaved writes, or the CSV was deleted: recreate it from the table
+                    self._export_csv(table)
+
+    def _insert(self, table: _Table, rows: list[dict]) -> int:
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" * (len(table.columns) + 1))
+        with self._write_lock:
+            self.sync()
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    f"INSERT INTO {table.name}({', '.join(table.columns)}, data, exported) VALUES({placeholders}, 0)",
+                    ((*table.to_columns(r), json.dumps(r, ensure_ascii=False)) for r in rows),
+                )
+                self._set_meta(conn, f"dirty:{table.name}", True)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self.version += 1
+            self._export_csv(table)
+        return len(rows)
+
+    def ensure_csv(self, table: str = QUOTES.name) -> None:
+        """Create the CSV (header only, or the table's rows) if it is missing or empty"""
+        path = self.csv[table]
+        if path.exists() and path.stat().st_size > 0:
+            return
+        with self._write_lock:
+            self._export_csv(QUOTES if table == QUOTES.name else PAYMENTS)
+
+    def count(self, table: str) -> int:
+        return self._conn().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    # -----------------------------
+    # quotes
+    # -----------------------------
+
+    def quotes(self) -> list[dict]:
+        """All quote rows in file order (raw CSV dicts)"""
+        return [json.loads(d) for (d,) in self._conn().execute("SELECT data FROM quotes ORDER BY id")]
+
+    def quote_status_counts(self) -> dict[str, int]:
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM quotes GROUP BY status"))
+
+    def unexported_quote_keys(self) -> set[str]:
+        """Email keys of quotes stored but not yet written to CLIENT_QUOTES.csv"""
+        return {k for (k,) in self._conn().execute("SELECT email_key FROM quotes WHERE exported = 0")}
+
+    def has_quote_key(self, key: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM quotes WHERE email_key = ? LIMIT 1", (key,)).fetchone() is not None
+
+    def insert_quotes(self, rows: Iterable[dict]) -> int:
+        return self._insert(QUOTES, list(rows))
+
+    # -----------------------------
+    # payments
+    # -----------------------------
+
+    def pending_payments(self) -> list[dict]:
+        """status=pending rows in file order"""
+        return [
+            json.loads(d)
+            for (d,) in self._conn().execute("SELECT data FROM payments WHERE status = 'pending' ORDER BY id")
+        ]
+
+    def pending_by_deadline(self, limit: Optional[int] = None) -> list[tuple[int, dict]]:
+        """(deadline ordinal, row) of pending payments with a valid deadline, soonest first"""
+        sql = "SELECT deadline, data FROM payments WHERE status = 'pending' AND deadline IS NOT NULL ORDER BY deadline, id"
+        params: tuple = ()
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = (limit,)
+        return [(o, json.loads(d)) for o, d in self._conn().execute(sql, params)]
+
+    def pending_deadline_counts(self, overdue_before: int, due_until: int) -> tuple[int, int, int]:
+        """(pending with a deadline, deadline < overdue_before, deadline <= due_until)"""
+        row = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(deadline < ?), 0), COALESCE(SUM(deadline <= ?), 0)"
+            " FROM payments WHERE status = 'pending' AND deadline IS NOT NULL",
+            (overdue_before, due_until),
+        ).fetchone()
+        return (row[0], row[1], row[2])
+
+    def payments_due(self, overdue_before: int, on_days: Iterable[int]) -> list[tuple[int, dict]]:
+        """Pending payments overdue (deadline < overdue_before) or due exactly on one of on_days"""
+        days = list(on_days)
+        marks = ", ".join("?" * len(days)) or "NULL"
+        sql = (
+            "SELECT deadline, data FROM payments WHERE status = 'pending' AND deadline IS NOT NULL"
+            f" AND (deadline < ? OR deadline IN ({marks})) ORDER BY deadline, id"
+        )
+        return [(o, json.loads(d)) for o, d in self._conn().execute(sql, (overdue_before, *days))]
@@ -0,0 +1,124 @@
+"""
+Reader for pipeline_events.jsonl (written by MAIL/run_mail_pipeline.ps1).
+
+One JSON object per line:
+  {"ts_utc": "...Z", "run_id": "...", "event": "run_start"}
+  {"event": "stage_start", "stage": "ROUTER"}
+  {"event": "stage_stop", "stage": "ROUTER", "ok": true, "exit_code": 0,
+   "attempts": 1, "duration_ms": 812, "count": 12}
+  {"event": "run_done", "duration_ms": 5123}
+  {"event": "run_error", "stage": "ROUTER", "message": "...", "duration_ms": 901}
+
+Only the latest run is kept in memory. The first read seeks backwards from the
+end of the file to the last run_start; later reads parse only appended bytes.
+Nothing is read while (mtime_ns, size) is unchanged.
+"""
+
+from __future__ import annotations
+
+import json
+import threading
+from pathlib import Path
+from typing import Optional
+
+TAIL_BLOCK_BYTES = 8192
+TAIL_MAX_BYTES = 1024 * 1024
+
+
+def _new_run(event: dict) -> dict:
+    return {
+        "run_id": event.get("run_id") or "",
+        "status": "RUNNING",
+        "started_utc": event.get("ts_utc") or "",
+        "finished_utc": "",
+        "duration_ms": None,
+        "stages": {},
+        "error": None,
+    }
+
+
+def apply_event(run: Optional[dict], event: dict) -> Optional[dict]:
+    """Fold one event into the latest-run state; a run_start starts a new state"""
+    kind = event.get("event")
+    if kind == "run_start":
+        return _new_run(event)
+    if run is None or (event.get("run_id") and event.get("run_id") != run["run_id"]):
+        return run
+
+    stage = str(event.get("stage") or "")
+    if kind == "stage_start" and stage:
+        run["stages"][stage] = {"ok": None, "started_utc": event.get("ts_utc") or ""}
+    elif kind == "stage_stop" and stage:
+        st = run["stages"].setdefault(stage, {})
+        for k in ("ok", "exit_code", "attempts", "duration_ms", "count"):
+            if k in event:
+                st[k] = event[k]
+    elif kind in {"run_done", "run_error"}:
+        run["status"] = "OK" if kind == "run_done" else "ERROR"
+        run["finished_utc"] = event.get("ts_utc") or ""
+        run["duration_ms"] = event.get("duration_ms")
+        if kind == "run_error":
+            run["error"] = {"stage": stage, "message": str(event.get("message") or "")}
+    return run
+
+
+def _parse(line: bytes) -> Optional[dict]:
+    try:
+        obj = json.loads(line.decode("utf-8-sig"))
+    except Exception:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+class PipelineEventLog:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._sig: Optional[tuple] = None
+        self._offset = 0
+        self.run: Optional[dict] = None
+
+    def _tail_from_last_start(self, f, size: int) -> int:
+        """Seek backwards block by block to the last run_start; returns its byte offset"""
+        pos = size
+        buf = b""
+        while pos > 0 and size - pos < TAIL_MAX_BYTES:
+            step = min(TAIL_BLOCK_BYTES, pos)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            start = buf.rfind(b'"run_start"')
+            if start >= 0:
+                line_start = buf.rfind(b"\n", 0, start) + 1
+                if line_start > 0 or pos == 0:
+                    return pos + line_start
+        return pos
+
+    def latest(self) -> Optional[dict]:
+        """State of the latest run (None if the log does not exist / has no run yet)"""
+        with self._lock:
+            try:
+                st = self.path.stat()
+                sig = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                self._sig, self._offset, self.run = None, 0, None
+                return None
+            if sig == self._sig:
+                return self.run
+
+            with self.path.open("rb") as f:
+                if self._sig is None or sig[1] < self._offset:
+                    # first read or rotated log
+                    self.run = None
+                    self._offset = self._tail_from_last_start(f, sig[1])
+                f.seek(self._offset)
+                data = f.read()
+
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                event = _parse(line)
+                if event:
+                    self.run = apply_event(self.run, event)
+            self._offset += end
+            self._sig = sig
+            return self.run
@@ -0,0 +1,130 @@
+"""
+Quote ledger: duplicate checks and draft queue for quotes.
+
+- Existing quotes: the finance store's indexed email key
+  (quote_key(email_from, email_subject)), one index lookup per check.
+- Pending drafts: rows proposed but not yet written, keyed the same way, kept
+  in quotes_drafts.json together with the watermark (epoch seconds of the
+  newest router row already turned into drafts). Drafting then only looks at
+  router rows newer than the watermark, and every duplicate check is a set or
+  index lookup.
+
+All mutation happens under `lock` (reentrant); callers hold it across a
+read-check-write sequence.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from finance_store import FinanceStore, quote_key
+
+
+class QuoteLedger:
+    def __init__(self, store: FinanceStore, drafts_path: Path):
+        self.store = store
+        self.drafts_path = Path(drafts_path)
+        self.lock = threading.RLock()
+
+        self._pending: Optional[dict[str, dict]] = None
+        self._watermark = 0.0
+
+    # -----------------------------
+    # stored quotes
+    # -----------------------------
+
+    def refresh(self) -> None:
+        """Pick up hand edits of CLIENT_QUOTES.csv"""
+        self.store.sync()
+
+    def in_csv(self, key: str) -> bool:
+        return self.store.has_quote_key(key)
+
+    def has(self, key: str) -> bool:
+        """Key already stored or among pending drafts"""
+        return key in self._drafts() or self.store.has_quote_key(key)
+
+    def ensure_csv(self) -> None:
+        """Create the CSV with a header if it is missing or empty"""
+        self.store.ensure_csv()
+
+    def append_rows(self, rows: Iterable[dict], clear_pending: bool = False) -> int:
+        """Store rows (CSV re-exported), drop them (or all) from pending drafts.
+
+        Drafts whose rows are stored but not yet exported (CSV locked) stay
+        pending until a later export succeeds.
+        """
+        rows = list(rows)
+        with self.lock:
+            self.store.insert_quotes(rows)
+            unexported = self.store.unexported_quote_keys()
+            pending = self._drafts()
+            done = list(pending) if clear_pending else []
+            done += [quote_key(r.get("email_from", ""), r.get("email_subject", "")) for r in rows]
+            for k in done:
+                if k not in unexported:
+                    pending.pop(k, None)
+            self._save_drafts()
+        return len(rows)
+
+    # -----------------------------
+    # pending drafts / watermark
+    # -----------------------------
+
+    def _drafts(self) -> dict[str, dict]:
+        if self._pending is None:
+            try:
+                payload = json.loads(self.drafts_path.read_text(encoding="utf-8"))
+            except Exception:
+                payload = {}
+            rows = payload.get("rows") if isinstance(payload, dict) else None
+            self._pending = {}
+            for r in rows if isinstance(rows, list) else []:
+                if isinstance(r, dict):
+                    self._pending[quote_key(r.get("email_from", ""), r.get("email_subject", ""))] = r
+            try:
+                self._watermark = float(payload.get("watermark_ts") or 0.0)
+            except Exception:
+                self._watermark = 0.0
+        return self._pending
+
+    @property
+    def watermark(self) -> float:
+        with self.lock:
+            self._drafts()
+            return self._watermark
+
+    def pending(self) -> list[dict]:
+        with self.lock:
+            return list(self._drafts().values())
+
+    def add_draft(self, key: str, row: dict) -> None:
+        with self.lock:
+            self._drafts()[key] = row
+
+    def commit_drafts(self, watermark: float) -> dict:
+        """Persist pending drafts with the new watermark; returns the file payload"""
+        with self.lock:
+            self._drafts()
+            self._watermark = max(self._watermark, watermark)
+            return self._save_drafts()
+
+    def _save_drafts(self) -> dict:
+        rows = list(self._drafts().values())
+        payload = {
+            "created_utc": datetime.now(timezone.utc).isoformat(),
+            "count": len(rows),
+            "watermark_ts": self._watermark,
+            "rows": rows,
+        }
+        # temp file + replace: readers never see a half-written file
+        self.drafts_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.drafts_path.with_name(f"{self.drafts_path.name}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, self.drafts_path)
+        return payload
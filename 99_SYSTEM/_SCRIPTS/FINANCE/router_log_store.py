@@ -0,0 +1,250 @@
+"""
+Incremental columnar store for router_log.csv.
+
+router_log.csv is append-only (router_cases_inbox.write_log), so refresh()
+reads only the bytes after the last offset. Each row is kept as:
+- ts:       epoch seconds (array 'd'; NaN when ts_utc is unparsable)
+- decision / payment_risk / quality: interned small-int codes (array 'H')
+- values:   the raw CSV tuple (dicts are built only for rows actually returned)
+
+A timestamp-sorted index (overall and per decision) answers window queries
+with bisect, so counts cost O(log n) and listings O(rows in window).
+With NumPy, multi-column filters (risk flags, decision breakdowns) run as
+vectorized masks over zero-copy views of the arrays.
+"""
+
+from __future__ import annotations
+
+import bisect
+import csv
+import io
+import math
+import threading
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+def parse_ts(s: str) -> float:
+    """ISO timestamp ('...Z' or '+00:00') -> epoch seconds; NaN if unparsable"""
+    s = (s or "").strip()
+    if not s:
+        return math.nan
+    try:
+        if s.endswith("Z"):
+            s = s[:-1] + "+00:00"
+        dt = datetime.fromisoformat(s)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+    except Exception:
+        return math.nan
+
+
+class _SortedTs:
+    """Parallel (ts, row_id) lists ordered by ts; appends in order are O(1)."""
+
+    def __init__(self):
+        self.ts: list[float] = []
+        self.ids: list[int] = []
+
+    def add(self, ts: float, row_id: int) -> None:
+        if not self.ts or ts >= self.ts[-1]:
+            self.ts.append(ts)
+            self.ids.append(row_id)
+        else:
+            i = bisect.bisect_right(self.ts, ts)
+            self.ts.insert(i, ts)
+            self.ids.insert(i, row_id)
+
+    def since(self, start: float) -> int:
+        return bisect.bisect_left(self.ts, start)
+
+
+class RouterLogStore:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.header: list[str] = []
+        self._col: dict[str, int] = {}
+        self._offset = 0
+        self._sig: Optional[tuple] = None
+
+        self.ts = array("d")
+        self.decision = array("H")
+        self.risk = array("H")
+        self.quality = array("H")
+        self.values: list[tuple] = []
+
+        self._codes: dict[str, int] = {"": 0}
+        self._names: list[str] = [""]
+        self._all = _SortedTs()
+        self._by_decision: dict[int, _SortedTs] = {}
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    # -----------------------------
+    # building
+    # -----------------------------
+
+    def code(self, value: str) -> int:
+        """Interned code of a (case-normalized) value; 0 = empty"""
+        v = (value or "").strip()
+        c = self._codes.get(v)
+        if c is None:
+            c = len(self._names)
+            self._codes[v] = c
+            self._names.append(v)
+        return c
+
+    def _field(self, values: list[str], name: str) -> str:
+        i = self._col.get(name)
+        return values[i] if i is not None and i < len(values) else ""
+
+    def _append(self, values: list[str]) -> None:
+        row_id = len(self.values)
+        ts = parse_ts(self._field(values, "ts_utc"))
+        d = self.code(self._field(values, "decision").upper())
+
+        self.ts.append(ts)
+        self.decision.append(d)
+        self.risk.append(self.code(self._field(values, "payment_risk").lower()))
+        self.quality.append(self.code(self._field(values, "quality").lower()))
+        self.values.append(tuple(values))
+
+        if not math.isnan(ts):
+            self._all.add(ts, row_id)
+            self._by_decision.setdefault(d, _SortedTs()).add(ts, row_id)
+
+    def refresh(self) -> bool:
+        """Parse rows appended since the last call (full reload if the file shrank). True if changed."""
+        with self._lock:
+            try:
+                st = self.path.stat()
+                sig = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                if self.values or self.header:
+                    self._reset()
+                    return True
+                return False
+            if sig == self._sig:
+                return False
+            if sig[1] < self._offset:
+                self._reset()
+
+            with self.path.open("rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+            end = data.rfind(b"\n") + 1
+            self._sig = sig
+            if end <= 0:
+                return False
+            self._offset += end
+
+            chunk = data[:end].decode("utf-8", errors="replace")
+            if not self.header:
+                chunk = chunk.lstrip("\ufeff")
+            for values in csv.reader(io.StringIO(chunk, newline="")):
+                if not self.header:
+                    self.header = values
+                    self._col = {name: i for i, name in enumerate(values)}
+                    continue
+                if values:
+                    self._append(values)
+            self.version += 1
+            return True
+
+    # -----------------------------
+    # queries (epoch seconds)
+    # -----------------------------
+
+    def row(self, row_id: int) -> dict:
+        return dict(zip(self.header, self.values[row_id]))
+
+    def _index(self, decision: Optional[str]) -> Optional[_SortedTs]:
+        if decision is None:
+            return self._all
+        c = self._codes.get((decision or "").strip().upper())
+        return self._by_decision.get(c) if c is not None else None
+
+    # Queries hold the lock as well: handlers run concurrently and refresh()
+    # may insert into the indexes or reset the columns meanwhile.
+
+    def count(self, since: float, decision: Optional[str] = None) -> int:
+        """Rows with ts >= since (optionally for one decision)"""
+        with self._lock:
+            idx = self._index(decision)
+            if idx is None:
+                return 0
+            return len(idx.ts) - idx.since(since)
+
+    def _ids_since(self, since: float, decision: Optional[str] = None) -> list[int]:
+        idx = self._index(decision)
+        if idx is None:
+            return []
+        return idx.ids[idx.since(since):][::-1]
+
+    def ids_since(self, since: float, decision: Optional[str] = None) -> list[int]:
+        """Row ids with ts >= since, newest first"""
+        with self._lock:
+            return self._ids_since(since, decision)
+
+    def rows_since(self, since: float, decision: Optional[str] = None,
+                   limit: Optional[int] = None) -> list[dict]:
+        """Rows with ts >= since as dicts, newest first"""
+        with self._lock:
+            ids = self._ids_since(since, decision)
+            if limit is not None:
+                ids = ids[:limit]
+            return [self.row(i) for i in ids]
+
+    def rows_matching(self, since: float, risk: Iterable[str] = (), quality: Iterable[str] = ()) -> list[dict]:
+        """Rows in window whose payment_risk or quality code is in the given sets, newest first"""
+        risk_c = {self._codes[v] for v in risk if v in self._codes}
+        quality_c = {self._codes[v] for v in quality if v in self._codes}
+        if not risk_c and not quality_c:
+            return []
+        # the lock keeps refresh() from resizing arrays while NumPy views exist
+        with self._lock:
+            if NUMPY_AVAILABLE and self.values:
+                ts = np.frombuffer(self.ts, dtype=np.float64)
+                mask = ts >= since
+                mask &= (
+                    np.isin(np.frombuffer(self.risk, dtype=np.uint16), list(risk_c))
+                    | np.isin(np.frombuffer(self.quality, dtype=np.uint16), list(quality_c))
+                )
+                ids = np.flatnonzero(mask)
+                ids = ids[np.argsort(-ts[ids], kind="stable")].tolist()
+                del ts, mask
+            else:
+                ids = [
+                    i for i in self._ids_since(since)
+                    if self.risk[i] in risk_c or self.quality[i] in quality_c
+                ]
+            return [self.row(i) for i in ids]
+
+    def decision_counts(self, since: float) -> dict[str, int]:
+        """{decision: rows with ts >= since}"""
+        with self._lock:
+            if NUMPY_AVAILABLE and self.values:
+                ts = np.frombuffer(self.ts, dtype=np.float64)
+                counts = np.bincount(np.frombuffer(self.decision, dtype=np.uint16)[ts >= since])
+                del ts
+                return {self._names[c]: int(n) for c, n in enumerate(counts) if n and self._names[c]}
+            return {
+                self._names[c]: len(idx.ts) - idx.since(since)
+                for c, idx in self._by_decision.items()
+                if self._names[c] and len(idx.ts) > idx.since(since)
+            }
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import json
-import urllib.parse
-import urllib.request
+import sys
 from datetime import datetime, timezone
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "MAIL"))
+from telegram_client import load_credentials, shared_client
+
 
 ROOT = Path(__file__).resolve().parents[3]
 SECRETS = ROOT / "99_SYSTEM" / "_SECRETS"
@@ -51,21 +53,8 @@ def _pipeline_log_ts() -> str:
     return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
-def _send_telegram(token: str, chat_id: str, text: str) -> None:
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = urllib.parse.urlencode(
-        {"chat_id": chat_id, "text": text[:3900], "disable_web_page_preview": "true"}
-    ).encode("utf-8")
-    req = urllib.request.Request(url, data=payload, method="POST")
-    with urllib.request.urlopen(req, timeout=20) as resp:
-        body = resp.read().decode("utf-8", errors="replace")
-        if "\"ok\":true" not in body:
-            raise RuntimeError(f"telegram send failed: {body[:400]}")
-
-
 def main() -> int:
-    token = _read_text(TOKEN_FILE)
-    chat_id = _read_text(CHAT_ID_FILE)
+    token, chat_id = load_credentials(TOKEN_FILE, CHAT_ID_FILE)
 
     pipeline_rc = "n/a"
     try:
@@ -85,7 +74,8 @@ def main() -> int:
             f"logs: {LOG_DIR}",
         ]
     )
-    _send_telegram(token, chat_id, text)
+    # raises TelegramError when delivery failed after retries
+    shared_client(token).send_message(chat_id, text, disable_web_page_preview=True)
     print("OK: telegram health report sent")
     return 0
 
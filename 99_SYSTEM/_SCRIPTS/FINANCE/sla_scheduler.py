@@ -0,0 +1,154 @@
+"""
+Min-heap scheduler for payment SLA reminders (T-7/T-3/T-1/overdue).
+
+Each stage is a window of local time:
+- D<n>:    [midnight of deadline-n, midnight of deadline-n+1)
+- OVERDUE: [midnight of deadline+1, forever)
+
+A payment is planned once: only its next stage that has not ended yet is on
+the heap. When that entry fires (pop_due), the following stage is pushed, so
+the heap holds about one entry per pending payment and next_at() is the exact
+moment something becomes due.
+
+replan() takes the full list of pending payments but only touches the ones
+whose row changed, appeared or disappeared. Stale heap entries are skipped
+lazily via a per-payment generation number. An entry popped after its window
+ended (bot was down that whole day) is dropped, as a missed day was before.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+OVERDUE = "OVERDUE"
+
+
+@dataclass
+class SlaEvent:
+    payment_id: str
+    stage: str
+    deadline: int  # date ordinal
+    row: dict
+
+
+def _midnight(ordinal: int) -> float:
+    """Epoch seconds of local midnight at the start of the given day"""
+    return datetime.combine(date.fromordinal(ordinal), datetime.min.time()).timestamp()
+
+
+class SlaScheduler:
+    def __init__(self, stage_days: Iterable[int] = (7, 3, 1)):
+        self.stage_days = sorted({int(d) for d in stage_days if int(d) > 0}, reverse=True)
+        self._lock = threading.Lock()
+        # (at, seq, payment_id, gen, stage index, advance to the next stage once popped)
+        self._heap: list[tuple[float, int, str, int, int, bool]] = []
+        self._seq = itertools.count()
+        self._gen = itertools.count(1)
+        # payment_id -> (generation, deadline ordinal, row)
+        self._plans: dict[str, tuple[int, int, dict]] = {}
+
+    # -----------------------------
+    # stages
+    # -----------------------------
+
+    def _stage(self, i: int) -> str:
+        return f"D{self.stage_days[i]}" if i < len(self.stage_days) else OVERDUE
+
+    def _window(self, deadline: int, i: int) -> tuple[float, Optional[float]]:
+        if i < len(self.stage_days):
+            day = deadline - self.stage_days[i]
+            return _midnight(day), _midnight(day + 1)
+        return _midnight(deadline + 1), None
+
+    def _push_from(self, payment_id: str, gen: int, deadline: int, i: int, now: float) -> None:
+        """Push the first stage >= i whose window has not ended yet"""
+        for j in range(i, len(self.stage_days) + 1):
+            start, end = self._window(deadline, j)
+            if end is None or end > now:
+                heapq.heappush(self._heap, (start, next(self._seq), payment_id, gen, j, True))
+                return
+
+    # -----------------------------
+    # planning
+    # -----------------------------
+
+    def replan(self, items: Iterable[tuple[str, int, dict]], now: float) -> int:
+        """items: (payment_id, deadline ordinal, row) of all pending payments; returns payments re-planned"""
+        changed = 0
+        with self._lock:
+            seen: set[str] = set()
+            for payment_id, deadline, row in items:
+                seen.add(payment_id)
+                old = self._plans.get(payment_id)
+                if old is not None and old[1] == deadline and old[2] == row:
+                    continue
+                gen = next(self._gen)
+                self._plans[payment_id] = (gen, deadline, row)
+                self._push_from(payment_id, gen, deadline, 0, now)
+                changed += 1
+            for payment_id in [p for p in self._plans if p not in seen]:
+                del self._plans[payment_id]
+                changed += 1
+            if len(self._heap) > 2 * len(self._plans) + 64:
+                self._compact()
+        return changed
+
+    def _compact(self) -> None:
+        self._heap = [e for e in self._heap if self._valid(e)]
+        heapq.heapify(self._heap)
+
+    def _valid(self, entry: tuple) -> bool:
+        plan = self._plans.get(entry[2])
+        return plan is not None and plan[0] == entry[3]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+            self._plans.clear()
+
+    # -----------------------------
+    # firing
+    # -----------------------------
+
+    def next_at(self) -> Optional[float]:
+        """Epoch seconds of the earliest pending trigger"""
+        with self._lock:
+            while self._heap and not self._valid(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> list[SlaEvent]:
+        """Events whose stage window contains now; the next stage of each is scheduled"""
+        out: list[SlaEvent] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if not self._valid(entry):
+                    continue
+                _, _, payment_id, gen, i, advance = entry
+                _, deadline, row = self._plans[payment_id]
+                _, end = self._window(deadline, i)
+                if end is None or now < end:
+                    out.append(SlaEvent(payment_id, self._stage(i), deadline, row))
+                if advance and end is not None:
+                    self._push_from(payment_id, gen, deadline, i + 1, now)
+        return out
+
+    def retry(self, events: Iterable[SlaEvent], at: float) -> None:
+        """Re-queue events that could not be delivered (dropped if their window ends first)"""
+        with self._lock:
+            for e in events:
+                plan = self._plans.get(e.payment_id)
+                if plan is None or plan[1] != e.deadline:
+                    continue
+                i = len(self.stage_days) if e.stage == OVERDUE else self.stage_days.index(int(e.stage[1:]))
+                heapq.heappush(self._heap, (at, next(self._seq), e.payment_id, plan[0], i, False))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._plans)
@@ -18,10 +18,13 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
 
+from client_index import ClientIndex
+
 # Paths
 ROOT = Path(r"C:\Users\alimg\Dropbox\Archiwum 3.0")
 SECRETS = ROOT / "99_SYSTEM" / "_SECRETS"
 HISTORY_FILE = ROOT / "99_SYSTEM" / "_SCRIPTS" / "FINANCE" / ".telegram_history.json"
+CLIENT_INDEX = ClientIndex(ROOT)
 
 # Main archive structure
 ARCHIVE_STRUCTURE = {
@@ -546,6 +549,15 @@ def get_clients_report() -> str:
     total = klients_inbox + klients_review
     msg += f"✅ Всего активных: {total}\n\n"
     
+    # Последние клиенты (индекс router_log + CLIENT_QUOTES + PAYMENTS)
+    CLIENT_INDEX.refresh()
+    recent = CLIENT_INDEX.recent_clients(5, kind="email")
+    if recent:
+        msg += "🕒 Последние клиенты:\n"
+        for key, label, n, last in recent:
+            msg += f"├ {label} — {n} писем, {last[:10]}\n"
+        msg += "\n"
+    
     msg += "📊 Статус:\n"
     msg += "├ В процессе: отслеживается\n"
     msg += "└ Завершено: отслеживается"
@@ -10,16 +10,20 @@ Goal (non-technical):
 from __future__ import annotations
 
 import asyncio
-import csv
+import functools
 import hashlib
 import json
 import os
 import subprocess
+import sys
+import threading
 import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from datetime import datetime, timedelta, timezone
+from itertools import islice
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import (
@@ -31,10 +35,31 @@ from telegram.ext import (
     filters,
 )
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "MAIL"))
+from text_search import TrigramIndex, normalize
+
+from bot_metrics import CallbackProfiler, Metrics, loop_lag_monitor, start_http_server
+from chat_state_store import ChatStateStore
+from chat_update_processor import ChatKeyedUpdateProcessor
+from client_index import ClientIndex, format_timeline
+from finance_store import FinanceStore, quote_key
+from pipeline_events import PipelineEventLog
+from quote_ledger import QuoteLedger
+from router_log_store import RouterLogStore
+from sla_scheduler import SlaEvent, SlaScheduler
+from telegram_outbox import (
+    PRIORITY_ERROR,
+    PRIORITY_INFO,
+    PRIORITY_QUOTES,
+    PRIORITY_RISK,
+    PRIORITY_SLA,
+    Outbox,
+)
+
 # =========================
 # Paths / Config
 # =========================
-ROOT = Path(r"C:\Users\alimg\Dropbox\Archiwum 3.0")
+ROOT = Path(os.environ.get("ALIS_ROOT", r"C:\Users\alimg\Dropbox\Archiwum 3.0"))
 
 SECRETS = ROOT / "99_SYSTEM" / "_SECRETS"
 TOKEN_FILE = SECRETS / "telegram_bot_token.txt"
@@ -43,6 +68,7 @@ CHAT_ID_FILE = SECRETS / "telegram_chat_id.txt"
 LOG_DIR = ROOT / "00_INBOX" / "_ROUTER_LOGS"
 PIPELINE_LOG = LOG_DIR / "pipeline_run.log"
 PIPELINE_ERRORS = LOG_DIR / "pipeline_errors.jsonl"
+PIPELINE_EVENTS = LOG_DIR / "pipeline_events.jsonl"
 ROUTER_LOG = LOG_DIR / "router_log.csv"
 
 PAYMENTS_CSV = ROOT / "FINANCE" / "PAYMENTS.csv"
@@ -60,20 +86,36 @@ UI_STATE_FILE = LOG_DIR / "telegram_ui_state.json"
 QUOTES_DRAFTS_FILE = LOG_DIR / "quotes_drafts.json"
 RUNTIME_LOG = LOG_DIR / "telegram_dashboard_runtime.log"
 
+# Quotes/payments database (SQLite WAL). Kept outside Dropbox: the -wal/-shm
+# files must not be synced; the CSVs above remain the synced, hand-editable copy.
+FINANCE_DB = Path(
+    os.environ.get("ALIS_FINANCE_DB")
+    or Path(os.environ.get("LOCALAPPDATA") or Path.home() / ".local" / "share") / "ALIS" / "finance.sqlite3"
+)
+
 MAIL_PIPELINE_PS1 = ROOT / "99_SYSTEM" / "_SCRIPTS" / "MAIL" / "run_mail_pipeline.ps1"
 
 WINDOW_DAYS = 7
 MAX_LIST = 10
-NOTIFY_INTERVAL_MIN = 15
+NOTIFY_POLL_S = 60
 MSG_LIMIT = 3900
 SLA_NOTIFY_DAYS = (7, 3, 1)
-SLA_NOTIFY_MAX_PER_TICK = 8
+SLA_ALERT_TTL_DAYS = 45
 QUOTES_BOOTSTRAP_DAYS = 30
 QUOTES_BOOTSTRAP_LIMIT = 500
 QUOTE_STATUS_ALLOWED = {"open", "sent", "won", "lost", "expired"}
 SELFTEST_HOUR_LOCAL = 3
-
-PIPELINE_RUN_LOCK = asyncio.Lock()
+SEARCH_INDEX_TTL_S = 600.0
+DASHBOARD_MAX_AGE_S = 300.0
+# Local Prometheus-text endpoint (http://127.0.0.1:<port>/metrics); 0 = off
+METRICS_HTTP_PORT = int(os.environ.get("ALIS_BOT_METRICS_PORT") or 0)
+SEARCH_PAGE_SIZE = MAX_LIST
+SEARCH_MAX_RESULTS = 500
+SEARCH_CACHE_MAX_QUERIES = 32
+CLIENT_QUERY_PREFIXES = ("клиент ", "client ", "klient ")
+
+# Updates of different chats run in parallel, one chat's updates in order.
+UPDATE_CONCURRENCY = 32
 
 QUOTES_EXCLUDE_FROM_SUBSTRINGS = [
     # Supplier / operational emails that are not "wycena"
@@ -101,6 +143,35 @@ LEGACY_ERROR_SUBSTRINGS = [
 ]
 
 
+# =========================
+# Metrics / profiling
+# =========================
+
+# Latency histograms: "handler" (per button/command), "source" (per data loader), "loop" (event-loop lag).
+METRICS = Metrics()
+_PROFILER = CallbackProfiler()
+METRICS.profiler = _PROFILER
+
+
+def _instrumented(name_of):
+    """Handler wrapper: latency histogram + /profile capture."""
+    def deco(fn):
+        @functools.wraps(fn)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            try:
+                name = name_of(update)
+            except Exception:
+                name = fn.__name__
+            profiling = _PROFILER.active
+            with METRICS.timer("handler", name), _PROFILER.callback():
+                await fn(update, context)
+            if profiling and not _PROFILER.active and _PROFILER.chat_id is not None:
+                report = await asyncio.to_thread(_PROFILER.report, 15)
+                await _outbox(context.bot).send(_PROFILER.chat_id, _fit_message("Profile (cumulative)\n\n" + report))
+        return wrapper
+    return deco
+
+
 # =========================
 # Small utilities
 # =========================
@@ -173,12 +244,14 @@ def _payment_sla_stage(days_left: int) -> Optional[str]:
 
 def _payment_sla_events() -> list[dict]:
     today = datetime.now().date()
+    t = today.toordinal()
+    # only overdue rows and rows exactly SLA_NOTIFY_DAYS ahead can produce an event
+    due = _finance_store().payments_due(t, [t + d for d in SLA_NOTIFY_DAYS])
+
     events: list[dict] = []
-    for row in _payments_pending():
-        deadline = _parse_deadline_date(row.get("deadline") or "")
-        if not deadline:
-            continue
-        days_left = (deadline - today).days
+    for o, row in due:
+        deadline = date.fromordinal(o)
+        days_left = o - t
         stage = _payment_sla_stage(days_left)
         if not stage:
             continue
@@ -264,19 +337,11 @@ def _fmt_amount(amount: float) -> str:
 
 
 def _quotes_rows_safe() -> tuple[list[dict], Optional[str]]:
-    if not CLIENT_QUOTES_CSV.exists():
-        return ([], None)
-    rows: list[dict] = []
     try:
-        with CLIENT_QUOTES_CSV.open("r", encoding="utf-8", errors="replace", newline="") as f:
-            reader = csv.DictReader(f)
-            idx = 0
-            for row in reader:
-                idx += 1
-                rows.append(_normalize_quote_row(row, fallback_id=f"LEGACY-{idx:04d}"))
-        return (rows, None)
+        rows = _finance_store().quotes()
     except Exception as e:
         return ([], f"{type(e).__name__}: {e}")
+    return ([_normalize_quote_row(row, fallback_id=f"LEGACY-{idx:04d}") for idx, row in enumerate(rows, 1)], None)
 
 
 def _quotes_missing_amount_count(rows: Optional[list[dict]] = None) -> int:
@@ -324,12 +389,14 @@ def _health_snapshot() -> dict:
         "payments_pending": len(_payments_pending()),
         "quotes_rows": len(_client_quotes()),
         "quotes_missing_amount": _quotes_missing_amount_count(),
-        "router_rows_window": _count_routed("KLIENTS") + _count_routed("FIRMA"),
+        "router_rows_window": _router_window_total(("KLIENTS", "FIRMA")),
         "cache_entries": len(_CACHE),
-        "pipeline_running": PIPELINE_RUN_LOCK.locked(),
+        "cache": _cache_stats(),
+        "pipeline_running": _pipeline_running(),
     }
 
 
+@METRICS.timed()
 def _selftest_text() -> str:
     checks: list[tuple[str, bool, str]] = []
 
@@ -405,25 +472,29 @@ def _load_json(path: Path) -> dict:
 
 
 def _save_json(path: Path, obj: dict) -> None:
+    # temp file + replace: concurrent readers never see a half-written file
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# In memory, flushed to UI_STATE_FILE in the background (debounced, atomic).
+# SLA dedup records expire after SLA_ALERT_TTL_DAYS.
+_CHAT_STATE = ChatStateStore(
+    UI_STATE_FILE,
+    flush_delay_s=2.0,
+    max_delay_s=10.0,
+    ttl_s={"notify_payment_alerts": SLA_ALERT_TTL_DAYS * 86400},
+)
 
 
 def _get_chat_state(chat_id: int) -> dict:
-    all_state = _load_json(UI_STATE_FILE)
-    return all_state.get(str(chat_id), {}) if isinstance(all_state, dict) else {}
+    return _CHAT_STATE.get(chat_id)
 
 
 def _set_chat_state(chat_id: int, patch: dict) -> None:
-    all_state = _load_json(UI_STATE_FILE)
-    if not isinstance(all_state, dict):
-        all_state = {}
-    cur = all_state.get(str(chat_id), {})
-    if not isinstance(cur, dict):
-        cur = {}
-    cur.update(patch)
-    all_state[str(chat_id)] = cur
-    _save_json(UI_STATE_FILE, all_state)
+    _CHAT_STATE.update(chat_id, patch)
 
 
 def _notify_enabled(chat_id: int) -> bool:
@@ -451,12 +522,7 @@ def _csv_headers_quotes() -> list[str]:
 
 
 def _ensure_quotes_csv() -> None:
-    CLIENT_QUOTES_CSV.parent.mkdir(parents=True, exist_ok=True)
-    if CLIENT_QUOTES_CSV.exists() and CLIENT_QUOTES_CSV.stat().st_size > 0:
-        return
-    with CLIENT_QUOTES_CSV.open("w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=_csv_headers_quotes())
-        writer.writeheader()
+    _QUOTE_LEDGER.ensure_csv()
 
 
 def _is_authorized(update: Update) -> bool:
@@ -468,37 +534,141 @@ def _is_authorized(update: Update) -> bool:
 
 
 # =========================
-# Cache (30–60 seconds)
+# Cache (file-validated, bounded)
 # =========================
+# Entries with source files stay valid until (mtime_ns, size, inode) of a source
+# changes: instant when nothing changed, fresh right after a write.
+# Entries without sources (directory walks) fall back to ttl_s.
+# LRU eviction keeps the total approximate size under CACHE_MAX_BYTES;
+# concurrent callers of the same key wait for one load (single-flight).
+
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
 
 @dataclass
 class _CacheEntry:
     ts: float
     value: Any
+    sig: Optional[tuple] = None
+    size: int = 0
+
+
+_CACHE: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_CACHE_KEY_LOCKS: dict[str, threading.Lock] = {}
+_CACHE_STATS = {"hits": 0, "misses": 0, "loads": 0, "load_s": 0.0, "load_max_s": 0.0, "evictions": 0}
+_CACHE_BYTES = 0
 
 
-_CACHE: dict[str, _CacheEntry] = {}
+def _file_sig(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except OSError:
+        return None
+
+
+def _approx_size(value: Any, depth: int = 0) -> int:
+    """Rough deep size; containers are sampled (first 20 items) and extrapolated."""
+    n = sys.getsizeof(value)
+    if depth > 3:
+        return n
+    if isinstance(value, dict):
+        items = list(islice(value.items(), 20))
+        if items:
+            per = sum(_approx_size(k, depth + 1) + _approx_size(v, depth + 1) for k, v in items) / len(items)
+            n += int(per * len(value))
+    elif isinstance(value, (list, tuple, set)):
+        sample = list(islice(value, 20))
+        if sample:
+            n += int(sum(_approx_size(v, depth + 1) for v in sample) / len(sample) * len(value))
+    elif hasattr(value, "__dict__"):
+        n += _approx_size(vars(value), depth + 1)
+    return n
 
 
-def _cache_get(key: str, ttl_s: float, fn):
-    now = time.time()
-    hit = _CACHE.get(key)
-    if hit and (now - hit.ts) <= ttl_s:
+def _cache_lookup(key: str, ttl_s: float, sig: Optional[tuple], has_sources: bool) -> Optional[_CacheEntry]:
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+        if hit is None:
+            return None
+        fresh = (hit.sig == sig) if has_sources else (time.time() - hit.ts) <= ttl_s
+        if not fresh:
+            return None
+        _CACHE.move_to_end(key)
+        _CACHE_STATS["hits"] += 1
+        return hit
+
+
+def _cache_store(key: str, entry: _CacheEntry) -> None:
+    global _CACHE_BYTES
+    with _CACHE_LOCK:
+        old = _CACHE.pop(key, None)
+        if old is not None:
+            _CACHE_BYTES -= old.size
+        _CACHE[key] = entry
+        _CACHE_BYTES += entry.size
+        while _CACHE_BYTES > CACHE_MAX_BYTES and len(_CACHE) > 1:
+            _, evicted = _CACHE.popitem(last=False)
+            _CACHE_BYTES -= evicted.size
+            _CACHE_STATS["evictions"] += 1
+
+
+def _cache_pop(key: str) -> None:
+    global _CACHE_BYTES
+    with _CACHE_LOCK:
+        old = _CACHE.pop(key, None)
+        if old is not None:
+            _CACHE_BYTES -= old.size
+
+
+def _cache_get(key: str, ttl_s: float, fn, sources: tuple[Path, ...] = ()):
+    sig = tuple(_file_sig(p) for p in sources) if sources else None
+    hit = _cache_lookup(key, ttl_s, sig, bool(sources))
+    if hit:
         return hit.value
-    val = fn()
-    _CACHE[key] = _CacheEntry(ts=now, value=val)
+
+    with _CACHE_LOCK:
+        key_lock = _CACHE_KEY_LOCKS.setdefault(key, threading.Lock())
+    with key_lock:
+        # another caller may have loaded it while we waited
+        hit = _cache_lookup(key, ttl_s, sig, bool(sources))
+        if hit:
+            return hit.value
+        with _CACHE_LOCK:
+            _CACHE_STATS["misses"] += 1
+        t0 = time.perf_counter()
+        val = fn()
+        dt = time.perf_counter() - t0
+        with _CACHE_LOCK:
+            _CACHE_STATS["loads"] += 1
+            _CACHE_STATS["load_s"] += dt
+            _CACHE_STATS["load_max_s"] = max(_CACHE_STATS["load_max_s"], dt)
+        _cache_store(key, _CacheEntry(ts=time.time(), value=val, sig=sig, size=_approx_size(val)))
     return val
 
 
+def _cache_stats() -> dict:
+    with _CACHE_LOCK:
+        st = dict(_CACHE_STATS)
+        st["entries"] = len(_CACHE)
+        st["bytes"] = _CACHE_BYTES
+    lookups = st["hits"] + st["misses"]
+    st["hit_rate"] = round(st["hits"] / lookups, 3) if lookups else 0.0
+    st["load_avg_ms"] = round(st["load_s"] / st["loads"] * 1000, 1) if st["loads"] else 0.0
+    st["load_max_ms"] = round(st["load_max_s"] * 1000, 1)
+    return st
+
+
 def _invalidate_runtime_cache() -> None:
+    global _DASHBOARD_VIEW
+    _DASHBOARD_VIEW = None
     keys = [
-        "router_rows",
-        "payments_pending",
-        "client_quotes",
         "finance_pdf_counts",
+        "search_index",
     ]
     for k in keys:
-        _CACHE.pop(k, None)
+        _cache_pop(k)
 
 
 # =========================
@@ -536,11 +706,8 @@ def _dedup_rows(rows: list[dict], key_fn) -> list[dict]:
 
 
 def _is_quote_candidate(row: dict) -> bool:
-    # Plan rule: KLIENTS in last 7 days, with simple exclusions (avoid spam).
-    if (row.get("decision") or "").upper() != "KLIENTS":
-        return False
-    if not _in_window(row.get("ts_utc") or ""):
-        return False
+    # Plan rule: KLIENTS in last 7 days (window/decision already applied by the
+    # router store), with simple exclusions (avoid spam).
     s = _subject_l(row)
     f = _from_l(row)
     if any(x in f for x in QUOTES_EXCLUDE_FROM_SUBSTRINGS):
@@ -555,137 +722,132 @@ def _is_it_receipt(row: dict) -> bool:
     return any(x in s for x in INVOICES_IT_RECEIPT_SUBJECT_SUBSTRINGS)
 
 
+@METRICS.timed()
 def _invoice_rows_window() -> list[dict]:
-    rows = _router_rows()
-    items = [r for r in rows if (r.get("decision") or "").upper() == "FIRMA" and _in_window(r.get("ts_utc") or "")]
-    items.sort(key=lambda r: (r.get("ts_utc") or ""), reverse=True)
-    return items
+    return _router_store().rows_since(_window_start().timestamp(), "FIRMA")
 
 
+@METRICS.timed()
 def _quotes_rows_window() -> list[dict]:
-    rows = _router_rows()
+    rows = _router_store().rows_since(_window_start().timestamp(), "KLIENTS")
     items = [r for r in rows if _is_quote_candidate(r)]
-    items.sort(key=lambda r: (r.get("ts_utc") or ""), reverse=True)
     # de-dup by subject+from to avoid spam from the same sender
     items = _dedup_rows(items, lambda r: f"{_subject_l(r)}|{_from_l(r)}")
     return items
 
 
-def _router_rows() -> list[dict]:
-    def _load():
-        if not ROUTER_LOG.exists():
-            return []
-        try:
-            with ROUTER_LOG.open("r", encoding="utf-8", errors="replace", newline="") as f:
-                reader = csv.DictReader(f)
-                return list(reader)
-        except Exception:
-            return []
+_ROUTER_STORE = RouterLogStore(ROUTER_LOG)
 
-    return _cache_get("router_rows", 30.0, _load)
+
+@METRICS.timed()
+def _router_store() -> RouterLogStore:
+    """router_log.csv as columns; each call parses only rows appended since the last one."""
+    try:
+        _ROUTER_STORE.refresh()
+    except Exception as e:
+        _log_runtime(f"router_log refresh error: {type(e).__name__}: {e}")
+    return _ROUTER_STORE
 
 
 def _window_start() -> datetime:
     return _utcnow() - timedelta(days=WINDOW_DAYS)
 
 
-def _in_window(ts_utc: str) -> bool:
-    dt = _parse_iso_utc(ts_utc)
-    if not dt:
-        return False
-    return dt >= _window_start()
+def _count_routed(decision: str) -> int:
+    return _router_store().count(_window_start().timestamp(), decision)
 
 
-def _count_routed(decision: str) -> int:
-    d = (decision or "").upper()
-    rows = _router_rows()
-    return sum(1 for r in rows if (r.get("decision") or "").upper() == d and _in_window(r.get("ts_utc") or ""))
+def _router_window_total(decisions: tuple[str, ...]) -> int:
+    counts = _router_store().decision_counts(_window_start().timestamp())
+    return sum(counts.get(d, 0) for d in decisions)
 
 
 def _list_routed(decision: str, limit: int = MAX_LIST) -> list[dict]:
-    d = (decision or "").upper()
-    rows = _router_rows()
-    items = [r for r in rows if (r.get("decision") or "").upper() == d and _in_window(r.get("ts_utc") or "")]
-    # Sort by ts_utc descending (string ISO in UTC should sort lexicographically)
-    items.sort(key=lambda r: (r.get("ts_utc") or ""), reverse=True)
-    return items[:limit]
+    return _router_store().rows_since(_window_start().timestamp(), decision, limit=limit)
+
 
+_FINANCE_STORE = FinanceStore(FINANCE_DB, CLIENT_QUOTES_CSV, PAYMENTS_CSV, _csv_headers_quotes(), log=_log_runtime)
 
+
+@METRICS.timed()
+def _finance_store() -> FinanceStore:
+    """Quotes/payments tables; each call picks up hand edits of the CSVs (stat() when unchanged)."""
+    try:
+        _FINANCE_STORE.sync()
+    except Exception as e:
+        _log_runtime(f"finance store sync error: {type(e).__name__}: {e}")
+    return _FINANCE_STORE
+
+
+@METRICS.timed()
 def _payments_pending() -> list[dict]:
-    def _load():
-        out: list[dict] = []
-        if not PAYMENTS_CSV.exists():
-            return out
-        try:
-            with PAYMENTS_CSV.open("r", encoding="utf-8", errors="replace", newline="") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if (row.get("status") or "").strip().lower() == "pending":
-                        out.append(row)
-        except Exception:
-            return out
-        return out
+    try:
+        return _finance_store().pending_payments()
+    except Exception as e:
+        _log_runtime(f"payments read error: {type(e).__name__}: {e}")
+        return []
 
-    return _cache_get("payments_pending", 15.0, _load)
 
+# (store version, normalized rows, read error)
+_CLIENT_QUOTES_VIEW: tuple[int, list[dict], Optional[str]] = (-1, [], None)
 
+
+def _client_quotes_checked() -> tuple[list[dict], Optional[str]]:
+    """Normalized quote rows, built once per store version; (rows, read error)"""
+    global _CLIENT_QUOTES_VIEW
+    version = _finance_store().version
+    cached_version, rows, err = _CLIENT_QUOTES_VIEW
+    if cached_version != version:
+        rows, err = _quotes_rows_safe()
+        if err:
+            _log_runtime(f"client_quotes read error: {err}")
+        _CLIENT_QUOTES_VIEW = (version, rows, err)
+    return rows, err
+
+
+@METRICS.timed()
 def _client_quotes() -> list[dict]:
     """
     Source of truth for quote amounts/statuses.
     Expected columns:
     quote_id,client,subject,amount,currency,date,status,due_date,email_from,email_subject,notes
     """
-    def _load():
-        out, err = _quotes_rows_safe()
-        if err:
-            _log_runtime(f"client_quotes read error: {err}")
-            return []
-        return out
-
-    return _cache_get("client_quotes", 20.0, _load)
+    return _client_quotes_checked()[0]
 
 
+@METRICS.timed()
 def _quotes_stats_from_csv() -> dict:
-    rows = _client_quotes()
-    if not rows:
-        return {"total": 0, "open": 0, "sent": 0, "won": 0, "lost": 0, "expired": 0, "unknown": 0}
-
-    counters = {"total": len(rows), "open": 0, "sent": 0, "won": 0, "lost": 0, "expired": 0, "unknown": 0}
-    for r in rows:
-        status = (r.get("status") or "").strip().lower()
-        if status in counters:
-            counters[status] += 1
+    counters = {"total": 0, "open": 0, "sent": 0, "won": 0, "lost": 0, "expired": 0, "unknown": 0}
+    try:
+        by_status = _finance_store().quote_status_counts()
+    except Exception as e:
+        _log_runtime(f"quotes stats error: {type(e).__name__}: {e}")
+        return counters
+    for status, n in by_status.items():
+        counters["total"] += n
+        if status in counters and status != "total":
+            counters[status] += n
         else:
-            counters["unknown"] += 1
+            counters["unknown"] += n
     return counters
 
 
 def _payables_stats() -> tuple[int, int, int, list[str]]:
     """(total, overdue, due_3, top_lines)"""
-    rows = _payments_pending()
     today = datetime.now().date()
-
-    parsed: list[tuple[datetime.date, dict]] = []
-    for r in rows:
-        try:
-            d = datetime.strptime((r.get("deadline") or "").strip(), "%Y-%m-%d").date()
-        except Exception:
-            continue
-        parsed.append((d, r))
-    parsed.sort(key=lambda x: x[0])
-
-    overdue = 0
-    due_3 = 0
-    for d, _ in parsed:
-        days_left = (d - today).days
-        if days_left < 0:
-            overdue += 1
-        if days_left <= 3:
-            due_3 += 1
+    t = today.toordinal()
+    try:
+        store = _finance_store()
+        total, overdue, due_3 = store.pending_deadline_counts(t, t + 3)
+        top = store.pending_by_deadline(limit=5)
+    except Exception as e:
+        _log_runtime(f"payables read error: {type(e).__name__}: {e}")
+        return (0, 0, 0, [])
 
     lines: list[str] = []
-    for d, r in parsed[:5]:
-        days_left = (d - today).days
+    for o, r in top:
+        d = date.fromordinal(o)
+        days_left = o - t
         icon = "🔴" if days_left < 0 else ("⚠️" if days_left <= 3 else "✅")
         name = (r.get("name") or "").strip()
         amount = (r.get("amount") or "").strip()
@@ -693,7 +855,7 @@ def _payables_stats() -> tuple[int, int, int, list[str]]:
             amount = f"{amount} zł"
         lines.append(f"{icon} {name}: {amount} ({d.isoformat()})")
 
-    return (len(parsed), overdue, due_3, lines)
+    return (total, overdue, due_3, lines)
 
 
 def _count_pdfs(path: Path) -> int:
@@ -710,6 +872,7 @@ def _count_pdfs(path: Path) -> int:
     return _cache_get(f"pdfs:{str(path)}", 60.0, _do)
 
 
+@METRICS.timed()
 def _finance_pdf_counts() -> dict[str, int]:
     def _do():
         return {
@@ -724,11 +887,45 @@ def _finance_pdf_counts() -> dict[str, int]:
     return _cache_get("finance_pdf_counts", 60.0, _do)
 
 
+_PIPELINE_EVENTS = PipelineEventLog(PIPELINE_EVENTS)
+
+
+@METRICS.timed()
+def _pipeline_last_run() -> Optional[dict]:
+    """
+    Latest run from pipeline_events.jsonl (see pipeline_events.py).
+    Re-reads only when the file changed; None if the pipeline has not written events yet.
+    """
+    try:
+        return _PIPELINE_EVENTS.latest()
+    except Exception as e:
+        _log_runtime(f"pipeline events read error: {type(e).__name__}: {e}")
+        return None
+
+
 def _pipeline_last_status() -> tuple[str, Optional[str]]:
     """
-    Returns (status, ts_utc_str)
-    status in: OK / ERROR / NEVER / UNKNOWN
+    Returns (status, ts_utc_str) of the last run start
+    status in: OK / ERROR / RUNNING / NEVER / UNKNOWN
     """
+    run = _pipeline_last_run()
+    if run is not None:
+        dt = _parse_iso_utc(run.get("started_utc") or "")
+        return (run.get("status") or "UNKNOWN", dt.strftime("%Y-%m-%dT%H:%M:%SZ") if dt else None)
+    return _pipeline_last_status_from_log()
+
+
+def _pipeline_last_imported_count() -> Optional[int]:
+    run = _pipeline_last_run()
+    if run is not None:
+        count = (run.get("stages") or {}).get("IMPORT_GMAIL", {}).get("count")
+        return count if isinstance(count, int) else None
+    return _pipeline_last_imported_count_from_log()
+
+
+# Fallbacks for logs written before pipeline_events.jsonl existed.
+
+def _pipeline_last_status_from_log() -> tuple[str, Optional[str]]:
     text = _read_text(PIPELINE_LOG)
     if not text.strip():
         return ("NEVER", None)
@@ -753,7 +950,7 @@ def _pipeline_last_status() -> tuple[str, Optional[str]]:
     return ("UNKNOWN", ts)
 
 
-def _pipeline_last_imported_count() -> Optional[int]:
+def _pipeline_last_imported_count_from_log() -> Optional[int]:
     """
     Best-effort: parse last "Imported: N attachment(s)." from pipeline log.
     """
@@ -774,7 +971,7 @@ def _pipeline_last_imported_count() -> Optional[int]:
 
 
 def _pipeline_last_start_dt_utc() -> Optional[datetime]:
-    """Parse last 'UTC: ...Z' from pipeline log into datetime (UTC)."""
+    """Start of the last pipeline run (UTC)."""
     status, ts = _pipeline_last_status()
     dt = _parse_iso_utc(ts or "")
     return dt
@@ -784,15 +981,10 @@ def _count_routed_since(dt_utc: Optional[datetime]) -> Optional[int]:
     """Count router_log rows with ts_utc >= dt_utc (best-effort)."""
     if not dt_utc:
         return None
-    rows = _router_rows()
-    n = 0
-    for r in rows:
-        dt = _parse_iso_utc(r.get("ts_utc") or "")
-        if dt and dt >= dt_utc:
-            n += 1
-    return n
+    return _router_store().count(dt_utc.timestamp())
 
 
+@METRICS.timed()
 def _risk_report_data() -> dict:
     """
     Risk report from real sources only:
@@ -800,25 +992,25 @@ def _risk_report_data() -> dict:
     - router_log.csv (quality/payment_risk flags, last WINDOW_DAYS)
     """
     total, overdue, due_3, top = _payables_stats()
-    rows = _router_rows()
-    risk_rows = [
-        r for r in rows
-        if _in_window(r.get("ts_utc") or "")
-        and (
-            (r.get("payment_risk") or "").lower() in {"high", "medium"}
-            or (r.get("quality") or "").lower() in {"vague"}
-        )
-    ]
-    risk_rows.sort(key=lambda r: (r.get("ts_utc") or ""), reverse=True)
     return {
         "pay_total": total,
         "pay_overdue": overdue,
         "pay_due3": due_3,
         "pay_top": top,
-        "mail_risks": risk_rows[:10],
+        "mail_risks": _mail_risk_rows(),
     }
 
 
+def _mail_risk_rows(limit: int = 10) -> list[dict]:
+    """router_log.csv rows flagged payment_risk high/medium or quality vague, last WINDOW_DAYS"""
+    rows = _router_store().rows_matching(
+        _window_start().timestamp(),
+        risk={"high", "medium"},
+        quality={"vague"},
+    )
+    return rows[:limit]
+
+
 def _is_legacy_icloud_error(stage: str, message: str) -> bool:
     s = (stage or "").strip().lower()
     m = (message or "").strip().lower()
@@ -827,6 +1019,7 @@ def _is_legacy_icloud_error(stage: str, message: str) -> bool:
     return any(x in m for x in LEGACY_ERROR_SUBSTRINGS)
 
 
+@METRICS.timed()
 def _latest_pipeline_error(after_utc: Optional[datetime] = None) -> dict:
     """
     Returns {"raw": str, "stage": str, "code": str, "message": str}
@@ -891,6 +1084,35 @@ def _extract_money_hint(text: str) -> Optional[str]:
     return raw
 
 
+_CLIENT_INDEX = ClientIndex(ROOT)
+
+
+def _client_query_target(q: str) -> Optional[str]:
+    """'клиент Nowak' / 'client jan@x.pl' / any text with an e-mail -> lookup string"""
+    for prefix in CLIENT_QUERY_PREFIXES:
+        if q.startswith(prefix):
+            return q[len(prefix):].strip() or None
+    for token in q.split():
+        if "@" in token:
+            return token.strip("<>,;()")
+    return None
+
+
+def _client_answer(target: str) -> str:
+    """Timeline for one client from the incremental client index (O(client history))."""
+    _CLIENT_INDEX.refresh()
+    keys = _CLIENT_INDEX.find(target, limit=4)
+    if not keys:
+        return f"Клиент «{target}» не найден в router_log / CLIENT_QUOTES / PAYMENTS."
+    lines = [format_timeline(_CLIENT_INDEX, keys[0], limit=MAX_LIST)]
+    if len(keys) > 1:
+        others = ", ".join(_CLIENT_INDEX.labels.get(k, k) for k in keys[1:])
+        lines += ["", f"Похожие: {others}"]
+    lines.append("Источник: `router_log.csv` + `CLIENT_QUOTES.csv` + `PAYMENTS.csv`.")
+    return "\n".join(lines)
+
+
+@METRICS.timed()
 def _ai_answer(question: str) -> str:
     """
     Lightweight local AI assistant (rule-based), grounded in real project data.
@@ -900,83 +1122,153 @@ def _ai_answer(question: str) -> str:
     if not q:
         return "Задай вопрос, например: 'откуда цифры по рискам', 'что по выценам', 'что по оплатам'."
 
-    summary = _build_dashboard_summary()
-    risk = _risk_report_data()
-    quotes = _quotes_rows_window()[:MAX_LIST]
-    qstats = _quotes_stats_from_csv()
-    qrows = _client_quotes()
-    inv = [r for r in _invoice_rows_window() if not _is_it_receipt(r)][:MAX_LIST]
-
-    if any(x in q for x in ["риск", "риски", "risk"]):
-        lines = [
-            "Риски (реальные источники):",
-            f"• PAYMENTS.csv: всего {risk['pay_total']}, просрочено {risk['pay_overdue']}, <=3 дня {risk['pay_due3']}",
-            f"• router_log.csv: риск-писем {len(risk['mail_risks'])} за {WINDOW_DAYS} дней",
-            "• Источник цифр: `FINANCE/PAYMENTS.csv` и `00_INBOX/_ROUTER_LOGS/router_log.csv`",
-        ]
-        return "\n".join(lines)
+    client_target = _client_query_target(q)
+    if client_target:
+        return _client_answer(client_target)
 
-    if any(x in q for x in ["оплат", "к оплате", "pay"]):
-        lines = [f"К оплате: {summary['pay_total']} (просрочено {summary['pay_overdue']}, <=3 дня {summary['pay_due3']})", "Топ-5:"]
-        top = risk["pay_top"] or ["(пусто)"]
-        lines.extend([f"• {x}" for x in top])
-        lines.append("Источник: `FINANCE/PAYMENTS.csv`.")
-        return "\n".join(lines)
+    for intent in _AI_INTENTS:
+        if any(x in q for x in intent.keywords):
+            return intent.render(_ai_resolve(intent.needs))
 
-    if any(x in q for x in ["выцен", "клиент", "quotes", "klients"]):
-        lines = [f"Выцены: {summary['quotes']} новых за {WINDOW_DAYS} дней.", "Последние из почты:"]
-        if not quotes:
-            lines.append("• (пусто)")
-        else:
-            for r in quotes[:5]:
-                subj = (r.get("subject") or r.get("file") or "").strip()
-                if len(subj) > 70:
-                    subj = subj[:67] + "..."
-                money = _extract_money_hint(subj) or "без суммы"
-                lines.append(f"• {subj} [{money}]")
-        if qrows:
-            lines += [
-                "",
-                f"CRM выцен (CLIENT_QUOTES.csv): всего {qstats['total']}, open {qstats['open']}, won {qstats['won']}, lost {qstats['lost']}",
-            ]
-        else:
-            lines += [
-                "",
-                "Для точного «кому сколько выценил» заполняй `FINANCE/CLIENT_QUOTES.csv`.",
-            ]
-        lines.append("Источник: `router_log.csv` + `FINANCE/CLIENT_QUOTES.csv`.")
-        return "\n".join(lines)
-
-    if any(x in q for x in ["фактур", "бух", "invoice", "zus", "vat"]):
-        c = _finance_pdf_counts()
-        lines = [
-            f"Бухгалтерия: {summary['inv']} новых FIRMA за {WINDOW_DAYS} дней.",
-            f"FINANCE/DOCS(PDF): issued {c['issued']}, received {c['received']}, ZUS {c['zus']}, VAT {c['vat']}, Leasing {c['leasing']}, Rachunki {c['rachunki']}",
+    return (
+        "Могу ответить по 6 блокам: почта, риски, оплаты, выцены, бухгалтерия, клиент <имя/email>.\n"
+        "Пример: 'откуда цифры по рискам' или 'что по выценам за 7 дней'."
+    )
+
+
+# AI data sources: name -> (dependencies, loader called with the resolved
+# dependencies). An intent declares what it needs; only that (plus the
+# dependencies) is loaded, after the question was routed.
+_AI_SOURCES: dict[str, tuple[tuple[str, ...], Callable[..., Any]]] = {
+    "payables": ((), lambda: _payables_stats()),
+    "mail_risks": ((), lambda: _mail_risk_rows()),
+    "quotes_window": ((), lambda: _quotes_rows_window()),
+    "client_quotes": ((), lambda: _client_quotes()),
+    # CRM totals are only shown when CLIENT_QUOTES.csv has rows
+    "quote_stats": (("client_quotes",), lambda rows: _quotes_stats_from_csv() if rows else None),
+    "invoices": ((), lambda: [r for r in _invoice_rows_window() if not _is_it_receipt(r)]),
+    "pdf_counts": ((), lambda: _finance_pdf_counts()),
+    "pipeline": ((), lambda: _ai_pipeline_source()),
+}
+
+
+def _ai_resolve(needs: tuple[str, ...]) -> dict[str, Any]:
+    """Load the named sources, each once, dependencies first"""
+    out: dict[str, Any] = {}
+
+    def load(name: str) -> Any:
+        if name not in out:
+            deps, loader = _AI_SOURCES[name]
+            out[name] = loader(*(load(d) for d in deps))
+        return out[name]
+
+    for name in needs:
+        load(name)
+    return out
+
+
+def _ai_pipeline_source() -> dict:
+    status, ts = _pipeline_last_status()
+    return {
+        "status": status,
+        "ts": ts or "—",
+        "imported": _pipeline_last_imported_count(),
+        "routed_last_run": _count_routed_since(_pipeline_last_start_dt_utc()),
+    }
+
+
+def _ai_short_subject(r: dict) -> str:
+    subj = (r.get("subject") or r.get("file") or "").strip()
+    if len(subj) > 70:
+        subj = subj[:67] + "..."
+    return subj
+
+
+def _ai_risk_text(d: dict) -> str:
+    total, overdue, due_3, _ = d["payables"]
+    lines = [
+        "Риски (реальные источники):",
+        f"• PAYMENTS.csv: всего {total}, просрочено {overdue}, <=3 дня {due_3}",
+        f"• router_log.csv: риск-писем {len(d['mail_risks'])} за {WINDOW_DAYS} дней",
+        "• Источник цифр: `FINANCE/PAYMENTS.csv` и `00_INBOX/_ROUTER_LOGS/router_log.csv`",
+    ]
+    return "\n".join(lines)
+
+
+def _ai_payables_text(d: dict) -> str:
+    total, overdue, due_3, top = d["payables"]
+    lines = [f"К оплате: {total} (просрочено {overdue}, <=3 дня {due_3})", "Топ-5:"]
+    lines.extend([f"• {x}" for x in (top or ["(пусто)"])])
+    lines.append("Источник: `FINANCE/PAYMENTS.csv`.")
+    return "\n".join(lines)
+
+
+def _ai_quotes_text(d: dict) -> str:
+    quotes = d["quotes_window"]
+    lines = [f"Выцены: {len(quotes)} новых за {WINDOW_DAYS} дней.", "Последние из почты:"]
+    if not quotes:
+        lines.append("• (пусто)")
+    else:
+        for r in quotes[:5]:
+            subj = _ai_short_subject(r)
+            money = _extract_money_hint(subj) or "без суммы"
+            lines.append(f"• {subj} [{money}]")
+    qstats = d["quote_stats"]
+    if qstats:
+        lines += [
+            "",
+            f"CRM выцен (CLIENT_QUOTES.csv): всего {qstats['total']}, open {qstats['open']}, won {qstats['won']}, lost {qstats['lost']}",
         ]
-        if inv:
-            lines.append("Последние входящие:")
-            for r in inv[:5]:
-                subj = (r.get("subject") or r.get("file") or "").strip()
-                if len(subj) > 70:
-                    subj = subj[:67] + "..."
-                lines.append(f"• {subj}")
-        lines.append("Источник: `router_log.csv` + `FINANCE/DOCS`.")
-        return "\n".join(lines)
-
-    if any(x in q for x in ["почт", "pipeline", "пайп", "импорт"]):
-        return (
-            f"Почта/пайплайн: {summary['status']} (UTC {summary['ts']}).\n"
-            f"Импорт: +{summary['imported'] if summary['imported'] is not None else 'n/a'}\n"
-            f"Разложено: {summary['routed_last_run'] if summary['routed_last_run'] is not None else 'n/a'}\n"
-            "Источники: `pipeline_run.log`, `router_log.csv`."
-        )
+    else:
+        lines += [
+            "",
+            "Для точного «кому сколько выценил» заполняй `FINANCE/CLIENT_QUOTES.csv`.",
+        ]
+    lines.append("Источник: `router_log.csv` + `FINANCE/CLIENT_QUOTES.csv`.")
+    return "\n".join(lines)
+
+
+def _ai_invoices_text(d: dict) -> str:
+    inv = d["invoices"]
+    c = d["pdf_counts"]
+    lines = [
+        f"Бухгалтерия: {len(inv)} новых FIRMA за {WINDOW_DAYS} дней.",
+        f"FINANCE/DOCS(PDF): issued {c['issued']}, received {c['received']}, ZUS {c['zus']}, VAT {c['vat']}, Leasing {c['leasing']}, Rachunki {c['rachunki']}",
+    ]
+    if inv:
+        lines.append("Последние входящие:")
+        lines.extend(f"• {_ai_short_subject(r)}" for r in inv[:5])
+    lines.append("Источник: `router_log.csv` + `FINANCE/DOCS`.")
+    return "\n".join(lines)
 
+
+def _ai_pipeline_text(d: dict) -> str:
+    p = d["pipeline"]
     return (
-        "Могу ответить по 5 блокам: почта, риски, оплаты, выцены, бухгалтерия.\n"
-        "Пример: 'откуда цифры по рискам' или 'что по выценам за 7 дней'."
+        f"Почта/пайплайн: {p['status']} (UTC {p['ts']}).\n"
+        f"Импорт: +{p['imported'] if p['imported'] is not None else 'n/a'}\n"
+        f"Разложено: {p['routed_last_run'] if p['routed_last_run'] is not None else 'n/a'}\n"
+        "Источники: `pipeline_run.log`, `router_log.csv`."
     )
 
 
+@dataclass
+class _AiIntent:
+    keywords: tuple[str, ...]
+    needs: tuple[str, ...]
+    render: Callable[[dict], str]
+
+
+# checked in order; the first intent with a matching keyword answers
+_AI_INTENTS: tuple[_AiIntent, ...] = (
+    _AiIntent(("риск", "риски", "risk"), ("payables", "mail_risks"), _ai_risk_text),
+    _AiIntent(("оплат", "к оплате", "pay"), ("payables",), _ai_payables_text),
+    _AiIntent(("выцен", "клиент", "quotes", "klients"), ("quotes_window", "quote_stats"), _ai_quotes_text),
+    _AiIntent(("фактур", "бух", "invoice", "zus", "vat"), ("invoices", "pdf_counts"), _ai_invoices_text),
+    _AiIntent(("почт", "pipeline", "пайп", "импорт"), ("pipeline",), _ai_pipeline_text),
+)
+
+
 # =========================
 # UI rendering
 # =========================
@@ -1004,7 +1296,7 @@ def _dashboard_keyboard(summary: dict) -> InlineKeyboardMarkup:
     )
 
 
-def _build_dashboard_summary() -> dict:
+def _compute_dashboard_summary() -> dict:
     status, ts = _pipeline_last_status()
     imported = _pipeline_last_imported_count()
     last_start_dt = _pipeline_last_start_dt_utc()
@@ -1017,7 +1309,7 @@ def _build_dashboard_summary() -> dict:
     inv = max(0, len(inv_rows) - it_receipts)
     qstats = _quotes_stats_from_csv()
 
-    mail_badge = {"OK": "✅", "ERROR": "🔴", "NEVER": "⚪", "UNKNOWN": "🟡"}.get(status, "🟡")
+    mail_badge = {"OK": "✅", "ERROR": "🔴", "RUNNING": "⏳", "NEVER": "⚪", "UNKNOWN": "🟡"}.get(status, "🟡")
     if imported is not None:
         mail_badge += f" +{imported}"
     if routed_last_run is not None:
@@ -1046,9 +1338,8 @@ def _build_dashboard_summary() -> dict:
     }
 
 
-def build_dashboard_text() -> str:
-    s = _build_dashboard_summary()
-    status_badge = {"OK": "OK", "ERROR": "ERROR", "NEVER": "NEVER", "UNKNOWN": "UNKNOWN"}.get(
+def _render_dashboard_text(s: dict) -> str:
+    status_badge = {"OK": "OK", "ERROR": "ERROR", "RUNNING": "RUNNING", "NEVER": "NEVER", "UNKNOWN": "UNKNOWN"}.get(
         s["status"], "UNKNOWN"
     )
 
@@ -1078,6 +1369,63 @@ def build_dashboard_text() -> str:
     ]
     return _fit_message("\n".join(lines))
 
+
+# Materialized dashboard: computed once per data version (source file
+# signatures + a DASHBOARD_MAX_AGE_S bucket, since the 7-day window and
+# "days left" move with the clock), then served as-is to every handler.
+DASHBOARD_SOURCES = (PIPELINE_EVENTS, PIPELINE_LOG, ROUTER_LOG, PAYMENTS_CSV, CLIENT_QUOTES_CSV)
+
+
+@dataclass
+class _DashboardView:
+    version: tuple
+    summary: dict
+    text: str
+    keyboard: InlineKeyboardMarkup
+    build_ms: float
+
+
+_DASHBOARD_VIEW: Optional[_DashboardView] = None
+_DASHBOARD_LOCK = threading.Lock()
+
+
+def _dashboard_version() -> tuple:
+    bucket = int(time.time() // DASHBOARD_MAX_AGE_S)
+    return (bucket, _FINANCE_STORE.version) + tuple(_file_sig(p) for p in DASHBOARD_SOURCES)
+
+
+@METRICS.timed()
+def _dashboard_view() -> _DashboardView:
+    global _DASHBOARD_VIEW
+    version = _dashboard_version()
+    view = _DASHBOARD_VIEW
+    if view is not None and view.version == version:
+        return view
+    with _DASHBOARD_LOCK:
+        view = _DASHBOARD_VIEW
+        if view is not None and view.version == version:
+            return view
+        t0 = time.perf_counter()
+        summary = _compute_dashboard_summary()
+        view = _DashboardView(
+            version=version,
+            summary=summary,
+            text=_render_dashboard_text(summary),
+            keyboard=_dashboard_keyboard(summary),
+            build_ms=round((time.perf_counter() - t0) * 1000, 1),
+        )
+        _DASHBOARD_VIEW = view
+    return view
+
+
+def _build_dashboard_summary() -> dict:
+    return _dashboard_view().summary
+
+
+def build_dashboard_text() -> str:
+    return _dashboard_view().text
+
+
 # =========================
 # Screens (all edit the same message)
 # =========================
@@ -1097,9 +1445,8 @@ async def _edit(query, text: str, keyboard: Optional[InlineKeyboardMarkup] = Non
             _log_runtime(f"_edit fallback failed: {type(e2).__name__}: {e2}")
 
 async def show_dashboard(query) -> None:
-    text = await asyncio.to_thread(build_dashboard_text)
-    summary = await asyncio.to_thread(_build_dashboard_summary)
-    await _edit(query, text, _dashboard_keyboard(summary))
+    view = await asyncio.to_thread(_dashboard_view)
+    await _edit(query, view.text, view.keyboard)
 
 
 def _back_kb() -> InlineKeyboardMarkup:
@@ -1127,9 +1474,20 @@ async def show_mail(query) -> None:
     ]
     if imported is not None:
         msg.append(f"Импортировано вложений (последний запуск): {imported}")
+    run = await asyncio.to_thread(_pipeline_last_run)
+    if run is not None and run.get("stages"):
+        msg.append("")
+        for stage, st in run["stages"].items():
+            icon = {True: "✅", False: "🔴"}.get(st.get("ok"), "⏳")
+            dur = f" {st['duration_ms'] / 1000:.1f}s" if isinstance(st.get("duration_ms"), (int, float)) else ""
+            cnt = f" (+{st['count']})" if isinstance(st.get("count"), int) else ""
+            msg.append(f"{icon} {stage}{dur}{cnt}")
     msg.append("")
     msg.append("Действие: запустить обновление (импорт + сортировка).")
-    msg.append(f"Источник: pipeline_run.log UTC={_file_mtime_utc(PIPELINE_LOG)}")
+    if run is not None:
+        msg.append(f"Источник: pipeline_events.jsonl UTC={_file_mtime_utc(PIPELINE_EVENTS)}")
+    else:
+        msg.append(f"Источник: pipeline_run.log UTC={_file_mtime_utc(PIPELINE_LOG)}")
 
     kb = InlineKeyboardMarkup(
         [
@@ -1140,37 +1498,76 @@ async def show_mail(query) -> None:
     await _edit(query, "\n".join(msg), kb)
 
 
-async def run_pipeline(query) -> None:
-    if PIPELINE_RUN_LOCK.locked():
-        await _edit(
-            query,
-            "Пайплайн уже выполняется. Подожди завершения текущего запуска.",
-            _back_kb(),
-        )
-        return
+# The pipeline runs as a background task: the chat stays usable meanwhile.
+# _SCREEN_SEQ counts screen changes per chat; if the user moved on before the
+# run finished, the result arrives as a new message instead of replacing
+# whatever is on screen now.
+_PIPELINE_TASK: Optional[asyncio.Task] = None
+_SCREEN_SEQ: dict[int, int] = {}
+
+
+def _screen_changed(chat_id: int) -> None:
+    _SCREEN_SEQ[chat_id] = _SCREEN_SEQ.get(chat_id, 0) + 1
+
+
+def _pipeline_running() -> bool:
+    return _PIPELINE_TASK is not None and not _PIPELINE_TASK.done()
+
+
+def _run_pipeline_process() -> tuple[int, str, str]:
+    cmd = ["powershell", "-ExecutionPolicy", "Bypass", "-File", str(MAIL_PIPELINE_PS1)]
+    try:
+        r = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+        return (r.returncode, r.stdout or "", r.stderr or "")
+    except subprocess.TimeoutExpired:
+        return (124, "", "Timeout (120s)")
+    except Exception as e:
+        return (1, "", f"{type(e).__name__}: {e}")
 
-    def _run() -> tuple[int, str, str]:
-        cmd = ["powershell", "-ExecutionPolicy", "Bypass", "-File", str(MAIL_PIPELINE_PS1)]
-        try:
-            r = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-            return (r.returncode, r.stdout or "", r.stderr or "")
-        except subprocess.TimeoutExpired:
-            return (124, "", "Timeout (120s)")
-        except Exception as e:
-            return (1, "", f"{type(e).__name__}: {e}")
 
-    await _edit(query, "⏳ Запускаю пайплайн... (до 120 сек)", _back_kb())
-    async with PIPELINE_RUN_LOCK:
-        rc, out, err = await asyncio.to_thread(_run)
+async def _pipeline_job(query, bot, seq: int) -> None:
+    chat_id = query.message.chat_id
+    try:
+        rc, out, err = await asyncio.to_thread(_run_pipeline_process)
         _invalidate_runtime_cache()
+        _log_runtime(f"pipeline rc={rc}")
+        on_screen = _SCREEN_SEQ.get(chat_id, 0) == seq
+
+        if rc == 0:
+            if on_screen:
+                await show_dashboard(query)
+            else:
+                await _outbox(bot).send(chat_id, "✅ Пайплайн завершён, данные обновлены.", PRIORITY_INFO)
+            return
 
-    _log_runtime(f"pipeline rc={rc}")
-    if rc == 0:
-        await show_dashboard(query)
+        tail = (err.strip() or out.strip() or "Неизвестная ошибка")[-1500:]
+        text = f"Ошибка пайплайна (код {rc})\n\n{tail}"
+        if on_screen:
+            await _edit(query, text, _back_kb())
+        else:
+            await _outbox(bot).send(chat_id, text, PRIORITY_ERROR)
+    except Exception as e:
+        _log_runtime(f"pipeline job failed: {type(e).__name__}: {e}")
+
+
+async def run_pipeline(query, context: ContextTypes.DEFAULT_TYPE) -> None:
+    global _PIPELINE_TASK
+    busy_text = "Пайплайн уже выполняется. Подожди завершения текущего запуска."
+    if _pipeline_running():
+        await _edit(query, busy_text, _back_kb())
         return
 
-    tail = (err.strip() or out.strip() or "Неизвестная ошибка")[-1500:]
-    await _edit(query, f"Ошибка пайплайна (код {rc})\n\n{tail}", _back_kb())
+    await _edit(
+        query,
+        "⏳ Запускаю пайплайн... (до 120 сек)\nПанелью можно пользоваться, результат придёт сюда.",
+        _back_kb(),
+    )
+    # re-check after the await: another chat may have started a run meanwhile
+    if _pipeline_running():
+        await _edit(query, busy_text, _back_kb())
+        return
+    seq = _SCREEN_SEQ.get(query.message.chat_id, 0)
+    _PIPELINE_TASK = asyncio.create_task(_pipeline_job(query, context.bot, seq))
 
 
 async def show_payables(query) -> None:
@@ -1252,7 +1649,7 @@ async def show_quotes(query) -> None:
 
 
 def _quotes_report_text() -> str:
-    rows, err = _quotes_rows_safe()
+    rows, err = _client_quotes_checked()
     if err:
         return (
             "💼 Отчёт по выценам\n\n"
@@ -1342,112 +1739,92 @@ def _quotes_report_text() -> str:
     return _fit_message("\n".join(lines))
 
 
-def _quote_row_key(email_from: str, email_subject: str) -> str:
-    return f"{(email_from or '').strip().lower()}|{(email_subject or '').strip().lower()}"
-
-
-def _existing_quote_keys() -> set[str]:
-    rows = _client_quotes()
-    keys: set[str] = set()
-    for r in rows:
-        keys.add(_quote_row_key(r.get("email_from", ""), r.get("email_subject", "")))
-    return keys
+# Quote ledger: CSV key index + pending drafts + router watermark.
+# Its lock serializes writers of CLIENT_QUOTES.csv / quotes_drafts.json
+# (handlers run concurrently). Readers take no lock: the cache validates by
+# file signature and JSON is replaced atomically. Reentrant: bootstrap builds
+# drafts and applies them.
+_QUOTE_LEDGER = QuoteLedger(_FINANCE_STORE, QUOTES_DRAFTS_FILE)
+_QUOTES_WRITE_LOCK = _QUOTE_LEDGER.lock
 
 
 def _build_quote_drafts_from_router(limit: int = 30, days_window: int = WINDOW_DAYS) -> dict:
     """
-    Create draft quote rows from KLIENTS mail in the given window.
-    Amount is unknown by default -> empty.
+    Add draft quote rows for KLIENTS mail newer than the ledger watermark
+    (at most `limit` newest rows, never older than days_window).
+    Amount is unknown by default -> empty. Drafts not applied yet stay pending.
     """
-    window_start = _utcnow() - timedelta(days=days_window)
-    rows = _router_rows()
-    items = [
-        r for r in rows
-        if (r.get("decision") or "").upper() == "KLIENTS"
-        and (_parse_iso_utc(r.get("ts_utc") or "") or datetime.min.replace(tzinfo=timezone.utc)) >= window_start
-    ]
-    items.sort(key=lambda r: (r.get("ts_utc") or ""), reverse=True)
-    items = items[:limit]
-    existing = _existing_quote_keys()
-    drafts: list[dict] = []
-
-    # sequence for quote_id per current date
-    today = datetime.now().strftime("%Y%m%d")
-    seq = 1
-
-    for r in items:
-        email_from = (r.get("from") or "").strip()
-        email_subject = (r.get("subject") or r.get("file") or "").strip()
-        if not email_subject:
-            continue
-
-        k = _quote_row_key(email_from, email_subject)
-        if k in existing:
-            continue
-        if any(_quote_row_key(d["email_from"], d["email_subject"]) == k for d in drafts):
-            continue
+    store = _router_store()
+    window_start = (_utcnow() - timedelta(days=days_window)).timestamp()
+
+    with _QUOTES_WRITE_LOCK:
+        ledger = _QUOTE_LEDGER
+        ledger.refresh()
+        since = max(window_start, ledger.watermark)
+        ids = store.ids_since(since, "KLIENTS")[:limit]
+
+        # sequence for quote_id per current date, continuing after pending drafts
+        today = datetime.now().strftime("%Y%m%d")
+        seq = 1 + sum(1 for d in ledger.pending() if str(d.get("quote_id", "")).startswith(f"AUTO-{today}-"))
+        newest = since
+        added = 0
+
+        for i in ids:
+            ts = store.ts[i]
+            newest = max(newest, ts)
+            r = store.row(i)
+            email_from = (r.get("from") or "").strip()
+            email_subject = (r.get("subject") or r.get("file") or "").strip()
+            if not email_subject:
+                continue
 
-        ts = _parse_iso_utc(r.get("ts_utc") or "")
-        date = ts.date().isoformat() if ts else datetime.now().date().isoformat()
-        client = email_from.split("<")[0].strip().strip('"') if email_from else "Unknown"
-        if not client:
-            client = "Unknown"
-
-        draft = {
-            "quote_id": f"AUTO-{today}-{seq:03d}",
-            "client": client,
-            "subject": email_subject[:120],
-            "amount": "",
-            "currency": "PLN",
-            "date": date,
-            "status": "open",
-            "due_date": "",
-            "email_from": email_from[:200],
-            "email_subject": email_subject[:200],
-            "notes": "auto-draft from router",
-        }
-        drafts.append(draft)
-        seq += 1
+            k = quote_key(email_from, email_subject)
+            if ledger.has(k):
+                continue
 
-    payload = {
-        "created_utc": _utcnow().isoformat(),
-        "count": len(drafts),
-        "rows": drafts,
-    }
-    _save_json(QUOTES_DRAFTS_FILE, payload)
+            date = datetime.fromtimestamp(ts, timezone.utc).date().isoformat()
+            client = email_from.split("<")[0].strip().strip('"') if email_from else "Unknown"
+            if not client:
+                client = "Unknown"
+
+            ledger.add_draft(k, {
+                "quote_id": f"AUTO-{today}-{seq:03d}",
+                "client": client,
+                "subject": email_subject[:120],
+                "amount": "",
+                "currency": "PLN",
+                "date": date,
+                "status": "open",
+                "due_date": "",
+                "email_from": email_from[:200],
+                "email_subject": email_subject[:200],
+                "notes": "auto-draft from router",
+            })
+            seq += 1
+            added += 1
+
+        payload = ledger.commit_drafts(newest)
+    payload["new"] = added
     return payload
 
 
 def _apply_quote_drafts_to_csv() -> dict:
-    payload = _load_json(QUOTES_DRAFTS_FILE)
-    rows = payload.get("rows", []) if isinstance(payload, dict) else []
-    if not isinstance(rows, list):
-        rows = []
-
-    _ensure_quotes_csv()
-    existing = _existing_quote_keys()
+    with _QUOTES_WRITE_LOCK:
+        ledger = _QUOTE_LEDGER
+        ledger.refresh()
+        rows = ledger.pending()
+
+        to_write: list[dict] = []
+        seq = 0
+        for r in rows:
+            k = quote_key(r.get("email_from", ""), r.get("email_subject", ""))
+            if not k or ledger.in_csv(k):
+                continue
+            # enforce schema
+            seq += 1
+            to_write.append(_normalize_quote_row(r, fallback_id=f"DRAFT-{_utcnow().strftime('%Y%m%d')}-{seq:03d}"))
 
-    to_write: list[dict] = []
-    seq = 0
-    for r in rows:
-        k = _quote_row_key(r.get("email_from", ""), r.get("email_subject", ""))
-        if not k or k in existing:
-            continue
-        # enforce schema
-        seq += 1
-        row = _normalize_quote_row(r, fallback_id=f"DRAFT-{_utcnow().strftime('%Y%m%d')}-{seq:03d}")
-        to_write.append(row)
-        existing.add(k)
-
-    if to_write:
-        with CLIENT_QUOTES_CSV.open("a", encoding="utf-8", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=_csv_headers_quotes())
-            for r in to_write:
-                writer.writerow(r)
-
-    # invalidate related cache
-    _CACHE.pop("client_quotes", None)
-    _CACHE.pop("router_rows", None)
+        ledger.append_rows(to_write, clear_pending=True)
 
     return {"draft_rows": len(rows), "added": len(to_write)}
 
@@ -1457,15 +1834,20 @@ def _bootstrap_quotes_if_empty(days_window: int = QUOTES_BOOTSTRAP_DAYS) -> dict
     Auto-seed CLIENT_QUOTES.csv from router_log when it is empty.
     Returns: {"attempted": bool, "added": int, "draft_rows": int, "reason": str}
     """
-    _ensure_quotes_csv()
-    rows, err = _quotes_rows_safe()
-    if err:
-        return {"attempted": False, "added": 0, "draft_rows": 0, "reason": f"csv_error: {err}"}
-    if rows:
+    # common case without the lock or a CSV re-read: cached rows already exist
+    if _client_quotes():
         return {"attempted": False, "added": 0, "draft_rows": 0, "reason": "already_has_rows"}
 
-    payload = _build_quote_drafts_from_router(limit=QUOTES_BOOTSTRAP_LIMIT, days_window=days_window)
-    res = _apply_quote_drafts_to_csv()
+    with _QUOTES_WRITE_LOCK:
+        _ensure_quotes_csv()
+        rows, err = _client_quotes_checked()
+        if err:
+            return {"attempted": False, "added": 0, "draft_rows": 0, "reason": f"csv_error: {err}"}
+        if rows:
+            return {"attempted": False, "added": 0, "draft_rows": 0, "reason": "already_has_rows"}
+
+        payload = _build_quote_drafts_from_router(limit=QUOTES_BOOTSTRAP_LIMIT, days_window=days_window)
+        res = _apply_quote_drafts_to_csv()
     return {
         "attempted": True,
         "added": int(res.get("added", 0)),
@@ -1502,7 +1884,7 @@ async def generate_quotes_draft(query) -> None:
     lines = [
         "⚡ Черновик выцен сформирован",
         "",
-        f"Найдено кандидатов: {payload.get('count', 0)}",
+        f"Кандидатов в черновике: {payload.get('count', 0)} (новых: {payload.get('new', 0)})",
         f"Файл: {QUOTES_DRAFTS_FILE}",
         "",
         "Первые 10 кандидатов:",
@@ -1657,14 +2039,18 @@ async def show_notify_menu(query) -> None:
     last_risk = str(state.get("notify_last_risk_sig") or "")
     last_err = str(state.get("notify_last_error_raw") or "")
     sla_events = await asyncio.to_thread(_payment_sla_events)
+    sla_next = (
+        datetime.fromtimestamp(_SLA_JOB_AT).strftime("%Y-%m-%d %H:%M") if _SLA_JOB_AT is not None else "—"
+    )
 
     lines = [
         "Уведомления",
         "",
         f"Статус: {'ON' if enabled else 'OFF'}",
-        f"Интервал проверки: {NOTIFY_INTERVAL_MIN} мин",
+        f"Проверка: при изменении данных (опрос каждые {NOTIFY_POLL_S} сек)",
         f"Текущий риск: overdue={risk['pay_overdue']}, <=3d={risk['pay_due3']}, mail={len(risk['mail_risks'])}",
         f"SLA платежи (T-7/T-3/T-1/overdue): {len(sla_events)}",
+        f"SLA: точно по сроку, следующее срабатывание {sla_next}",
         f"Выцены без суммы (open): {missing_quotes}",
         f"Ночной self-test: каждый день в {SELFTEST_HOUR_LOCAL:02d}:00 local",
         f"Последняя ошибка в логе: {'есть' if err.get('raw') else 'нет'}",
@@ -1704,162 +2090,331 @@ async def notify_test(query, context: ContextTypes.DEFAULT_TYPE) -> None:
         f"UTC: {_utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')}\n"
         "Если это сообщение пришло, канал уведомлений работает."
     )
-    await context.bot.send_message(chat_id=chat_id, text=text)
-    await _edit(query, "Тест отправлен.", _back_with_ai_kb())
+    ok = await _outbox(context.bot).send(chat_id, text, PRIORITY_INFO)
+    await _edit(query, "Тест отправлен." if ok else "Тест не отправлен (см. runtime log).", _back_with_ai_kb())
 
 
-async def _notification_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """
-    Background notifier:
-    - sends when error line changes
-    - sends when risk signature changes and risk is non-zero
-    """
+_OUTBOX: Optional[Outbox] = None
+
+
+def _outbox(bot) -> Outbox:
+    """Single outbound queue for all bot-initiated messages (rate limits, merging, retry_after)."""
+    global _OUTBOX
+    if _OUTBOX is None:
+        async def _send(chat_id: int, text: str) -> None:
+            await bot.send_message(chat_id=chat_id, text=text)
+
+        _OUTBOX = Outbox(_send, msg_limit=MSG_LIMIT, log=_log_runtime)
+    return _OUTBOX
+
+
+# Notifications are change-driven: a cheap poll (stat() of the source files,
+# in a worker thread) decides whether anything can have changed; only then is
+# the full evaluation run, also off the event loop. Sends happen on the loop.
+NOTIFY_SOURCES = (PIPELINE_EVENTS, PIPELINE_LOG, PIPELINE_ERRORS, ROUTER_LOG, PAYMENTS_CSV, CLIENT_QUOTES_CSV)
+
+_NOTIFY_LOCK = asyncio.Lock()
+_NOTIFY_LAST_VERSION: Optional[tuple] = None
+
+
+@dataclass
+class _Notification:
+    texts: list[str]
+    state_patch: dict
+    priority: int = PRIORITY_INFO
+
+
+def _notify_chat_id() -> Optional[int]:
     try:
-        try:
-            chat_id = int(CHAT_ID_FILE.read_text(encoding="utf-8").strip())
-        except Exception:
-            return
+        return int(CHAT_ID_FILE.read_text(encoding="utf-8").strip())
+    except Exception:
+        return None
 
-        if not _notify_enabled(chat_id):
-            return
 
-        state = _get_chat_state(chat_id)
-
-        # 1) Pipeline error notifications
-        err = _latest_pipeline_error(after_utc=_pipeline_last_start_dt_utc())
-        raw = err.get("raw", "")
-        last_raw = str(state.get("notify_last_error_raw") or "")
-        if raw and raw != last_raw:
-            stage = err.get("stage", "") or "UNKNOWN"
-            code = err.get("code", "") or "—"
-            msg = (err.get("message", "") or "").strip()
-            if "iCloud stage failed" in msg:
-                msg = msg.replace("IMPORT iCloud stage failed", "IMPORT_GMAIL stage failed")
-            notify_text = (
+def _notification_inputs_version(chat_id: int) -> Optional[tuple]:
+    """None when notifications are off; otherwise a value that changes whenever a tick could send something."""
+    if not _notify_enabled(chat_id):
+        return None
+    # risk counts and the daily quote reminder move with the date
+    days = (datetime.now().strftime("%Y-%m-%d"), _utcnow().strftime("%Y-%m-%d"))
+    return (chat_id, _FINANCE_STORE.version) + days + tuple(_file_sig(p) for p in NOTIFY_SOURCES)
+
+
+@METRICS.timed()
+def _notification_plan(chat_id: int) -> list[_Notification]:
+    """
+    Evaluate all notification rules (blocking I/O; run in a thread):
+    - pipeline error changed
+    - risk signature changed and risk is non-zero
+    - daily reminder: open quotes without amount
+    Each item carries the state patch to apply after its messages are sent.
+    SLA payment stages are not polled here: see _sla_fire.
+    """
+    state = _get_chat_state(chat_id)
+    plan: list[_Notification] = []
+
+    # 1) Pipeline error notifications
+    err = _latest_pipeline_error(after_utc=_pipeline_last_start_dt_utc())
+    raw = err.get("raw", "")
+    last_raw = str(state.get("notify_last_error_raw") or "")
+    if raw and raw != last_raw:
+        stage = err.get("stage", "") or "UNKNOWN"
+        code = err.get("code", "") or "—"
+        msg = (err.get("message", "") or "").strip()
+        if "iCloud stage failed" in msg:
+            msg = msg.replace("IMPORT iCloud stage failed", "IMPORT_GMAIL stage failed")
+        plan.append(_Notification(
+            texts=[
                 "Уведомление: ошибка пайплайна\n"
                 f"Stage: {stage}\n"
                 f"Code: {code}\n"
                 f"Message: {msg[:280]}"
-            )
-            await context.bot.send_message(chat_id=chat_id, text=_fit_message(notify_text))
-            _set_chat_state(chat_id, {"notify_last_error_raw": raw})
-
-        # 2) Risk profile notifications (only when there is actual risk)
-        risk = _risk_report_data()
-        has_risk = bool(
-            risk.get("pay_overdue", 0) > 0
-            or risk.get("pay_due3", 0) > 0
-            or len(risk.get("mail_risks") or []) > 0
-        )
-        sig = _risk_signature(risk)
-        last_sig = str(state.get("notify_last_risk_sig") or "")
-        if has_risk and sig != last_sig:
-            top = risk.get("pay_top") or []
-            top_line = top[0] if top else "(нет)"
-            notify_text = (
+            ],
+            state_patch={"notify_last_error_raw": raw},
+            priority=PRIORITY_ERROR,
+        ))
+
+    # 2) Risk profile notifications (only when there is actual risk)
+    risk = _risk_report_data()
+    has_risk = bool(
+        risk.get("pay_overdue", 0) > 0
+        or risk.get("pay_due3", 0) > 0
+        or len(risk.get("mail_risks") or []) > 0
+    )
+    sig = _risk_signature(risk)
+    last_sig = str(state.get("notify_last_risk_sig") or "")
+    if has_risk and sig != last_sig:
+        top = risk.get("pay_top") or []
+        top_line = top[0] if top else "(нет)"
+        plan.append(_Notification(
+            texts=[
                 "Уведомление: изменение рисков\n"
                 f"Платежи: просрочено {risk['pay_overdue']}, <=3 дня {risk['pay_due3']}\n"
                 f"Email-риски: {len(risk['mail_risks'])}\n"
                 f"Ближайший: {top_line}"
-            )
-            await context.bot.send_message(chat_id=chat_id, text=_fit_message(notify_text))
-            _set_chat_state(chat_id, {"notify_last_risk_sig": sig})
-
-        # 3) SLA payment reminders (T-7/T-3/T-1/overdue), dedup by payment_id+stage.
-        events = _payment_sla_events()
-        sent = state.get("notify_payment_alerts", {})
-        if not isinstance(sent, dict):
-            sent = {}
-        new_events: list[dict] = []
-        for e in events:
-            event_key = f"{e['payment_id']}|{e['stage']}"
-            if event_key in sent:
-                continue
-            new_events.append(e)
-            sent[event_key] = _utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-
-        if new_events:
-            for e in new_events[:SLA_NOTIFY_MAX_PER_TICK]:
-                if e["stage"] == "OVERDUE":
-                    stage_text = f"ПРОСРОЧЕНО {abs(e['days_left'])} дн"
-                else:
-                    stage_text = f"T-{e['days_left']} дн"
-                txt = (
-                    "SLA-уведомление по оплате\n"
-                    f"{e['name']}\n"
-                    f"Срок: {e['deadline']} ({stage_text})\n"
-                    f"Сумма: {e['amount']}\n"
-                    f"id: {e['payment_id']}"
-                )
-                await context.bot.send_message(chat_id=chat_id, text=_fit_message(txt))
-            if len(new_events) > SLA_NOTIFY_MAX_PER_TICK:
-                rest = len(new_events) - SLA_NOTIFY_MAX_PER_TICK
-                await context.bot.send_message(
-                    chat_id=chat_id,
-                    text=f"SLA: еще {rest} уведомлений не отправлено в этом цикле (анти-спам лимит).",
-                )
-
-            # Keep state compact
-            if len(sent) > 1200:
-                keys = list(sent.keys())
-                for k in keys[: len(sent) - 800]:
-                    sent.pop(k, None)
-            _set_chat_state(chat_id, {"notify_payment_alerts": sent})
-
-        # 4) Daily reminder: open quotes without amount (no more than once/day)
-        quote_rows = _client_quotes()
-        missing_count = _quotes_missing_amount_count(quote_rows)
-        if missing_count > 0:
-            day_key = _utcnow().strftime("%Y-%m-%d")
-            last_day = str(state.get("notify_quotes_missing_date") or "")
-            if day_key != last_day:
-                sample_clients: list[str] = []
-                for r in quote_rows:
-                    st = (r.get("status") or "").strip().lower()
-                    if st != "open":
-                        continue
-                    if _parse_amount_number(str(r.get("amount") or "")) is not None:
-                        continue
-                    client = (r.get("client") or "").strip() or "Unknown"
-                    if client not in sample_clients:
-                        sample_clients.append(client)
-                    if len(sample_clients) >= 5:
-                        break
-                sample = ", ".join(sample_clients) if sample_clients else "n/a"
-                txt = (
+            ],
+            state_patch={"notify_last_risk_sig": sig},
+            priority=PRIORITY_RISK,
+        ))
+
+    # 3) Daily reminder: open quotes without amount (no more than once/day)
+    quote_rows = _client_quotes()
+    missing_count = _quotes_missing_amount_count(quote_rows)
+    if missing_count > 0:
+        day_key = _utcnow().strftime("%Y-%m-%d")
+        last_day = str(state.get("notify_quotes_missing_date") or "")
+        if day_key != last_day:
+            sample_clients: list[str] = []
+            for r in quote_rows:
+                st = (r.get("status") or "").strip().lower()
+                if st != "open":
+                    continue
+                if _parse_amount_number(str(r.get("amount") or "")) is not None:
+                    continue
+                client = (r.get("client") or "").strip() or "Unknown"
+                if client not in sample_clients:
+                    sample_clients.append(client)
+                if len(sample_clients) >= 5:
+                    break
+            sample = ", ".join(sample_clients) if sample_clients else "n/a"
+            plan.append(_Notification(
+                texts=[
                     "Напоминание по выценам\n"
                     f"Открытых выцен без суммы: {missing_count}\n"
                     f"Примеры клиентов: {sample}\n"
                     "Источник: FINANCE/CLIENT_QUOTES.csv"
-                )
-                await context.bot.send_message(chat_id=chat_id, text=_fit_message(txt))
-                _set_chat_state(chat_id, {"notify_quotes_missing_date": day_key})
-    except Exception as e:
-        _log_runtime(f"notification tick error: {type(e).__name__}: {e}")
+                ],
+                state_patch={"notify_quotes_missing_date": day_key},
+                priority=PRIORITY_QUOTES,
+            ))
 
+    return plan
 
-async def _nightly_selftest_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
-    try:
+
+async def _notification_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Background notifier (polled every NOTIFY_POLL_S):
+    does nothing unless an input file or the date changed since the last
+    completed evaluation; never blocks the event loop on file I/O.
+    """
+    global _NOTIFY_LAST_VERSION
+    if _NOTIFY_LOCK.locked():
+        return
+    async with _NOTIFY_LOCK:
         try:
-            chat_id = int(CHAT_ID_FILE.read_text(encoding="utf-8").strip())
-        except Exception:
-            return
+            chat_id = await asyncio.to_thread(_notify_chat_id)
+            if chat_id is None:
+                return
+            version = await asyncio.to_thread(_notification_inputs_version, chat_id)
+            if version is None:
+                return
+            # payments edited since the last tick: re-plan just those, move the SLA wake-up
+            async with _SLA_LOCK:
+                await asyncio.to_thread(_sla_replan)
+                _sla_arm(context.job_queue)
+            if version == _NOTIFY_LAST_VERSION:
+                return
+
+            plan = await asyncio.to_thread(_notification_plan, chat_id)
+            outbox = _outbox(context.bot)
+            pending = [
+                (item, [outbox.enqueue(chat_id, _fit_message(text), item.priority) for text in item.texts])
+                for item in plan
+            ]
+            all_sent = True
+            for item, futures in pending:
+                if all(await asyncio.gather(*futures)):
+                    _set_chat_state(chat_id, item.state_patch)
+                else:
+                    all_sent = False
+            if all_sent:
+                _NOTIFY_LAST_VERSION = version
+        except Exception as e:
+            _log_runtime(f"notification tick error: {type(e).__name__}: {e}")
 
-        if not _notify_enabled(chat_id):
-            return
 
-        now_local = datetime.now().astimezone()
-        if now_local.hour != SELFTEST_HOUR_LOCAL:
-            return
+# =========================
+# SLA payment reminders (exact-time scheduler)
+# =========================
 
-        day_key = now_local.strftime("%Y-%m-%d")
-        state = _get_chat_state(chat_id)
-        if str(state.get("selftest_last_date") or "") == day_key:
-            return
+# Every pending payment's next stage (T-7/T-3/T-1/overdue) sits on a min-heap;
+# one run_once job sleeps until the earliest of them. The heap is re-planned
+# from the finance store only when its version changed, and then only for
+# payments whose rows changed. Dedup by payment_id+stage stays in chat state.
+_SLA = SlaScheduler(SLA_NOTIFY_DAYS)
+_SLA_PLANNED_VERSION = -1
+_SLA_JOB = None  # telegram.ext.Job of the next wake-up
+_SLA_JOB_AT: Optional[float] = None
+# held by a fire until it has re-armed, and by the tick's replan + arm:
+# a tick can no longer arm a second wake-up while a fire is still sending
+_SLA_LOCK = asyncio.Lock()
+SLA_RETRY_S = NOTIFY_POLL_S
+
+
+@METRICS.timed()
+def _sla_replan() -> int:
+    """Re-plan changed payments if the finance store changed (blocking; run in a thread)"""
+    global _SLA_PLANNED_VERSION
+    store = _finance_store()
+    version = store.version
+    if version == _SLA_PLANNED_VERSION:
+        return 0
+    items = [(_payment_row_id(row), o, row) for o, row in store.pending_by_deadline()]
+    changed = _SLA.replan(items, time.time())
+    _SLA_PLANNED_VERSION = version
+    return changed
+
+
+def _sla_arm(job_queue) -> None:
+    """(Re)schedule the one-shot wake-up at the earliest SLA trigger"""
+    global _SLA_JOB, _SLA_JOB_AT
+    at = _SLA.next_at()
+    # a wake-up far in the past was lost (e.g. the machine slept): arm it again
+    if _SLA_JOB is not None and at == _SLA_JOB_AT and (at is None or at > time.time() - NOTIFY_POLL_S):
+        return
+    if _SLA_JOB is not None:
+        _SLA_JOB.schedule_removal()
+    _SLA_JOB, _SLA_JOB_AT = None, at
+    if at is not None and job_queue is not None:
+        _SLA_JOB = job_queue.run_once(_sla_fire, when=max(0.0, at - time.time()), name="sla")
+
+
+def _sla_text(e: SlaEvent, today: int) -> str:
+    days_left = e.deadline - today
+    if e.stage == "OVERDUE":
+        stage_text = f"ПРОСРОЧЕНО {abs(days_left)} дн"
+    else:
+        stage_text = f"T-{days_left} дн"
+    return (
+        "SLA-уведомление по оплате\n"
+        f"{(e.row.get('name') or '').strip() or 'Без названия'}\n"
+        f"Срок: {date.fromordinal(e.deadline).isoformat()} ({stage_text})\n"
+        f"Сумма: {(e.row.get('amount') or '').strip() or 'n/a'}\n"
+        f"id: {e.payment_id}"
+    )
+
+
+async def _sla_send(bot, chat_id: int, events: list[SlaEvent]) -> list[SlaEvent]:
+    """Send events not yet recorded for this chat; returns the undelivered ones"""
+    sent = _get_chat_state(chat_id).get("notify_payment_alerts", {})
+    sent = dict(sent) if isinstance(sent, dict) else {}
+    today = datetime.now().date().toordinal()
+    fresh = [e for e in events if f"{e.payment_id}|{e.stage}" not in sent]
+    fresh.sort(key=lambda e: (e.deadline, (e.row.get("name") or "").strip()))
+    if not fresh:
+        return []
 
-        txt = _selftest_text()
-        await context.bot.send_message(chat_id=chat_id, text=_fit_message(txt))
-        _set_chat_state(chat_id, {"selftest_last_date": day_key})
+    # no per-wake cap: the outbox merges these into as few messages as fit
+    outbox = _outbox(bot)
+    results = await asyncio.gather(
+        *[outbox.enqueue(chat_id, _fit_message(_sla_text(e, today)), PRIORITY_SLA) for e in fresh]
+    )
+    stamp = _utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    delivered: dict[str, str] = {}
+    failed: list[SlaEvent] = []
+    for e, ok in zip(fresh, results):
+        if ok:
+            delivered[f"{e.payment_id}|{e.stage}"] = stamp
+        else:
+            failed.append(e)
+    if delivered:
+        # merge into the state as it is now: the copy read above is stale after the awaits
+        current = _get_chat_state(chat_id).get("notify_payment_alerts", {})
+        merged = dict(current) if isinstance(current, dict) else {}
+        merged.update(delivered)
+        _set_chat_state(chat_id, {"notify_payment_alerts": merged})
+    return failed
+
+
+async def _sla_fire(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Wake-up at the earliest SLA trigger: send what is due, arm the next one"""
+    global _SLA_JOB, _SLA_JOB_AT, _SLA_PLANNED_VERSION
+    async with _SLA_LOCK:
+        _SLA_JOB, _SLA_JOB_AT = None, None
+        try:
+            chat_id = await asyncio.to_thread(_notify_chat_id)
+            if chat_id is None or not _notify_enabled(chat_id):
+                # planned from scratch by the notification tick once notifications are on
+                _SLA.clear()
+                _SLA_PLANNED_VERSION = -1
+                return
+            await asyncio.to_thread(_sla_replan)
+            events = _SLA.pop_due(time.time())
+            if events:
+                failed = await _sla_send(context.bot, chat_id, events)
+                if failed:
+                    _SLA.retry(failed, time.time() + SLA_RETRY_S)
+        except Exception as e:
+            _log_runtime(f"sla tick error: {type(e).__name__}: {e}")
+        finally:
+            _sla_arm(context.job_queue)
+
+
+def _nightly_selftest_due() -> Optional[tuple[int, str, str]]:
+    """(chat_id, day_key, text) when the nightly self-test should be sent now"""
+    chat_id = _notify_chat_id()
+    if chat_id is None or not _notify_enabled(chat_id):
+        return None
+
+    now_local = datetime.now().astimezone()
+    if now_local.hour != SELFTEST_HOUR_LOCAL:
+        return None
+
+    day_key = now_local.strftime("%Y-%m-%d")
+    state = _get_chat_state(chat_id)
+    if str(state.get("selftest_last_date") or "") == day_key:
+        return None
+    return (chat_id, day_key, _selftest_text())
+
+
+async def _nightly_selftest_tick(context: ContextTypes.DEFAULT_TYPE) -> None:
+    try:
+        due = await asyncio.to_thread(_nightly_selftest_due)
+        if due is None:
+            return
+        chat_id, day_key, txt = due
+        if await _outbox(context.bot).send(chat_id, _fit_message(txt), PRIORITY_INFO):
+            _set_chat_state(chat_id, {"selftest_last_date": day_key})
     except Exception as e:
         _log_runtime(f"nightly selftest tick error: {type(e).__name__}: {e}")
 
@@ -1874,40 +2429,138 @@ async def open_ai_mode(query) -> None:
         "• откуда цифры по рискам\n"
         "• что по оплатам\n"
         "• что по выценам\n"
-        "• что по бухгалтерии\n\n"
+        "• что по бухгалтерии\n"
+        "• клиент Nowak (история клиента)\n\n"
         "AI отвечает только по реальным данным из логов/CSV.",
         _back_kb(),
     )
 
 
-def _search_fast(query_text: str, max_results: int = 10, max_seconds: float = 2.0) -> list[tuple[str, bool]]:
-    query_text = (query_text or "").strip().lower()
-    if not query_text:
-        return []
+@dataclass
+class _SearchResult:
+    query: str
+    version: int
+    doc_ids: list[int]
 
-    start = time.time()
-    roots = [ROOT / "CASES", ROOT / "FINANCE", ROOT / "00_INBOX" / "_DRAFTS"]
 
-    results: list[tuple[str, bool]] = []
-    for r in roots:
-        if not r.exists():
-            continue
-        for dirpath, dirnames, filenames in os.walk(r):
-            if (time.time() - start) > max_seconds:
-                return results
+_SEARCH_VERSION = 0
+_SEARCH_RESULTS: "OrderedDict[str, _SearchResult]" = OrderedDict()
+_SEARCH_LOCK = threading.Lock()
 
-            base = os.path.basename(dirpath).lower()
-            if query_text in base:
-                results.append((str(Path(dirpath).relative_to(ROOT)), True))
-                if len(results) >= max_results:
-                    return results
 
-            for fn in filenames:
-                if query_text in fn.lower():
-                    results.append((str((Path(dirpath) / fn).relative_to(ROOT)), False))
-                    if len(results) >= max_results:
-                        return results
-    return results
+@METRICS.timed()
+def _search_index() -> tuple[TrigramIndex, list[tuple[str, bool]], int]:
+    """
+    Trigram index over folder/file names under CASES, FINANCE and _DRAFTS.
+    Diacritic-insensitive ("wyciag" finds "Wyciąg_03.pdf"), typo-tolerant.
+    One walk per SEARCH_INDEX_TTL_S; queries never touch the filesystem.
+    Every rebuild gets a new version number (result cache key).
+    """
+    def _load():
+        global _SEARCH_VERSION
+        idx = TrigramIndex()
+        entries: list[tuple[str, bool]] = []
+        roots = [ROOT / "CASES", ROOT / "FINANCE", ROOT / "00_INBOX" / "_DRAFTS"]
+        for r in roots:
+            if not r.exists():
+                continue
+            for dirpath, dirnames, filenames in os.walk(r):
+                d = Path(dirpath)
+                entries.append((str(d.relative_to(ROOT)), True))
+                idx.add(d.name)
+                for fn in filenames:
+                    entries.append((str((d / fn).relative_to(ROOT)), False))
+                    idx.add(fn)
+        _SEARCH_VERSION += 1
+        return (idx, entries, _SEARCH_VERSION)
+
+    return _cache_get("search_index", SEARCH_INDEX_TTL_S, _load)
+
+
+@METRICS.timed()
+def _search_results(query_text: str) -> tuple[str, _SearchResult]:
+    """
+    Ranked doc ids for a query, cached by (normalized query, index version).
+    Returns (token, result); token goes into the paging buttons.
+    Bounded: SEARCH_MAX_RESULTS ids per query, SEARCH_CACHE_MAX_QUERIES queries (LRU);
+    results of an older index version are dropped as soon as a new one is built.
+    """
+    idx, _, version = _search_index()
+    key = f"{version}|{normalize(query_text)}"
+    token = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+    with _SEARCH_LOCK:
+        for t in [t for t, r in _SEARCH_RESULTS.items() if r.version != version]:
+            del _SEARCH_RESULTS[t]
+        hit = _SEARCH_RESULTS.get(token)
+        if hit:
+            _SEARCH_RESULTS.move_to_end(token)
+            return token, hit
+
+    doc_ids = [doc_id for doc_id, _ in idx.search(query_text, limit=SEARCH_MAX_RESULTS)]
+    res = _SearchResult(query=query_text, version=version, doc_ids=doc_ids)
+    with _SEARCH_LOCK:
+        _SEARCH_RESULTS[token] = res
+        while len(_SEARCH_RESULTS) > SEARCH_CACHE_MAX_QUERIES:
+            _SEARCH_RESULTS.popitem(last=False)
+    return token, res
+
+
+@METRICS.timed()
+def _search_page(token: str, offset: int) -> Optional[tuple[str, InlineKeyboardMarkup]]:
+    """One page of cached results (no filesystem work). None if the token expired."""
+    with _SEARCH_LOCK:
+        res = _SEARCH_RESULTS.get(token)
+    if res is None:
+        return None
+    _, entries, version = _search_index()
+    if res.version != version:
+        # index was rebuilt: re-run the same query on the new one
+        token, res = _search_results(res.query)
+
+    total = len(res.doc_ids)
+    offset = max(0, min(offset, max(0, total - 1)))
+    page = [entries[i] for i in res.doc_ids[offset:offset + SEARCH_PAGE_SIZE]]
+
+    if not page:
+        text = f"🔎 Поиск: {res.query}\n\n(ничего не найдено)"
+    else:
+        more = "+" if total >= SEARCH_MAX_RESULTS else ""
+        lines = [f"🔎 Поиск: {res.query} ({offset + 1}–{offset + len(page)} из {total}{more})", ""]
+        for rel, is_dir in page:
+            icon = "📁" if is_dir else "📄"
+            lines.append(f"{icon} {rel}")
+        lines += ["", "Напиши другой запрос, чтобы уточнить."]
+        text = "\n".join(lines)
+
+    nav = []
+    if offset > 0:
+        nav.append(_tile("◀️ Назад", f"search_page:{token}:{max(0, offset - SEARCH_PAGE_SIZE)}"))
+    if offset + SEARCH_PAGE_SIZE < total:
+        nav.append(_tile("Вперёд ▶️", f"search_page:{token}:{offset + SEARCH_PAGE_SIZE}"))
+    rows = [nav] if nav else []
+    rows.append([_tile("🏠 Панель", "dashboard")])
+    return text, InlineKeyboardMarkup(rows)
+
+
+def _search_first_page(query_text: str) -> tuple[str, InlineKeyboardMarkup]:
+    query_text = (query_text or "").strip()
+    if not query_text:
+        return "🔎 Поиск\n\n(пустой запрос)", _back_kb()
+    token, _ = _search_results(query_text)
+    page = _search_page(token, 0)
+    if page is None:
+        return f"🔎 Поиск: {query_text}\n\n(ничего не найдено)", _back_kb()
+    return page
+
+
+async def show_search_page(query, token: str, offset: int) -> None:
+    page = await asyncio.to_thread(_search_page, token, offset)
+    if page is None:
+        await _edit(query, "🔎 Результаты устарели. Нажми «Поиск» и повтори запрос.", _back_kb())
+        return
+    text, kb = page
+    await _edit(query, text, kb)
 
 
 async def show_search_prompt(query) -> None:
@@ -1917,6 +2570,7 @@ async def show_search_prompt(query) -> None:
     await _edit(query, "🔎 Поиск\n\nНапиши текст (например: `BMW`, `faktura`, `Monika`).", _back_kb())
 
 
+@_instrumented(lambda u: "text")
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not _is_authorized(update):
         return
@@ -1932,19 +2586,10 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
     q = (update.message.text or "").strip()
+    _screen_changed(chat_id)
     if mode == "search":
-        results = await asyncio.to_thread(_search_fast, q, 10, 2.0)
-        if not results:
-            text = f"🔎 Поиск: {q}\n\n(ничего не найдено)"
-        else:
-            lines = [f"🔎 Поиск: {q}", ""]
-            for rel, is_dir in results:
-                icon = "📁" if is_dir else "📄"
-                lines.append(f"{icon} {rel}")
-            text = "\n".join(lines)
-        # reset mode
-        _set_chat_state(chat_id, {"mode": None})
-        kb = _back_kb()
+        # mode stays "search": the next message refines the query
+        text, kb = await asyncio.to_thread(_search_first_page, q)
     else:
         text = await asyncio.to_thread(_ai_answer, q)
         kb = _back_with_ai_kb()
@@ -1968,6 +2613,7 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
 def _health_text(context: ContextTypes.DEFAULT_TYPE, chat_id: Optional[int] = None) -> str:
     h = _health_snapshot()
+    c = h["cache"]
     queue_depth = "n/a"
     try:
         uq = getattr(context.application, "update_queue", None)
@@ -1994,14 +2640,24 @@ def _health_text(context: ContextTypes.DEFAULT_TYPE, chat_id: Optional[int] = No
         f"quotes_rows: {h['quotes_rows']}",
         f"quotes_missing_amount: {h['quotes_missing_amount']}",
         f"router_rows_window: {h['router_rows_window']}",
+        f"finance_db: {FINANCE_DB} v{_FINANCE_STORE.version}"
+        + (f" last_error={_FINANCE_STORE.last_error}" if _FINANCE_STORE.last_error else ""),
         f"notify: {notify}",
         f"pipeline_running: {h['pipeline_running']}",
         f"queue_depth: {queue_depth}",
         f"cache_entries: {h['cache_entries']}",
+        f"dashboard_build_ms: {_DASHBOARD_VIEW.build_ms if _DASHBOARD_VIEW else 'n/a'}",
+        f"outbox: {_OUTBOX.stats if _OUTBOX else 'idle'}",
+        (
+            f"cache: hit={c['hits']} miss={c['misses']} hit_rate={c['hit_rate']} "
+            f"load_avg_ms={c['load_avg_ms']} load_max_ms={c['load_max_ms']} "
+            f"evictions={c['evictions']} kb={c['bytes'] // 1024}"
+        ),
     ]
     return _fit_message("\n".join(lines))
 
 
+@_instrumented(lambda u: "cmd:health")
 async def cmd_health(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not _is_authorized(update):
         await update.message.reply_text("⛔ Доступ запрещен")
@@ -2010,6 +2666,7 @@ async def cmd_health(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     await update.message.reply_text(text)
 
 
+@_instrumented(lambda u: "cmd:selftest")
 async def cmd_selftest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not _is_authorized(update):
         await update.message.reply_text("⛔ Доступ запрещен")
@@ -2018,10 +2675,58 @@ async def cmd_selftest(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await update.message.reply_text(text)
 
 
+def _metrics_gauges() -> dict[str, float]:
+    c = _cache_stats()
+    gauges = {
+        "cache_entries": c["entries"],
+        "cache_bytes": c["bytes"],
+        "cache_hits_total": c["hits"],
+        "cache_misses_total": c["misses"],
+        "cache_evictions_total": c["evictions"],
+        "router_rows": len(_ROUTER_STORE),
+    }
+    if _OUTBOX is not None:
+        for k, v in _OUTBOX.stats.items():
+            gauges[f"outbox_{k}_total"] = v
+    return gauges
+
+
+def _metrics_text() -> str:
+    c = _cache_stats()
+    extra = {
+        "cache": f"hit_rate={c['hit_rate']} entries={c['entries']} kb={c['bytes'] // 1024} evictions={c['evictions']}",
+        "router_rows": len(_ROUTER_STORE),
+        "outbox": _OUTBOX.stats if _OUTBOX else "idle",
+        "http": f"127.0.0.1:{METRICS_HTTP_PORT}/metrics" if METRICS_HTTP_PORT else "off",
+    }
+    return "Metrics\n\n" + METRICS.render_text(extra)
+
+
+async def cmd_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not _is_authorized(update):
+        await update.message.reply_text("⛔ Доступ запрещен")
+        return
+    text = await asyncio.to_thread(_metrics_text)
+    await update.message.reply_text(_fit_message(text))
+
+
+async def cmd_profile(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/profile N — cProfile of the next N button presses / messages (admin chat only)."""
+    if not _is_authorized(update):
+        await update.message.reply_text("⛔ Доступ запрещен")
+        return
+    args = getattr(context, "args", None) or []
+    n = int(args[0]) if args and str(args[0]).isdigit() else 5
+    n = max(1, min(n, 50))
+    _PROFILER.start(n, update.effective_chat.id)
+    await update.message.reply_text(f"Профилирую следующие {n} действий. Отчёт придёт сообщением.")
+
+
 # =========================
 # Handlers
 # =========================
 
+@_instrumented(lambda u: "cmd:start")
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if not _is_authorized(update):
         await update.message.reply_text("⛔ Доступ запрещен")
@@ -2032,9 +2737,8 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     state = _get_chat_state(chat_id)
     existing_id = state.get("dashboard_message_id")
 
-    text = await asyncio.to_thread(build_dashboard_text)
-    summary = await asyncio.to_thread(_build_dashboard_summary)
-    kb = _dashboard_keyboard(summary)
+    view = await asyncio.to_thread(_dashboard_view)
+    text, kb = view.text, view.keyboard
 
     if isinstance(existing_id, int):
         try:
@@ -2054,6 +2758,7 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     _set_chat_state(chat_id, {"dashboard_message_id": msg.message_id, "mode": None})
 
 
+@_instrumented(lambda u: "cb:" + (u.callback_query.data or "").split(":", 1)[0])
 async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     try:
@@ -2066,13 +2771,14 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
     cb = query.data or ""
+    _screen_changed(update.effective_chat.id)
     try:
         if cb == "dashboard":
             await show_dashboard(query)
         elif cb == "mail":
             await show_mail(query)
         elif cb == "mail_run":
-            await run_pipeline(query)
+            await run_pipeline(query, context)
         elif cb == "payables":
             await show_payables(query)
         elif cb == "risk_report":
@@ -2089,6 +2795,9 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             await show_invoices(query)
         elif cb == "search":
             await show_search_prompt(query)
+        elif cb.startswith("search_page:"):
+            _, token, offset = (cb.split(":", 2) + ["", ""])[:3]
+            await show_search_page(query, token, int(offset) if offset.isdigit() else 0)
         elif cb == "ai_open":
             await open_ai_mode(query)
         elif cb == "notify_menu":
@@ -2108,25 +2817,60 @@ async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await _edit(query, "Ошибка интерфейса. Нажми «Панель» и повтори.", _back_kb())
 
 
-def main() -> None:
-    token = TOKEN_FILE.read_text(encoding="utf-8").strip()
+async def _post_init(application: Application) -> None:
+    application.create_task(loop_lag_monitor(METRICS))
+    if METRICS_HTTP_PORT:
+        try:
+            start_http_server(
+                METRICS_HTTP_PORT,
+                lambda: METRICS.render_prometheus(_metrics_gauges()),
+            )
+            _log_runtime(f"metrics http on 127.0.0.1:{METRICS_HTTP_PORT}")
+        except OSError as e:
+            _log_runtime(f"metrics http failed: {type(e).__name__}: {e}")
+
 
-    application = Application.builder().token(token).concurrent_updates(False).build()
+def build_application(token: str, request=None) -> Application:
+    """
+    Application with all handlers and background jobs.
+    request: optional telegram.request.BaseRequest (bot_loadtest.py passes an
+    offline fake transport).
+    """
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(ChatKeyedUpdateProcessor(UPDATE_CONCURRENCY))
+        .post_init(_post_init)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", cmd_start))
     application.add_handler(CommandHandler("health", cmd_health))
     application.add_handler(CommandHandler("selftest", cmd_selftest))
+    application.add_handler(CommandHandler("metrics", cmd_metrics))
+    application.add_handler(CommandHandler("profile", cmd_profile))
     application.add_handler(CallbackQueryHandler(on_callback))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
 
     # Background notifications for one authorized chat.
     if application.job_queue is not None:
-        application.job_queue.run_repeating(_notification_tick, interval=NOTIFY_INTERVAL_MIN * 60, first=30)
+        application.job_queue.run_repeating(_notification_tick, interval=NOTIFY_POLL_S, first=30)
         application.job_queue.run_repeating(_nightly_selftest_tick, interval=1800, first=120)
+    return application
+
+
+def main() -> None:
+    token = TOKEN_FILE.read_text(encoding="utf-8").strip()
+    application = build_application(token)
 
     _log_runtime("bot start")
     print("[OK] Telegram dashboard bot running...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+    try:
+        application.run_polling(allowed_updates=Update.ALL_TYPES, drop_pending_updates=True)
+    finally:
+        _CHAT_STATE.flush()
 
 
 if __name__ == "__main__":
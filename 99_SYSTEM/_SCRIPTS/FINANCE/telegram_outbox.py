@@ -0,0 +1,178 @@
+"""
+Outbound message scheduler for the Telegram dashboard bot.
+
+- Priority: lower number goes first inside a chat (errors, then SLA, then nags).
+- Coalescing: messages queued for the same chat within coalesce_s are merged
+  into as few messages as fit under msg_limit.
+- Rate limits: token buckets per chat and global (bursts up to the bucket size
+  go out immediately); Telegram's retry_after (HTTP 429) is honored and the
+  same message is retried, other errors back off exponentially.
+
+enqueue() returns a future that resolves to True once the message carrying the
+text was delivered (False if it was given up on), so callers can persist
+"already sent" state only after delivery.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Awaitable, Callable, Optional
+
+PRIORITY_ERROR = 0
+PRIORITY_RISK = 1
+PRIORITY_SLA = 2
+PRIORITY_QUOTES = 3
+PRIORITY_INFO = 5
+
+MERGE_SEPARATOR = "\n\n" + "—" * 12 + "\n\n"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    def delay(self) -> float:
+        """Seconds until one token is available (0 = now)"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+
+@dataclass(order=True)
+class _Outgoing:
+    priority: int
+    seq: int
+    text: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+def retry_after_s(exc: Exception) -> Optional[float]:
+    """retry_after of a telegram RetryAfter error (int or timedelta), else None"""
+    ra = getattr(exc, "retry_after", None)
+    if isinstance(ra, timedelta):
+        return ra.total_seconds()
+    if isinstance(ra, (int, float)):
+        return float(ra)
+    return None
+
+
+class Outbox:
+    def __init__(
+        self,
+        send: Callable[[int, str], Awaitable],
+        msg_limit: int = 3900,
+        chat_rate: float = 1.0,
+        chat_burst: int = 5,
+        global_rate: float = 25.0,
+        global_burst: int = 30,
+        coalesce_s: float = 0.5,
+        max_attempts: int = 4,
+        log: Optional[Callable[[str], None]] = None,
+    ):
+        self._send = send
+        self.msg_limit = msg_limit
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.coalesce_s = coalesce_s
+        self.max_attempts = max_attempts
+        self._log = log or (lambda _msg: None)
+
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._pending: dict[int, list[_Outgoing]] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self._seq = itertools.count()
+        self.stats = {"queued": 0, "sent": 0, "merged": 0, "retry_after": 0, "failed": 0}
+
+    def enqueue(self, chat_id: int, text: str, priority: int = PRIORITY_INFO) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        text = (text or "").strip()
+        if len(text) > self.msg_limit:
+            text = text[: self.msg_limit]
+        self._pending.setdefault(chat_id, []).append(_Outgoing(priority, next(self._seq), text, fut))
+        self.stats["queued"] += 1
+        if chat_id not in self._workers or self._workers[chat_id].done():
+            self._workers[chat_id] = loop.create_task(self._chat_worker(chat_id))
+        return fut
+
+    async def send(self, chat_id: int, text: str, priority: int = PRIORITY_INFO) -> bool:
+        """Enqueue and wait for delivery"""
+        return await self.enqueue(chat_id, text, priority)
+
+    def _pack(self, items: list[_Outgoing]) -> list[list[_Outgoing]]:
+        batches: list[list[_Outgoing]] = []
+        cur: list[_Outgoing] = []
+        size = 0
+        for item in sorted(items):
+            add = len(item.text) + (len(MERGE_SEPARATOR) if cur else 0)
+            if cur and size + add > self.msg_limit:
+                batches.append(cur)
+                cur, size, add = [], 0, len(item.text)
+            cur.append(item)
+            size += add
+        if cur:
+            batches.append(cur)
+        return batches
+
+    async def _chat_worker(self, chat_id: int) -> None:
+        bucket = self._chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+        while self._pending.get(chat_id):
+            # let the rest of a burst arrive, then send it merged
+            await asyncio.sleep(self.coalesce_s)
+            items = self._pending.pop(chat_id, [])
+            # new items may arrive while delivering; they are picked up by the next round
+            for batch in self._pack(items):
+                await self._deliver(chat_id, bucket, batch)
+
+    async def _deliver(self, chat_id: int, bucket: TokenBucket, batch: list[_Outgoing]) -> None:
+        text = MERGE_SEPARATOR.join(item.text for item in batch)
+        ok = False
+        attempt = 0
+        while attempt < self.max_attempts:
+            wait = max(bucket.delay(), self._global.delay())
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            bucket.take()
+            self._global.take()
+            try:
+                await self._send(chat_id, text)
+                ok = True
+                break
+            except Exception as e:
+                ra = retry_after_s(e)
+                if ra is not None:
+                    # flood control: not the message's fault, wait as told and retry
+                    self.stats["retry_after"] += 1
+                    self._log(f"outbox: retry_after={ra:.0f}s chat={chat_id}")
+                    await asyncio.sleep(ra)
+                    continue
+                attempt += 1
+                self._log(f"outbox: send failed ({attempt}/{self.max_attempts}) chat={chat_id}: {type(e).__name__}: {e}")
+                if attempt < self.max_attempts:
+                    await asyncio.sleep(min(30.0, 2.0 ** attempt))
+
+        if ok:
+            self.stats["sent"] += 1
+            self.stats["merged"] += len(batch) - 1
+        else:
+            self.stats["failed"] += len(batch)
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result(ok)
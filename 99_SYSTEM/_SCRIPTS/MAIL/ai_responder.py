@@ -14,10 +14,16 @@ Workflow:
 import json
 import re
 import csv
+import sys
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Dict, Optional, Tuple
 
+sys.path.insert(0, str(Path(__file__).parent))
+from thread_index import ThreadIndex, format_thread
+from reply_vectors import similar_replies, format_examples
+from telegram_client import TelegramError, load_credentials, shared_client
+
 # AI/LLM integration
 try:
     import anthropic
@@ -48,8 +54,13 @@ CLAUDE_KEY_FILE = SECRETS_DIR / "claude_api_key.txt"
 TELEGRAM_TOKEN_FILE = SECRETS_DIR / "telegram_bot_token.txt"
 TELEGRAM_CHAT_FILE = SECRETS_DIR / "telegram_chat_id.txt"
 
+REPLIES_JSONL = ROOT / "_COLLECT_DROP" / "REPLIES_TRAINING" / "replies_2023_2026.jsonl"
+
 RESPONDER_PROMPT_FILE = ROOT / "CORE" / "AI_RESPONDER_PROMPT.md"
 RESPONDER_LOG = LOG_DIR / "responder_log.csv"
+# message_id -> email_id of drafts sent for approval (read by telegram_approval_listener.py)
+APPROVAL_MESSAGES_FILE = LOG_DIR / "telegram_approval_messages.json"
+APPROVAL_MESSAGES_KEEP = 1000
 
 STATE_FILE = RESPONDER_QUEUE / "state.json"
 
@@ -79,10 +90,9 @@ def get_claude_api_key() -> str:
 
 def get_telegram_credentials() -> Tuple[str, str]:
     """Load Telegram bot token and chat ID"""
-    if not TELEGRAM_TOKEN_FILE.exists() or not TELEGRAM_CHAT_FILE.exists():
+    token, chat_id = load_credentials(TELEGRAM_TOKEN_FILE, TELEGRAM_CHAT_FILE)
+    if not token or not chat_id:
         raise FileNotFoundError("Telegram credentials missing")
-    token = TELEGRAM_TOKEN_FILE.read_text(encoding="utf-8").strip()
-    chat_id = TELEGRAM_CHAT_FILE.read_text(encoding="utf-8").strip()
     return token, chat_id
 
 def extract_text_from_email(meta_json: Path) -> Tuple[str, str, str]:
@@ -119,6 +129,23 @@ def extract_text_from_attachments(meta_json: Path, max_chars: int = 2000) -> str
     except Exception:
         return ""
 
+_THREAD_INDEX: Optional[ThreadIndex] = None
+
+def load_conversation_context(meta_json: Path, max_chars: int = 3000) -> str:
+    """Earlier messages of the same Gmail thread from the replies export (O(thread size))"""
+    global _THREAD_INDEX
+    try:
+        meta = json.loads(meta_json.read_text(encoding="utf-8"))
+        if _THREAD_INDEX is None:
+            _THREAD_INDEX = ThreadIndex.open(REPLIES_JSONL)
+        for key in (meta.get("thread_id"), meta.get("gmail_id"), meta.get("rfc_message_id")):
+            rows = _THREAD_INDEX.load_thread(key or "")
+            if rows:
+                return format_thread(rows, max_chars=max_chars)
+    except Exception:
+        pass
+    return ""
+
 def generate_ai_response(client_message: str, prompt: str) -> Dict:
     """
     Call Claude API to generate response draft
@@ -189,27 +216,38 @@ def generate_ai_response(client_message: str, prompt: str) -> Dict:
             "next_step": "Review in Telegram"
         }
 
-def send_telegram_notification(token: str, chat_id: str, message: str, parse_mode: str = "HTML") -> bool:
-    """Send message to Telegram"""
+def remember_approval_message(message_id, email_id: str):
+    """Reaction updates carry only the message id: keep which draft it was"""
+    try:
+        data = json.loads(APPROVAL_MESSAGES_FILE.read_text(encoding="utf-8"))
+        if not isinstance(data, dict):
+            data = {}
+    except Exception:
+        data = {}
+    data[str(message_id)] = email_id
+    if len(data) > APPROVAL_MESSAGES_KEEP:
+        data = dict(list(data.items())[-APPROVAL_MESSAGES_KEEP:])
+    APPROVAL_MESSAGES_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = APPROVAL_MESSAGES_FILE.with_name(APPROVAL_MESSAGES_FILE.name + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(APPROVAL_MESSAGES_FILE)
+
+def send_telegram_notification(token: str, chat_id: str, message: str, parse_mode: str = "HTML",
+                               email_id: Optional[str] = None) -> bool:
+    """Send message to Telegram (email_id: draft awaiting a ✅/❌ reaction)"""
     if DRY_RUN:
         print(f"[DRY_RUN] Would send to Telegram:\n{message}")
         return True
     
     try:
-        from urllib import request, parse
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        data = parse.urlencode({
-            "chat_id": chat_id,
-            "text": message,
-            "parse_mode": parse_mode
-        }).encode("utf-8")
-        
-        req = request.Request(url, data=data)
-        with request.urlopen(req, timeout=10) as response:
-            return response.status == 200
-    except Exception as e:
+        sent = shared_client(token).send_message(chat_id, message, parse_mode=parse_mode)
+    except TelegramError as e:
         print(f"Telegram error: {e}")
         return False
+    if email_id:
+        # the "Original email ID" line is at the end: react to the last part
+        remember_approval_message(sent[-1]["message_id"], email_id)
+    return True
 
 def log_responder_action(email_from: str, subject: str, action: str, client_type: str, confidence: float):
     """Log action to CSV"""
@@ -243,6 +281,9 @@ def process_email(meta_json_path: Path, prompt: str) -> bool:
         # Extract email content
         subject, from_addr, body = extract_text_from_email(meta_json_path)
         attachment_text = extract_text_from_attachments(meta_json_path)
+        conversation = load_conversation_context(meta_json_path)
+        # Closest past replies (local vector index, no network)
+        examples = format_examples(similar_replies(f"{subject}\n{body}", k=3))
         
         # Combine for AI analysis
         full_message = f"""
@@ -254,6 +295,12 @@ Body:
 
 Attachments content (if any):
 {attachment_text}
+
+Earlier conversation with this client (if any):
+{conversation}
+
+Similar past replies from AlisMeble (style reference, if any):
+{examples}
 """
         
         # Generate AI response
@@ -293,7 +340,7 @@ Original email ID: {meta_json_path.stem}
         
         # Send to Telegram
         token, chat_id = get_telegram_credentials()
-        send_telegram_notification(token, chat_id, telegram_message, parse_mode="HTML")
+        send_telegram_notification(token, chat_id, telegram_message, parse_mode="HTML", email_id=meta_json_path.stem)
         
         # Save draft for reference
         draft_file = DRAFTS_DIR / f"{meta_json_path.stem}_draft.json"
@@ -2,14 +2,20 @@
 """
 Index email metadata + PDF content for search.
 Creates searchable index of all emails in router log + their content.
+Also writes a trigram sidecar (email_index.trgm.json) for diacritic-insensitive,
+typo-tolerant search: "wyciag" finds "wyciąg", "skladka" finds "składka".
 """
 
 import csv
 import json
 import re
+import sys
 from pathlib import Path
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).parent))
+from text_search import TrigramIndex, fold
+
 try:
     import pdfplumber
     PDF_AVAILABLE = True
@@ -19,6 +25,7 @@ except ImportError:
 ROOT = Path(r"C:\Users\alimg\Dropbox\Archiwum 3.0")
 ROUTER_LOG = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "router_log.csv"
 INDEX_FILE = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "email_index.jsonl"
+TRIGRAM_FILE = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "email_index.trgm.json"
 
 DEST_DIRS = {
     "KLIENTS": ROOT / "02_KLIENCI" / "_INBOX",
@@ -62,6 +69,8 @@ def build_search_keywords(email: dict) -> list:
         text = email.get(field, '').lower()
         words = re.findall(r'\b\w+\b', text)
         keywords.update(words)
+        # Diacritic-free variants (wyciąg -> wyciag)
+        keywords.update(fold(w) for w in words)
     
     # Extract numbers (amounts, dates, IDs)
     amounts = re.findall(r'\d+[.,]\d{2}', email.get('subject', ''))
@@ -88,9 +97,13 @@ def main():
         return
     
     indexed = 0
+    trigram_index = TrigramIndex()
+    offsets = []
+    offset = 0
     with ROUTER_LOG.open('r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
-        with INDEX_FILE.open('w', encoding='utf-8') as idx:
+        # newline='\n' keeps byte offsets exact on Windows
+        with INDEX_FILE.open('w', encoding='utf-8', newline='\n') as idx:
             for row in reader:
                 # Extract content from attachment
                 decision = row.get('decision', '')
@@ -117,21 +130,59 @@ def main():
                     "content_preview": content[:200],
                 }
                 
-                idx.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                line = json.dumps(entry, ensure_ascii=False) + '\n'
+                idx.write(line)
+                offsets.append(offset)
+                offset += len(line.encode('utf-8'))
+                trigram_index.add(" ".join([
+                    entry["subject"], entry["from"], file_name, content[:200],
+                ]))
                 indexed += 1
+
+    trigram_index.save(TRIGRAM_FILE, extra={"offsets": offsets})
     
     print(f"Indexed: {indexed} emails")
     print(f"Index file: {INDEX_FILE}")
+    print(f"Trigram index: {TRIGRAM_FILE}")
+
+
+def fuzzy_search(query: str, limit: int = 10) -> list:
+    """
+    Diacritic-insensitive trigram search.
+    Returns [(score, entry)]; only matching lines are read from email_index.jsonl.
+    """
+    if not TRIGRAM_FILE.exists() or not INDEX_FILE.exists():
+        return []
+
+    trigram_index, payload = TrigramIndex.load(TRIGRAM_FILE)
+    offsets = payload.get("offsets") or []
+    hits = trigram_index.search(query, limit=limit)
+
+    results = []
+    with INDEX_FILE.open('rb') as f:
+        for doc_id, score in hits:
+            if doc_id >= len(offsets):
+                continue
+            f.seek(offsets[doc_id])
+            try:
+                entry = json.loads(f.readline().decode('utf-8'))
+            except Exception:
+                continue
+            results.append((score, entry))
+    return results
 
 
-def search(query: str, limit: int = 10):
-    """Search emails by keywords"""
+def search(query: str, limit: int = 10, fuzzy: bool = True):
+    """Search emails by keywords (fuzzy=True uses the trigram index when present)"""
     if not INDEX_FILE.exists():
         print("Index not built yet. Run main() first.")
         return
     
     query_lower = query.lower()
-    results = []
+    results = fuzzy_search(query, limit) if fuzzy else []
+    if results:
+        _print_results(query, results, limit)
+        return
     
     with INDEX_FILE.open('r', encoding='utf-8') as f:
         for line in f:
@@ -153,7 +204,10 @@ def search(query: str, limit: int = 10):
     
     # Sort by score
     results.sort(key=lambda x: x[0], reverse=True)
-    
+    _print_results(query, results, limit)
+
+
+def _print_results(query: str, results: list, limit: int):
     print(f"\nSearch results for '{query}' ({len(results)} matches):\n")
     for score, entry in results[:limit]:
         print(f"[{entry['payment_risk'].upper()}] {entry['subject']}")
@@ -164,4 +218,7 @@ def search(query: str, limit: int = 10):
 
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        search(" ".join(sys.argv[1:]))
+    else:
+        main()
@@ -7,8 +7,12 @@ Date: 2026-02-02
 
 import json
 import os
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+from reply_vectors import similar_replies, format_examples
+
 try:
     from anthropic import Anthropic
     ANTHROPIC_AVAILABLE = True
@@ -111,6 +115,11 @@ def evaluate_client_email(subject: str, body_preview: str) -> dict:
         for ex in EXAMPLES
     ])
     
+    # Nearest past replies (local vector index) as extra context
+    similar = format_examples(similar_replies(f"{subject}\n{body_preview}", k=2), body_chars=300)
+    if similar:
+        examples_text += f"\nPodobne wcześniejsze odpowiedzi AlisMeble:\n{similar}\n"
+    
     prompt = f"""Jesteś ekspertem w ocenie emaili dla biznesu meblowego w Polsce.
 
 Oceń email klienta na podstawie tematu i zawartości. Użyj JSON bez wyjaśnień.
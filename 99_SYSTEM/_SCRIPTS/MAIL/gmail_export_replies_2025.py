@@ -7,11 +7,15 @@ from datetime import datetime
 from pathlib import Path
 from email import policy
 from email.parser import BytesParser
+import sys
 
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+sys.path.insert(0, str(Path(__file__).parent))
+from thread_index import update_thread_index
+
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
 def safe_name(s: str, max_len: int = 120) -> str:
@@ -102,6 +106,9 @@ def main():
         to_ = get_header(msg, "To")
         frm = get_header(msg, "From")
         thread_id = msg.get("threadId", "")
+        rfc_id = get_header(msg, "Message-ID")
+        in_reply_to = get_header(msg, "In-Reply-To")
+        references = get_header(msg, "References")
 
         # Create folder per message
         folder = msg_root / f"{dt_utc}__{mid}"
@@ -147,6 +154,9 @@ def main():
         meta = {
             "message_id": mid,
             "thread_id": thread_id,
+            "rfc_message_id": rfc_id,
+            "in_reply_to": in_reply_to,
+            "references": references,
             "date_utc": dt_utc,
             "from": frm,
             "to": to_,
@@ -166,8 +176,10 @@ def main():
             # если pdf не скачался — папка остаётся как диагностика
             pass
 
+    threads = update_thread_index(index_path)
     print(f"DONE. Indexed messages with PDF: {processed}")
     print(f"INDEX: {index_path}")
+    print(f"THREADS: {len(threads.threads)} -> {threads.index_path}")
 
 if __name__ == "__main__":
     main()
@@ -3,12 +3,17 @@ import base64
 import json
 import os
 import re
+import sys
 from datetime import datetime, timezone
+from pathlib import Path
 
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+sys.path.insert(0, str(Path(__file__).parent))
+from thread_index import update_thread_index
+
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
 def ensure_creds(token_path: str, client_path: str) -> Credentials:
@@ -119,6 +124,9 @@ def main():
             cc = get_header(headers, "Cc")
             frm = get_header(headers, "From")
             date_h = get_header(headers, "Date")
+            rfc_id = get_header(headers, "Message-ID")
+            in_reply_to = get_header(headers, "In-Reply-To")
+            references = get_header(headers, "References")
 
             internal_ms = int(msg.get("internalDate", "0"))
             dt_utc = datetime.fromtimestamp(internal_ms / 1000, tz=timezone.utc).isoformat()
@@ -139,6 +147,9 @@ def main():
             row = {
                 "message_id": msg.get("id"),
                 "thread_id": msg.get("threadId"),
+                "rfc_message_id": rfc_id,
+                "in_reply_to": in_reply_to,
+                "references": references,
                 "dt_utc": dt_utc,
                 "from": frm,
                 "to": to,
@@ -151,7 +162,9 @@ def main():
             }
             f.write(json.dumps(row, ensure_ascii=False) + "\n")
 
+    idx = update_thread_index(Path(args.out))
     print(f"DONE. OUT={args.out}")
+    print(f"THREADS: {len(idx.threads)} -> {idx.index_path}")
 
 if __name__ == "__main__":
     main()
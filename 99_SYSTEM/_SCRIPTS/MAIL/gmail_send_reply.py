@@ -7,8 +7,17 @@ Workflow:
 1. ai_responder.py sends draft to Telegram
 2. You react with ✅ (approve) or ❌ (skip)
 3. telegram_approval_listener.py detects reaction
-4. Calls gmail_send_reply.py to send response to client
+4. Hands the approval to reply_dispatcher.py (in-process, warm Gmail client)
+   or runs this script: python gmail_send_reply.py <email_id> <approve|skip>
 5. Marks email as processed
+
+deliver_approval() is the shared core: it takes an already built Gmail
+service, returns a status and raises SendError for Gmail failures worth
+retrying. A reply with an archived <email_id>_sent.json is never sent twice.
+A timeout on messages.send is ambiguous (Gmail may have accepted it), so
+every send first looks for a message we sent into the thread (meta
+"thread_id") after the draft was written; when the thread cannot be
+checked, DeliveryUnknown is raised and nothing is retried.
 """
 
 import json
@@ -22,6 +31,7 @@ try:
     from google_auth_oauthlib.flow import InstalledAppFlow
     from google.auth.transport.requests import Request
     from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
     GMAIL_AVAILABLE = True
 except ImportError:
     GMAIL_AVAILABLE = False
@@ -49,15 +59,33 @@ SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
 # Behavior
 DRY_RUN = False
 
+# Gmail HTTP statuses worth retrying (rate limit, transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# deliver_approval() results
+STATUS_SENT = "sent"
+STATUS_SKIPPED = "skipped"
+STATUS_ALREADY_SENT = "already_sent"
+STATUS_PENDING_MANUAL = "pending_manual"
+STATUS_FAILED = "failed"
+
+
+class SendError(Exception):
+    """Gmail call failed in a way that may succeed on retry"""
+
+
+class DeliveryUnknown(Exception):
+    """messages.send failed after the request may have gone out; not retried"""
+
 # =====================
 # GMAIL AUTH
 # =====================
 
-def get_gmail_service():
-    """Authenticate and return Gmail service"""
+def get_gmail_credentials():
+    """Load (refresh / re-authorize if needed) Gmail OAuth credentials"""
     if not GMAIL_AVAILABLE:
         raise ImportError("Google API client not available")
-    
+
     creds = None
     
     # Load token if exists
@@ -77,59 +105,96 @@ def get_gmail_service():
         # Save token
         with open(TOKEN_JSON, "w") as token:
             token.write(creds.to_json())
-    
-    return build("gmail", "v1", credentials=creds)
+
+    return creds
+
+def get_gmail_service(creds=None):
+    """Authenticate and return Gmail service (one per thread: the HTTP client is not thread-safe)"""
+    return build("gmail", "v1", credentials=creds or get_gmail_credentials(), cache_discovery=False)
 
 # =====================
 # SEND EMAIL
 # =====================
 
-def send_email_reply(service, original_message_id: str, to: str, subject: str, body: str) -> bool:
+def send_email_reply(service, thread_id: str, to: str, subject: str, body: str) -> bool:
     """
     Send reply to original email via Gmail API
     
     Args:
         service: Gmail service object
-        original_message_id: Gmail message ID to reply to
+        thread_id: Gmail thread ID to reply into (meta "thread_id")
         to: Recipient email
         subject: Email subject (auto-prefixed with "Re: ")
         body: Email body (plain text)
     """
     try:
-        import base64
-        from email.mime.text import MIMEText
-        
-        # Create reply subject
-        if not subject.startswith("Re:"):
-            subject = f"Re: {subject}"
-        
-        # Create message
-        message = MIMEText(body, "plain", "utf-8")
-        message["to"] = to
-        message["subject"] = subject
-        
-        # Encode
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        
-        if DRY_RUN:
-            print(f"[DRY_RUN] Would send email to {to}:")
-            print(f"Subject: {subject}")
-            print(f"Body:\n{body}")
-            return True
-        
-        # Send via Gmail API
-        send_message = {
-            "raw": raw_message,
-            "threadId": original_message_id  # Reply to thread
-        }
-        
-        service.users().messages().send(userId="me", body=send_message).execute()
-        return True
-    
+        return send_email_reply_or_raise(service, thread_id, to, subject, body)
     except Exception as e:
         print(f"Error sending email: {e}")
         return False
 
+def send_email_reply_or_raise(service, thread_id: str, to: str, subject: str, body: str) -> bool:
+    """send_email_reply() that raises: SendError if retrying may help"""
+    import base64
+    from email.mime.text import MIMEText
+
+    # Create reply subject
+    if not subject.startswith("Re:"):
+        subject = f"Re: {subject}"
+    
+    # Create message
+    message = MIMEText(body, "plain", "utf-8")
+    message["to"] = to
+    message["subject"] = subject
+    
+    # Encode
+    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+    
+    if DRY_RUN:
+        print(f"[DRY_RUN] Would send email to {to}:")
+        print(f"Subject: {subject}")
+        print(f"Body:\n{body}")
+        return True
+    
+    # Send via Gmail API
+    send_message = {
+        "raw": raw_message,
+        "threadId": thread_id  # Reply to thread
+    }
+    
+    try:
+        service.users().messages().send(userId="me", body=send_message).execute()
+    except HttpError as e:
+        if e.resp.status in RETRY_STATUSES:
+            raise SendError(f"Gmail HTTP {e.resp.status}") from e
+        raise
+    except OSError as e:
+        # connection reset / timeout: retried only when the thread can be
+        # checked for this reply first (deliver_approval does that)
+        if thread_id:
+            raise SendError(f"{type(e).__name__}: {e}") from e
+        raise DeliveryUnknown(f"{type(e).__name__}: {e}; check the Sent folder") from e
+    return True
+
+def reply_in_thread(service, thread_id: str, since_ts: float) -> bool:
+    """True if the thread holds a message we sent at/after since_ts (epoch seconds).
+    Raises DeliveryUnknown when the thread cannot be looked up."""
+    try:
+        thread = service.users().threads().get(userId="me", id=thread_id, format="minimal").execute()
+    except HttpError as e:
+        if e.resp.status == 404:
+            raise DeliveryUnknown(f"Gmail thread {thread_id} not found; check the Sent folder") from e
+        if e.resp.status in RETRY_STATUSES:
+            raise SendError(f"Gmail HTTP {e.resp.status} (thread check)") from e
+        raise
+    except OSError as e:
+        raise SendError(f"{type(e).__name__}: {e} (thread check)") from e
+    since_ms = since_ts * 1000
+    return any(
+        "SENT" in m.get("labelIds", []) and int(m.get("internalDate", 0)) >= since_ms
+        for m in thread.get("messages", [])
+    )
+
 def get_gmail_thread_info(service, message_id: str) -> dict:
     """Get email thread info (To, Subject) from Gmail"""
     try:
@@ -162,70 +227,96 @@ def process_approved_draft(draft_file: Path, approval_action: str) -> bool:
         draft_file: Path to draft JSON file
         approval_action: "approve" or "skip"
     """
-    
-    if approval_action == "skip":
-        print(f"Skipping {draft_file.stem}")
-        log_approval(draft_file.stem, "skip", "User rejected")
-        return True
-    
-    if approval_action != "approve":
-        return False
-    
+    email_id = draft_file.stem.replace("_draft", "")
     try:
-        # Load draft
-        draft_data = json.loads(draft_file.read_text(encoding="utf-8"))
-        draft_response = draft_data.get("draft_response_PL", "")
-        
-        if not draft_response:
-            print(f"No response in {draft_file}")
-            return False
-        
-        # Find original email metadata
-        email_id = draft_file.stem.replace("_draft", "")
-        meta_file = CASES_INBOX / f"{email_id}.meta.json"
-        
-        if not meta_file.exists():
-            print(f"Meta file not found: {meta_file}")
-            return False
-        
-        # Extract recipient and subject
-        meta_data = json.loads(meta_file.read_text(encoding="utf-8"))
-        to_email = meta_data.get("from", "")
-        subject = meta_data.get("subject", "Odpowiedź")
-        gmail_message_id = meta_data.get("gmail_id", "")
-        
-        if not to_email:
-            print(f"No recipient email found in {meta_file}")
-            return False
-        
-        # Send email
-        if not GMAIL_AVAILABLE:
-            print("Gmail API not available, saving for manual send")
-            save_pending_send(email_id, to_email, subject, draft_response)
-            return True
-        
-        service = get_gmail_service()
-        
-        if send_email_reply(service, gmail_message_id, to_email, subject, draft_response):
-            # Save sent response
-            save_sent_response(email_id, to_email, subject, draft_response)
-            log_approval(email_id, "approved_and_sent", f"Sent to {to_email}")
-            
-            # Move meta file to processed
-            archive_path = CASES_INBOX / "_PROCESSED" / f"{email_id}.meta.json"
-            archive_path.parent.mkdir(parents=True, exist_ok=True)
-            meta_file.rename(archive_path)
-            
-            print(f"✅ Sent response to {to_email}")
-            return True
-        else:
-            print(f"Failed to send email to {to_email}")
-            log_approval(email_id, "send_failed", "Gmail API error")
-            return False
-    
+        status, _ = deliver_approval(email_id, approval_action)
+    except SendError as e:
+        print(f"Failed to send email: {e}")
+        log_approval(email_id, "send_failed", f"Gmail API error: {e}")
+        return False
     except Exception as e:
         print(f"Error processing approval: {e}")
         return False
+    return status != STATUS_FAILED
+
+def deliver_approval(email_id: str, approval_action: str, service=None) -> tuple:
+    """
+    Send (or skip) one approved draft: (status, note).
+    service: warm Gmail service; built on demand when None.
+    Raises SendError when a retry may succeed.
+    """
+    if approval_action == "skip":
+        print(f"Skipping {email_id}")
+        log_approval(email_id, "skip", "User rejected")
+        return STATUS_SKIPPED, "User rejected"
+
+    if approval_action != "approve":
+        return STATUS_FAILED, f"Unknown action: {approval_action}"
+
+    # idempotency: a sent reply is archived before anything else happens
+    if (SENT_DIR / f"{email_id}_sent.json").exists():
+        print(f"Already sent: {email_id}")
+        return STATUS_ALREADY_SENT, "Reply already archived as sent"
+
+    # Load draft
+    draft_file = DRAFTS_DIR / f"{email_id}_draft.json"
+    if not draft_file.exists():
+        print(f"Draft file not found: {draft_file}")
+        return STATUS_FAILED, "Draft file not found"
+    draft_data = json.loads(draft_file.read_text(encoding="utf-8"))
+    draft_response = draft_data.get("draft_response_PL", "")
+
+    if not draft_response:
+        print(f"No response in {draft_file}")
+        return STATUS_FAILED, "Empty draft"
+
+    # Find original email metadata
+    meta_file = CASES_INBOX / f"{email_id}.meta.json"
+
+    if not meta_file.exists():
+        print(f"Meta file not found: {meta_file}")
+        return STATUS_FAILED, "Meta file not found"
+
+    # Extract recipient and subject
+    meta_data = json.loads(meta_file.read_text(encoding="utf-8"))
+    to_email = meta_data.get("from", "")
+    subject = meta_data.get("subject", "Odpowiedź")
+    # threadId of the original message (written by import_gmail_attachments.py);
+    # gmail_id is a message id and only matches the thread for its first message
+    thread_id = meta_data.get("thread_id", "")
+
+    if not to_email:
+        print(f"No recipient email found in {meta_file}")
+        return STATUS_FAILED, "No recipient"
+
+    # Send email
+    if not GMAIL_AVAILABLE:
+        print("Gmail API not available, saving for manual send")
+        save_pending_send(email_id, to_email, subject, draft_response)
+        return STATUS_PENDING_MANUAL, "Gmail API not available"
+
+    if service is None:
+        service = get_gmail_service()
+
+    # an earlier attempt that timed out may have been delivered after all
+    if thread_id and not DRY_RUN and reply_in_thread(service, thread_id, draft_file.stat().st_mtime):
+        status, note = STATUS_ALREADY_SENT, f"Reply to {to_email} already in the Gmail thread"
+        log_approval(email_id, "already_in_thread", note)
+    else:
+        send_email_reply_or_raise(service, thread_id, to_email, subject, draft_response)
+        status, note = STATUS_SENT, f"Sent to {to_email}"
+        log_approval(email_id, "approved_and_sent", note)
+
+    # Save sent response
+    save_sent_response(email_id, to_email, subject, draft_response)
+
+    # Move meta file to processed
+    archive_path = CASES_INBOX / "_PROCESSED" / f"{email_id}.meta.json"
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    meta_file.rename(archive_path)
+
+    print(f"✅ {note}")
+    return status, note
 
 def save_sent_response(email_id: str, to: str, subject: str, body: str):
     """Archive sent response"""
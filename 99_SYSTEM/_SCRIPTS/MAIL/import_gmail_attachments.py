@@ -290,6 +290,8 @@ def main():
             meta = {
                 "source": "GMAIL/SOURCE_ICLOUD",
                 "gmail_id": msg_id,
+                "thread_id": msg.get("threadId", ""),
+                "rfc_message_id": headers.get("message-id", ""),
                 "from": from_,
                 "subject": subject,
                 "date_utc": date_iso,
@@ -7,6 +7,8 @@ import json
 import random
 from pathlib import Path
 from client_evaluator import evaluate_client_email
+from thread_index import ThreadIndex, format_thread
+from reply_vectors import ReplyVectorIndex
 
 ROOT = Path(r"C:\Users\alimg\Dropbox\Archiwum 3.0")
 JSONL_FILE = ROOT / "_COLLECT_DROP" / "REPLIES_TRAINING" / "replies_2023_2026.jsonl"
@@ -38,9 +40,14 @@ def load_jsonl_emails(limit=30):
     long = [e for e in emails if len(e.get('body', '')) >= 1000]
     diverse_sample.extend(random.sample(long, min(10, len(long))))
     
-    # Get emails with specific keywords
+    # Get emails closest to each topic (semantic index; keyword match if numpy is missing)
     keywords = ['wycena', 'umowa', 'faktur', 'zapytanie', 'termin', 'prośba']
+    vectors = ReplyVectorIndex.open(JSONL_FILE)
     for kw in keywords:
+        if vectors is not None:
+            taken = {e.get('message_id') for e in diverse_sample}
+            diverse_sample.extend(row for _, row in vectors.query(kw, k=2, exclude_ids=taken))
+            continue
         matching = [e for e in emails if kw.lower() in e.get('subject', '').lower()]
         if matching:
             diverse_sample.append(random.choice(matching))
@@ -63,6 +70,9 @@ def process_jsonl_emails():
     
     print(f"\nProcessing {len(emails)} sampled emails...\n")
     
+    # Full conversation per sampled email (thread lookup, no extra JSONL scan)
+    threads = ThreadIndex.open(JSONL_FILE)
+    
     results = []
     
     for i, email in enumerate(emails, 1):
@@ -75,6 +85,8 @@ def process_jsonl_emails():
         # Evaluate
         evaluation = evaluate_client_email(subject, body_preview)
         
+        thread = threads.load_thread(email.get('thread_id') or email.get('message_id') or '')
+        
         result = {
             'message_id': email.get('message_id'),
             'date': email.get('dt_utc', '')[:10],
@@ -83,6 +95,9 @@ def process_jsonl_emails():
             'from': email.get('from'),
             'body_length': len(body),
             'body_preview': body_preview[:200],
+            'thread_id': email.get('thread_id'),
+            'thread_size': len(thread),
+            'conversation': format_thread(thread, max_chars=1500),
             'evaluation': evaluation
         }
         
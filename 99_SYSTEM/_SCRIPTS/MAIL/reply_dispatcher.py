@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Reply Dispatcher
+In-process replacement for spawning gmail_send_reply.py per approval.
+
+- Worker threads each hold a warm Gmail service (built once from one shared
+  set of OAuth credentials; the HTTP client is not thread-safe, so every
+  worker builds its own).
+- Approvals are queued under an idempotency key (email_id:action): a key
+  already queued, running or done is not queued again, and deliver_approval()
+  itself refuses to send a reply that is already archived as sent.
+- Gmail failures worth retrying (429/5xx, connection errors) are retried with
+  exponential backoff plus jitter, up to MAX_ATTEMPTS.
+- Sends from all workers share one token bucket (SEND_RATE_PER_S, burst
+  SEND_BURST), so several approvals go out concurrently without tripping
+  Gmail's per-user rate limit.
+- Every finished job is appended to send_log.csv with its timings:
+  queue_ms (approval to worker pickup), send_ms (last attempt), total_ms.
+"""
+
+import csv
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+import gmail_send_reply as gsr
+
+# =====================
+# CONFIG
+# =====================
+
+SEND_LOG = gsr.SEND_LOG
+SEND_LOG_HEADER = [
+    "timestamp_utc", "email_id", "action", "status", "attempts",
+    "queue_ms", "send_ms", "total_ms", "note",
+]
+
+WORKERS = int(os.environ.get("ALIS_SEND_WORKERS", "3"))
+SEND_RATE_PER_S = float(os.environ.get("ALIS_SEND_RATE_PER_S", "2"))
+SEND_BURST = 3
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_S = 2.0
+BACKOFF_MAX_S = 60.0
+
+# =====================
+# RATE LIMIT
+# =====================
+
+class TokenBucket:
+    """rate tokens per second, at most burst saved up; acquire() blocks"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = max(rate, 0.01)
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# =====================
+# DISPATCHER
+# =====================
+
+@dataclass(order=True)
+class _Job:
+    not_before: float
+    seq: int
+    email_id: str = field(compare=False)
+    action: str = field(compare=False)
+    queued_at: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+    picked_at: float = field(default=0.0, compare=False)
+
+
+class ReplyDispatcher:
+    """
+    submit(email_id, action) returns at once; on_done(email_id, action, status, note)
+    is called from a worker thread when the job finished (status from
+    gmail_send_reply: sent / skipped / already_sent / pending_manual / failed).
+    """
+
+    def __init__(
+        self,
+        on_done: Optional[Callable[[str, str, str, str], None]] = None,
+        workers: int = WORKERS,
+        rate_per_s: float = SEND_RATE_PER_S,
+        send_log: Path = SEND_LOG,
+    ):
+        self.on_done = on_done
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(rate_per_s, SEND_BURST)
+        self.send_log = send_log
+        self._queue: "queue.PriorityQueue[_Job]" = queue.PriorityQueue()
+        self._keys: set = set()
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._seq = 0
+        self._creds = None
+        self._threads: list = []
+        # real Gmail client needed (no client for DRY_RUN or without the Google libraries)
+        self._live = gsr.GMAIL_AVAILABLE and not gsr.DRY_RUN
+
+    def start(self):
+        if self._live:
+            # OAuth load / refresh once, before the first approval arrives
+            self._creds = gsr.get_gmail_credentials()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"reply-send-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def submit(self, email_id: str, action: str) -> bool:
+        """Queue a job; False if the same email_id:action is already queued or done"""
+        key = f"{email_id}:{action}"
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            self._seq += 1
+            now = time.monotonic()
+            self._queue.put(_Job(now, self._seq, email_id, action, now))
+        return True
+
+    # -----------------------------
+    # workers
+    # -----------------------------
+
+    def _service(self):
+        if not self._live:
+            return None
+        return gsr.get_gmail_service(self._creds)
+
+    def _worker(self):
+        try:
+            service = self._service()
+        except Exception as e:
+            print(f"Gmail client init failed: {e}")
+            service = None
+        while True:
+            job = self._queue.get()
+            delay = job.not_before - time.monotonic()
+            if delay > 0:
+                # a retry that is not due yet: put it back and wait for it or a newer job
+                self._queue.put(job)
+                time.sleep(min(delay, 0.5))
+                continue
+            if service is None and self._live:
+                try:
+                    service = self._service()
+                except Exception as e:
+                    job.attempts += 1
+                    self._retry_or_fail(job, 0.0, f"Gmail client init failed: {e}")
+                    continue
+            self._run(job, service)
+
+    def _run(self, job: _Job, service):
+        if not job.picked_at:
+            job.picked_at = time.monotonic()
+        job.attempts += 1
+        if job.action == "approve":
+            self.bucket.acquire()
+        t0 = time.monotonic()
+        try:
+            status, note = gsr.deliver_approval(job.email_id, job.action, service)
+        except gsr.SendError as e:
+            self._retry_or_fail(job, (time.monotonic() - t0) * 1000, str(e))
+            return
+        except Exception as e:
+            status, note = gsr.STATUS_FAILED, f"{type(e).__name__}: {e}"[:200]
+            gsr.log_approval(job.email_id, "send_failed", note)
+        self._finish(job, status, note, (time.monotonic() - t0) * 1000)
+
+    def _retry_or_fail(self, job: _Job, send_ms: float, note: str):
+        if job.attempts >= MAX_ATTEMPTS:
+            gsr.log_approval(job.email_id, "send_failed", f"Gmail API error: {note}")
+            self._finish(job, gsr.STATUS_FAILED, f"{note} (after {job.attempts} attempts)", send_ms)
+            return
+        backoff = min(BACKOFF_MAX_S, BACKOFF_BASE_S * (2 ** (job.attempts - 1)))
+        job.not_before = time.monotonic() + backoff * random.uniform(0.8, 1.2)
+        print(f"Retry {job.email_id} in {backoff:.0f}s: {note}")
+        self._queue.put(job)
+
+    def _finish(self, job: _Job, status: str, note: str, send_ms: float):
+        done = time.monotonic()
+        picked = job.picked_at or done
+        self._log(job, status, note, (picked - job.queued_at) * 1000, send_ms, (done - job.queued_at) * 1000)
+        if status == gsr.STATUS_FAILED:
+            # reacting again re-submits it (the listener retries "error" entries)
+            with self._lock:
+                self._keys.discard(f"{job.email_id}:{job.action}")
+        if self.on_done is not None:
+            try:
+                self.on_done(job.email_id, job.action, status, note)
+            except Exception as e:
+                print(f"on_done failed: {e}")
+
+    def _log(self, job: _Job, status: str, note: str, queue_ms: float, send_ms: float, total_ms: float):
+        row = [
+            datetime.now(timezone.utc).isoformat(),
+            job.email_id,
+            job.action,
+            status,
+            job.attempts,
+            f"{queue_ms:.0f}",
+            f"{send_ms:.0f}",
+            f"{total_ms:.0f}",
+            note,
+        ]
+        with self._log_lock:
+            self.send_log.parent.mkdir(parents=True, exist_ok=True)
+            new = not self.send_log.exists() or self.send_log.stat().st_size == 0
+            with open(self.send_log, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                if new:
+                    writer.writerow(SEND_LOG_HEADER)
+                writer.writerow(row)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Local semantic index over past replies (replies_2023_2026.jsonl).
+
+- Featurizer: hashed TF-IDF over words + char 3/4-grams of normalized text
+  (text_search.normalize, so diacritics do not matter). Deterministic, offline.
+- Storage: <export>.vec.<build>.f32 (raw float32 rows, L2-normalized,
+  memory-mapped) + <export>.vec.json (dim, idf, byte offsets of source lines,
+  indexed size, fingerprint, name of the vector file). The JSON is written
+  last with os.replace, so it never points at rows that are not on disk.
+- Appends to the export are embedded on open (only the new lines, with the
+  IDF of the last full build) and the rows appended to the vector file, the
+  same way thread_index catches up. A missing index or a rewritten export
+  needs a full build: `python reply_vectors.py` (also re-fits the IDF);
+  similar_replies() never builds one itself.
+- Query: one vectorized matrix-vector product + argpartition for top-k.
+
+Usage:
+    python reply_vectors.py                 # full (re)build for REPLIES_JSONL
+    python reply_vectors.py "ile kosztuje szafa przesuwna"
+"""
+
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+sys.path.insert(0, str(Path(__file__).parent))
+from state_file_utils import acquire_lock, release_lock
+from text_search import normalize
+
+ROOT = Path(r"C:\Users\alimg\Dropbox\Archiwum 3.0")
+REPLIES_JSONL = ROOT / "_COLLECT_DROP" / "REPLIES_TRAINING" / "replies_2023_2026.jsonl"
+
+INDEX_VERSION = 2
+DIM = 2048
+ROW_BYTES = DIM * 4
+MAX_TEXT_CHARS = 2000
+BUILD_CHUNK_ROWS = 1024
+FINGERPRINT_BYTES = 4096
+
+
+def _meta_path(jsonl_path: Path) -> Path:
+    return jsonl_path.with_name(jsonl_path.name + ".vec.json")
+
+
+def _fingerprint(f, size: int) -> str:
+    """sha1 of the first indexed bytes, to tell a rewrite from an append"""
+    f.seek(0)
+    return hashlib.sha1(f.read(min(size, FINGERPRINT_BYTES))).hexdigest()
+
+
+def _scan_lines(f, start: int) -> tuple:
+    """Offsets of the non-empty complete lines from start, and where they end"""
+    f.seek(start)
+    offsets = []
+    offset = start
+    for line in f:
+        if not line.endswith(b"\n"):
+            break  # partial line still being written
+        if line.strip():
+            offsets.append(offset)
+        offset += len(line)
+    return offsets, offset
+
+
+def _write_meta(meta_path: Path, meta: dict):
+    tmp = meta_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, meta_path)
+
+
+def reply_text(row: dict) -> str:
+    """Text that represents one reply: subject + body (trimmed)"""
+    body = row.get("body") or row.get("snippet") or ""
+    return f"{row.get('subject', '')}\n{body[:MAX_TEXT_CHARS]}"
+
+
+def features(text: str) -> dict:
+    """{bucket: signed sublinear tf}; crc32 hashing keeps it stable across runs"""
+    counts: dict[str, int] = {}
+    for word in normalize(text).split():
+        counts["w:" + word] = counts.get("w:" + word, 0) + 1
+        padded = f" {word} "
+        for n in (3, 4):
+            for i in range(len(padded) - n + 1):
+                g = padded[i:i + n]
+                counts[g] = counts.get(g, 0) + 1
+
+    vec: dict[int, float] = {}
+    for token, tf in counts.items():
+        h = zlib.crc32(token.encode("utf-8"))
+        bucket = h % DIM
+        sign = 1.0 if (h >> 31) & 1 == 0 else -1.0
+        vec[bucket] = vec.get(bucket, 0.0) + sign * (1.0 + math.log(tf))
+    return vec
+
+
+def _row_features(f, offset: int) -> Optional[tuple]:
+    """(cols, values) of the export line at offset; None for unreadable / empty rows"""
+    f.seek(offset)
+    try:
+        row = json.loads(f.readline().decode("utf-8"))
+    except Exception:
+        return None
+    feats = features(reply_text(row))
+    if not feats:
+        return None
+    return (
+        np.fromiter(feats.keys(), dtype=np.int64, count=len(feats)),
+        np.fromiter(feats.values(), dtype=np.float32, count=len(feats)),
+    )
+
+
+def _normalize_rows(block, idf):
+    block = block * idf
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return block / norms
+
+
+class ReplyVectorIndex:
+    def __init__(self, jsonl_path: Path, meta: dict):
+        self.jsonl_path = Path(jsonl_path)
+        self.meta = meta
+        self.offsets = meta.get("offsets") or []
+        self.idf = np.asarray(meta.get("idf") or [1.0] * DIM, dtype=np.float32)
+        self.vec_path = self.jsonl_path.with_name(meta["vec_file"])
+        self.matrix = (
+            np.memmap(self.vec_path, mode="r", dtype=np.float32, shape=(len(self.offsets), DIM))
+            if self.offsets else None
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @classmethod
+    def build(cls, jsonl_path: Path = REPLIES_JSONL) -> "ReplyVectorIndex":
+        """Two streaming passes: offsets + TF rows into a new vector file, then IDF scaling and L2 norm in chunks"""
+        if not NUMPY_AVAILABLE:
+            raise ImportError("numpy not available")
+        meta_path = _meta_path(jsonl_path)
+        try:
+            old_vec = json.loads(meta_path.read_text(encoding="utf-8")).get("vec_file")
+        except Exception:
+            old_vec = None
+
+        with jsonl_path.open("rb") as f:
+            offsets, size = _scan_lines(f, 0)
+            fingerprint = _fingerprint(f, size)
+
+        n = len(offsets)
+        # a new file per build: readers keep the old one until the meta points here
+        vec_file = f"{jsonl_path.name}.vec.{int(time.time() * 1000):x}.f32"
+        vec_path = jsonl_path.with_name(vec_file)
+        df = np.zeros(DIM, dtype=np.float64)
+        idf = np.ones(DIM, dtype=np.float32)
+        if n:
+            matrix = np.memmap(vec_path, mode="w+", dtype=np.float32, shape=(n, DIM))
+            with jsonl_path.open("rb") as f:
+                for i, off in enumerate(offsets):
+                    feats = _row_features(f, off)
+                    if feats is None:
+                        continue
+                    matrix[i, feats[0]] = feats[1]
+                    df[feats[0]] += 1
+
+            idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+            for start in range(0, n, BUILD_CHUNK_ROWS):
+                matrix[start:start + BUILD_CHUNK_ROWS] = _normalize_rows(matrix[start:start + BUILD_CHUNK_ROWS], idf)
+            matrix.flush()
+            del matrix
+        else:
+            vec_path.write_bytes(b"")
+
+        meta = {
+            "version": INDEX_VERSION,
+            "dim": DIM,
+            "size": size,
+            "fingerprint": fingerprint,
+            "vec_file": vec_file,
+            "offsets": offsets,
+            "idf": [round(float(x), 5) for x in idf],
+        }
+        _write_meta(meta_path, meta)
+        for stale in {old_vec, jsonl_path.name + ".vec.npy"} - {None, vec_file}:
+            try:
+                jsonl_path.with_name(stale).unlink()
+            except OSError:
+                pass  # missing, or still mapped by another process
+        return cls(jsonl_path, meta)
+
+    @staticmethod
+    def _valid(jsonl_path: Path, meta: dict) -> bool:
+        try:
+            vec_path = jsonl_path.with_name(meta["vec_file"])
+            return (
+                meta.get("version") == INDEX_VERSION
+                and meta.get("dim") == DIM
+                and vec_path.stat().st_size >= len(meta.get("offsets") or []) * ROW_BYTES
+            )
+        except (KeyError, TypeError, OSError):
+            return False
+
+    @classmethod
+    def _catch_up(cls, jsonl_path: Path, meta: dict) -> Optional[dict]:
+        """
+        Embed lines appended since the index was written and append their rows.
+        Returns the (updated) meta, or None if the export was rewritten.
+        """
+        size = int(meta.get("size", 0))
+        with jsonl_path.open("rb") as f:
+            file_size = f.seek(0, 2)
+            if file_size < size or _fingerprint(f, size) != meta.get("fingerprint"):
+                return None
+            if file_size == size:
+                return meta
+
+        meta_path = _meta_path(jsonl_path)
+        lock = meta_path.with_suffix(".lock")
+        if not acquire_lock(lock, timeout_seconds=10):
+            return meta  # another process is catching up: use what is indexed
+        try:
+            # it may have finished while we waited
+            current = json.loads(meta_path.read_text(encoding="utf-8"))
+            if cls._valid(jsonl_path, current):
+                meta = current
+            idf = np.asarray(meta["idf"], dtype=np.float32)
+            offsets = list(meta["offsets"])
+            with jsonl_path.open("rb") as f:
+                if _fingerprint(f, int(meta["size"])) != meta.get("fingerprint"):
+                    return None
+                new_offsets, end = _scan_lines(f, int(meta["size"]))
+                if end == meta["size"]:
+                    return meta
+                vec_path = jsonl_path.with_name(meta["vec_file"])
+                with vec_path.open("r+b") as out:
+                    # rows past the meta are from an interrupted append
+                    if out.seek(0, 2) != len(offsets) * ROW_BYTES:
+                        out.truncate(len(offsets) * ROW_BYTES)
+                        out.seek(0, 2)
+                    for start in range(0, len(new_offsets), BUILD_CHUNK_ROWS):
+                        chunk = new_offsets[start:start + BUILD_CHUNK_ROWS]
+                        block = np.zeros((len(chunk), DIM), dtype=np.float32)
+                        for i, off in enumerate(chunk):
+                            feats = _row_features(f, off)
+                            if feats is not None:
+                                block[i, feats[0]] = feats[1]
+                        out.write(_normalize_rows(block, idf).astype(np.float32).tobytes())
+                fingerprint = _fingerprint(f, end)
+            meta = dict(meta, size=end, fingerprint=fingerprint, offsets=offsets + new_offsets)
+            _write_meta(meta_path, meta)
+            return meta
+        finally:
+            release_lock(lock)
+
+    @classmethod
+    def open(cls, jsonl_path: Path = REPLIES_JSONL, rebuild_if_stale: bool = True) -> Optional["ReplyVectorIndex"]:
+        """
+        Memory-map an existing index, embedding appended lines first. A missing
+        index or rewritten export is rebuilt only if rebuild_if_stale.
+        """
+        if not NUMPY_AVAILABLE or not jsonl_path.exists():
+            return None
+        try:
+            meta = json.loads(_meta_path(jsonl_path).read_text(encoding="utf-8"))
+            meta = cls._catch_up(jsonl_path, meta) if cls._valid(jsonl_path, meta) else None
+        except Exception:
+            meta = None
+        if meta is None:
+            return cls.build(jsonl_path) if rebuild_if_stale else None
+        return cls(jsonl_path, meta)
+
+    def embed(self, text: str):
+        q = np.zeros(DIM, dtype=np.float32)
+        feats = features(text)
+        if feats:
+            cols = np.fromiter(feats.keys(), dtype=np.int64, count=len(feats))
+            q[cols] = np.fromiter(feats.values(), dtype=np.float32, count=len(feats))
+        q *= self.idf
+        norm = float(np.linalg.norm(q))
+        return q / norm if norm else q
+
+    def query(self, text: str, k: int = 5, min_score: float = 0.0, exclude_ids=()) -> list:
+        """Top-k cosine matches: [(score, row)] best first; rows whose message_id is in exclude_ids are skipped"""
+        n = len(self.offsets)
+        if not n:
+            return []
+        q = self.embed(text)
+        scores = self.matrix @ q
+        take = min(n, k + len(exclude_ids))
+        top = np.argpartition(-scores, take - 1)[:take]
+        top = top[np.argsort(-scores[top])]
+
+        out = []
+        with self.jsonl_path.open("rb") as f:
+            for i in top:
+                score = float(scores[i])
+                if score < min_score:
+                    break
+                f.seek(self.offsets[i])
+                try:
+                    row = json.loads(f.readline().decode("utf-8"))
+                except Exception:
+                    continue
+                if row.get("message_id") in exclude_ids:
+                    continue
+                out.append((round(score, 4), row))
+                if len(out) >= k:
+                    break
+        return out
+
+
+_INDEX: Optional[ReplyVectorIndex] = None
+
+
+_INDEX_MISSING_REPORTED = False
+
+
+def similar_replies(text: str, k: int = 3, min_score: float = 0.1) -> list:
+    """Most similar past replies for a new inquiry; [] if numpy/export/index is missing"""
+    global _INDEX, _INDEX_MISSING_REPORTED
+    try:
+        if _INDEX is None:
+            _INDEX = ReplyVectorIndex.open(REPLIES_JSONL, rebuild_if_stale=False)
+        if _INDEX is None:
+            if not _INDEX_MISSING_REPORTED and NUMPY_AVAILABLE and REPLIES_JSONL.exists():
+                print("Reply index missing or export rewritten: run python reply_vectors.py")
+                _INDEX_MISSING_REPORTED = True
+            return []
+        return _INDEX.query(text, k=k, min_score=min_score)
+    except Exception:
+        return []
+
+
+def format_examples(matches: list, body_chars: int = 400) -> str:
+    parts = []
+    for score, row in matches:
+        body = (row.get("body") or row.get("snippet") or "").strip()
+        parts.append(f"Subject: {row.get('subject', '')} (similarity {score:.2f})\n{body[:body_chars]}")
+    return "\n\n".join(parts)
+
+
+if __name__ == "__main__":
+    if not NUMPY_AVAILABLE:
+        print("numpy not installed: pip install numpy")
+        sys.exit(1)
+    if len(sys.argv) > 1:
+        idx = ReplyVectorIndex.open(REPLIES_JSONL)
+        t0 = time.perf_counter()
+        matches = idx.query(" ".join(sys.argv[1:]), k=5) if idx else []
+        print(f"Query: {(time.perf_counter() - t0) * 1000:.1f} ms")
+        print(format_examples(matches))
+    else:
+        idx = ReplyVectorIndex.build(REPLIES_JSONL)
+        print(f"Indexed replies: {len(idx)} -> {idx.vec_path}")
@@ -1,10 +1,14 @@
 import os
+import sys
 import csv
 import json
 import shutil
 from pathlib import Path
 from datetime import datetime, timezone
 
+sys.path.insert(0, str(Path(__file__).parent))
+from text_search import fold
+
 # AI Client Evaluator
 try:
     from client_evaluator import evaluate_client_email
@@ -64,14 +68,19 @@ KLIENTS_KEYS = {
     "dom", "mieszkanie", "legionowo", "warszawa", "front", "blat", "gola",
 }
 
+# Ключи и текст сравниваются без диакритики: "wyciag" == "wyciąg", "składka" == "skladka"
+_CAR_KEYS_F = {fold(k) for k in CAR_KEYS}
+_FIRMA_KEYS_F = {fold(k) for k in FIRMA_KEYS}
+_KLIENTS_KEYS_F = {fold(k) for k in KLIENTS_KEYS}
+
 # приоритет: CAR > FIRMA > KLIENTS (чтобы не сыпалось в клиентов всё подряд)
 def classify(text: str) -> str:
-    t = (text or "").lower()
-    if any(k in t for k in CAR_KEYS):
+    t = fold(text)
+    if any(k in t for k in _CAR_KEYS_F):
         return "CAR"
-    if any(k in t for k in FIRMA_KEYS):
+    if any(k in t for k in _FIRMA_KEYS_F):
         return "FIRMA"
-    if any(k in t for k in KLIENTS_KEYS):
+    if any(k in t for k in _KLIENTS_KEYS_F):
         return "KLIENTS"
     return "REVIEW"
 
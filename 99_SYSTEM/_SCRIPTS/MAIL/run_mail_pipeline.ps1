@@ -4,6 +4,10 @@ $root = "C:\Users\alimg\Dropbox\Archiwum 3.0"
 $venvPython = Join-Path $root ".venv\Scripts\python.exe"
 $pythonExe = if (Test-Path $venvPython) { $venvPython } else { "python" }
 
+# Stage output is piped (Tee-Object) to pick up counts: keep it UTF-8 end to end
+$env:PYTHONIOENCODING = "utf-8"
+[Console]::OutputEncoding = [System.Text.Encoding]::UTF8
+
 # Pipeline stages with retry logic
 $importer = Join-Path $scriptDir "import_gmail_attachments.py"
 $importerAlim = Join-Path $scriptDir "import_gmail_alim.py"  # alimgulov1992@gmail.com
@@ -16,19 +20,42 @@ $calendarCleanup = Join-Path $root "99_SYSTEM\_SCRIPTS\CALENDAR\cleanup_recurrin
 $logDir = Join-Path $root "00_INBOX\_ROUTER_LOGS"
 $logFile = Join-Path $logDir "pipeline_run.log"
 $errorLogFile = Join-Path $logDir "pipeline_errors.jsonl"
+$eventLogFile = Join-Path $logDir "pipeline_events.jsonl"
 New-Item -ItemType Directory -Path $logDir -Force | Out-Null
 
-# Rotate log if > 5MB
-if (Test-Path $logFile) {
-    $size = (Get-Item $logFile).Length
-    if ($size -gt 5MB) {
-        $stamp = (Get-Date).ToString("yyyyMMdd_HHmmss")
-        Rename-Item $logFile "$logFile.$stamp.bak"
+# Rotate logs if > 5MB
+foreach ($f in @($logFile, $eventLogFile)) {
+    if (Test-Path $f) {
+        $size = (Get-Item $f).Length
+        if ($size -gt 5MB) {
+            $stamp = (Get-Date).ToString("yyyyMMdd_HHmmss")
+            Rename-Item $f "$f.$stamp.bak"
+        }
     }
 }
 
+$runId = [guid]::NewGuid().ToString("N").Substring(0, 12)
+$runTimer = [System.Diagnostics.Stopwatch]::StartNew()
+
 Start-Transcript -Path $logFile -Append | Out-Null
 
+# Helper: Write structured pipeline events to JSONL (read by the Telegram dashboard)
+function Write-PipelineEvent {
+    param([string]$Name, [hashtable]$Data = @{})
+    $entry = [ordered]@{
+        ts_utc = (Get-Date).ToUniversalTime().ToString("yyyy-MM-ddTHH:mm:ss.fffZ")
+        run_id = $runId
+        event  = $Name
+    }
+    foreach ($k in $Data.Keys) { $entry[$k] = $Data[$k] }
+    try {
+        Add-Content -Path $eventLogFile -Value ($entry | ConvertTo-Json -Compress) -Encoding UTF8
+    }
+    catch {
+        Write-Host "  [EVENTS] write failed: $($_.Exception.Message)" -ForegroundColor Yellow
+    }
+}
+
 # Helper: Run Python script with retries
 function Invoke-PythonScript {
     param(
@@ -38,12 +65,26 @@ function Invoke-PythonScript {
         [bool]$IsCritical = $true
     )
     
+    Write-PipelineEvent -Name "stage_start" -Data @{ stage = $StageName }
+    $stageTimer = [System.Diagnostics.Stopwatch]::StartNew()
+    $count = $null
+
     for ($attempt = 1; $attempt -le $MaxRetries; $attempt++) {
         Write-Host "  [$StageName] Attempt $attempt/$MaxRetries..."
-        & $pythonExe $ScriptPath
-        
-        if ($LASTEXITCODE -eq 0) {
+        & $pythonExe $ScriptPath | Tee-Object -Variable stageOutput | Out-Host
+        $exitCode = $LASTEXITCODE
+
+        # e.g. "Imported: 12 attachment(s). Saved to: ..."
+        foreach ($line in @($stageOutput)) {
+            if ("$line" -match "^Imported:\s*(\d+)") { $count = [int]$Matches[1] }
+        }
+
+        if ($exitCode -eq 0) {
             Write-Host "  [$StageName] ✓ Success" -ForegroundColor Green
+            Write-PipelineEvent -Name "stage_stop" -Data @{
+                stage = $StageName; ok = $true; exit_code = 0; attempts = $attempt
+                duration_ms = $stageTimer.ElapsedMilliseconds; count = $count
+            }
             return $true
         }
         
@@ -53,12 +94,17 @@ function Invoke-PythonScript {
         }
     }
     
+    Write-PipelineEvent -Name "stage_stop" -Data @{
+        stage = $StageName; ok = $false; exit_code = $exitCode; attempts = $MaxRetries
+        duration_ms = $stageTimer.ElapsedMilliseconds; count = $count; critical = $IsCritical
+    }
+
     if ($IsCritical) {
-        Write-Host "  [$StageName] ✗ CRITICAL FAILURE (exit $LASTEXITCODE)" -ForegroundColor Red
+        Write-Host "  [$StageName] ✗ CRITICAL FAILURE (exit $exitCode)" -ForegroundColor Red
         return $false
     }
     else {
-        Write-Host "  [$StageName] ⚠ Non-critical failure (exit $LASTEXITCODE)" -ForegroundColor Yellow
+        Write-Host "  [$StageName] ⚠ Non-critical failure (exit $exitCode)" -ForegroundColor Yellow
         return $true  # Non-critical, continue pipeline
     }
 }
@@ -102,6 +148,7 @@ try {
     Write-Host "════════════════════════════════════════════════" -ForegroundColor Cyan
     Write-Host ("UTC: " + (Get-Date).ToUniversalTime().ToString("s") + "Z")
     Write-Host ""
+    Write-PipelineEvent -Name "run_start"
 
     # STAGE 1: IMPORT - alismeble@gmail.com inbox (CRITICAL)
     Write-Host "STAGE 1A/6: IMPORT - Gmail alismeble@gmail.com → CASES\_INBOX"
@@ -148,6 +195,7 @@ try {
     Write-Host "════════════════════════════════════════════════" -ForegroundColor Green
     Write-Host "  MAIL PIPELINE DONE ✓" -ForegroundColor Green
     Write-Host "════════════════════════════════════════════════" -ForegroundColor Green
+    Write-PipelineEvent -Name "run_done" -Data @{ duration_ms = $runTimer.ElapsedMilliseconds }
 }
 catch {
     Write-Host ""
@@ -164,6 +212,10 @@ catch {
     elseif ($_ -match "TELEGRAM") { $stage = "TELEGRAM" }
     
     Write-ErrorLog -Stage $stage -Message $_.Exception.Message -ExitCode $LASTEXITCODE
+    Write-PipelineEvent -Name "run_error" -Data @{
+        stage = $stage; message = $_.Exception.Message; exit_code = "$LASTEXITCODE"
+        duration_ms = $runTimer.ElapsedMilliseconds
+    }
 }
 finally {
     Remove-Item $lock -ErrorAction SilentlyContinue
@@ -1,7 +1,19 @@
 $root = "C:\Users\alimg\Dropbox\Archiwum 3.0"
-$scriptPath = Join-Path $root "99_SYSTEM\_SCRIPTS\MAIL\telegram_reminders_check.py"
-$csvPath = "C:\Users\alimg\Dropbox\Archiwum 3.0\00_INBOX\_PHOTO_DEDUP\photo_duplicates_20260203_133053.csv"
+$scriptPath = Join-Path $root "99_SYSTEM\_SCRIPTS\MAIL\telegram_reminder_scheduler.py"
+$venvPython = Join-Path $root ".venv\Scripts\python.exe"
+$pythonExe = if (Test-Path $venvPython) { $venvPython } else { "python" }
 
-Set-Location $root
-& python $scriptPath $csvPath
+# The scheduler is a long-running process that sends each reminder at its
+# 2-hour mark. A scheduled run of this script only starts it if it is not
+# running yet, so it is safe to keep the old 30-minute task.
+$running = Get-CimInstance Win32_Process | Where-Object {
+    $_.CommandLine -and $_.CommandLine -like "*telegram_reminder_scheduler*"
+}
+if ($running) {
+    Write-Host ("Reminder scheduler already running (PID {0})" -f ($running | Select-Object -First 1).ProcessId)
+    exit 0
+}
 
+Set-Location $root
+Start-Process -FilePath $pythonExe -ArgumentList "`"$scriptPath`"" -WindowStyle Hidden
+Write-Host "Reminder scheduler started"
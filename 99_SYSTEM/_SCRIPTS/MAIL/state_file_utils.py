@@ -90,8 +90,83 @@ def append_line_atomic(file_path: Path, line: str, max_retries: int = 3) -> bool
     return False
 
 
+def _pid_alive(pid: int) -> bool:
+    """True if a process with this pid is running (unknown -> True)"""
+    if pid <= 0:
+        return True
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return True
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+# a lock file is written right after it is created: one still without a pid
+# after this long belongs to a writer that died in between
+EMPTY_LOCK_STALE_S = 60
+
+
+def _read_lock_pid(path: Path) -> int:
+    raw = path.read_text().strip()
+    return int(raw) if raw.isdigit() else 0
+
+
+def _break_stale_lock(lock_path: Path) -> bool:
+    """Remove a lock whose holder process is gone; live holders keep it however old it is"""
+    try:
+        pid = _read_lock_pid(lock_path)
+        age = time.time() - lock_path.stat().st_mtime
+    except OSError:
+        return False
+    if pid == 0 and age < EMPTY_LOCK_STALE_S:
+        return False
+    if pid and _pid_alive(pid):
+        return False
+    # move it aside under a unique name before deleting: if another waiter
+    # broke it first and took a new lock, that is what we moved, and it goes back
+    aside = lock_path.with_name(f"{lock_path.name}.{os.getpid()}.{time.monotonic_ns()}.stale")
+    try:
+        os.rename(lock_path, aside)
+    except OSError:
+        return False
+    try:
+        moved = _read_lock_pid(aside)
+    except OSError:
+        moved = -1
+    if moved != pid:
+        try:
+            with open(lock_path, 'x') as f:
+                f.write(str(moved) if moved > 0 else "")
+            os.remove(aside)
+        except OSError as e:
+            print(f"  ERROR: Could not restore lock {lock_path.name} moved aside by mistake: {e}")
+        return False
+    try:
+        os.remove(aside)
+    except OSError:
+        pass
+    print(f"  WARNING: Removed stale lock {lock_path.name} (pid {pid or '?'} not running)")
+    return True
+
+
 def acquire_lock(lock_path: Path, timeout_seconds: int = 30) -> bool:
-    """Acquire lock file (spin-wait with timeout)"""
+    """Acquire lock file (spin-wait with timeout); a lock whose holder process is gone is broken"""
     lock_path.parent.mkdir(parents=True, exist_ok=True)
     start_time = time.time()
     
@@ -102,6 +177,8 @@ def acquire_lock(lock_path: Path, timeout_seconds: int = 30) -> bool:
                 f.write(str(os.getpid()))
             return True
         except FileExistsError:
+            if _break_stale_lock(lock_path):
+                continue
             time.sleep(0.1)  # Wait 100ms before retry
     
     print(f"  ERROR: Failed to acquire lock {lock_path.name} after {timeout_seconds}s")
@@ -109,10 +186,17 @@ def acquire_lock(lock_path: Path, timeout_seconds: int = 30) -> bool:
 
 
 def release_lock(lock_path: Path) -> bool:
-    """Release lock file"""
+    """Release lock file (only if it is still ours)"""
     try:
-        if lock_path.exists():
-            os.remove(lock_path)
+        if not lock_path.exists():
+            return True
+        pid = _read_lock_pid(lock_path)
+        if pid != os.getpid():
+            print(f"  WARNING: Lock {lock_path.name} is held by pid {pid or '?'}, not released")
+            return False
+        os.remove(lock_path)
+        return True
+    except FileNotFoundError:
         return True
     except Exception as e:
         print(f"  ERROR: Failed to release lock: {e}")
@@ -7,15 +7,46 @@ Workflow:
 1. ai_responder.py sends draft with unique email_id
 2. You react with ✅ (approve) or ❌ (skip)
 3. This script detects reaction
-4. Calls gmail_send_reply.py to send or skip
+4. Hands it to the in-process reply dispatcher (reply_dispatcher.py: warm
+   Gmail client, concurrent rate-limited sends, retries; timings in
+   send_log.csv). The state entry is "queued" until the send finished;
+   queued entries are re-submitted after a restart.
+
+Receiving updates:
+- long polling (default): getUpdates with a server-side timeout, so an idle
+  listener holds one open request per POLL_TIMEOUT_S and a reaction arrives
+  as soon as Telegram has it. The next update offset is kept in
+  telegram_approval_offset.json, so a restart neither replays nor skips.
+- webhook (--webhook URL): Telegram pushes updates to a small local HTTP
+  server (--listen, default 127.0.0.1:8443). URL must be the public HTTPS
+  address that forwards to it (reverse proxy / tunnel). While a webhook is
+  set, getUpdates does not work for this token; polling mode removes it.
+
+Reaction updates carry only the message id, so email_id is looked up in
+telegram_approval_messages.json (written by ai_responder.py when it sends a
+draft); the "Original email ID:" line is still used when text is present.
+Only reactions in the configured chat count. State is written only when a
+reaction was processed. A reaction whose send failed (state "error") can be
+retried by reacting again; gmail_send_reply checks the Gmail thread first,
+so a reply that did go out is not sent twice.
 """
 
+import argparse
 import json
+import os
+import queue
 import re
-import subprocess
+import secrets
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from datetime import datetime, timezone
-from urllib import request, parse
+from urllib import error, request, parse
+
+sys.path.insert(0, str(Path(__file__).parent))
+from reply_dispatcher import ReplyDispatcher
 
 # =====================
 # CONFIG
@@ -28,41 +59,63 @@ TELEGRAM_TOKEN_FILE = SECRETS_DIR / "telegram_bot_token.txt"
 TELEGRAM_CHAT_FILE = SECRETS_DIR / "telegram_chat_id.txt"
 
 APPROVAL_STATE_FILE = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "telegram_approval_state.json"
+APPROVAL_OFFSET_FILE = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "telegram_approval_offset.json"
+APPROVAL_MESSAGES_FILE = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "telegram_approval_messages.json"
 LOG_DIR = ROOT / "00_INBOX" / "_ROUTER_LOGS"
 
-MAIL_SCRIPTS = ROOT / "99_SYSTEM" / "_SCRIPTS" / "MAIL"
-
 DRY_RUN = False
 AUTO_SEND = False  # ⚠️ Set to True to auto-send emails on ✅ reaction
 
+POLL_TIMEOUT_S = 50  # server-side long-poll wait
+RETRY_MAX_S = 60
+ALLOWED_UPDATES = ["message_reaction"]
+
+WEBHOOK_URL = os.environ.get("ALIS_APPROVAL_WEBHOOK_URL", "").strip()
+WEBHOOK_LISTEN = os.environ.get("ALIS_APPROVAL_WEBHOOK_LISTEN", "127.0.0.1:8443").strip()
+WEBHOOK_SECRET = os.environ.get("ALIS_APPROVAL_WEBHOOK_SECRET", "").strip()
+
 # =====================
 # TELEGRAM
 # =====================
 
+class TelegramConflict(Exception):
+    """409: another getUpdates consumer or an active webhook"""
+
+
 def get_telegram_credentials() -> tuple:
     """Load Telegram credentials"""
     token = TELEGRAM_TOKEN_FILE.read_text(encoding="utf-8").strip()
     chat_id = TELEGRAM_CHAT_FILE.read_text(encoding="utf-8").strip()
     return token, chat_id
 
-def get_telegram_updates(token: str, offset: int = 0) -> list:
-    """Get updates from Telegram bot"""
+def telegram_call(token: str, method: str, params: dict, timeout: float = 10) -> dict:
+    """POST a Bot API method; returns result, raises on API or network errors"""
+    url = f"https://api.telegram.org/bot{token}/{method}"
+    data = parse.urlencode(
+        {k: (json.dumps(v) if isinstance(v, (list, dict)) else v) for k, v in params.items()}
+    ).encode("utf-8")
     try:
-        url = f"https://api.telegram.org/bot{token}/getUpdates"
-        params = parse.urlencode({"offset": offset, "allowed_updates": ["message_reaction"]})
-        req = request.Request(f"{url}?{params}")
-        
-        with request.urlopen(req, timeout=10) as response:
-            data = json.loads(response.read().decode())
-            
-            if data.get("ok"):
-                return data.get("result", [])
-            else:
-                print(f"Telegram error: {data.get('description')}")
-                return []
-    except Exception as e:
-        print(f"Error getting Telegram updates: {e}")
-        return []
+        with request.urlopen(request.Request(url, data=data), timeout=timeout) as response:
+            payload = json.loads(response.read().decode())
+    except error.HTTPError as e:
+        try:
+            payload = json.loads(e.read().decode())
+        except Exception:
+            payload = {"ok": False, "error_code": e.code, "description": str(e)}
+    if not payload.get("ok"):
+        if payload.get("error_code") == 409:
+            raise TelegramConflict(payload.get("description", "conflict"))
+        raise RuntimeError(f"{method}: {payload.get('description')}")
+    return payload.get("result")
+
+def get_telegram_updates(token: str, offset: int = 0) -> list:
+    """Long-poll updates: returns as soon as there is one, or after POLL_TIMEOUT_S"""
+    return telegram_call(
+        token,
+        "getUpdates",
+        {"offset": offset, "timeout": POLL_TIMEOUT_S, "allowed_updates": ALLOWED_UPDATES},
+        timeout=POLL_TIMEOUT_S + 10,
+    ) or []
 
 def parse_email_id_from_message(message: str) -> str:
     """Extract email_id from message (format: Original email ID: 20260203__abc123)"""
@@ -78,20 +131,70 @@ def get_message_reactions(update: dict) -> list:
         return [r.get("emoji") for r in reactions if r.get("emoji")]
     return []
 
+# =====================
+# FILES
+# =====================
+
+def _write_json_atomic(path: Path, obj, indent=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    tmp.write_text(json.dumps(obj, indent=indent, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
 def load_approval_state() -> dict:
     """Load state of processed approvals"""
     if not APPROVAL_STATE_FILE.exists():
         return {}
-    
+
     try:
         return json.loads(APPROVAL_STATE_FILE.read_text(encoding="utf-8"))
     except Exception:
         return {}
 
+# state is also updated by dispatcher threads when a send finishes
+STATE_LOCK = threading.RLock()
+DISPATCHER = None
+
 def save_approval_state(state: dict):
     """Save approval state"""
-    APPROVAL_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    APPROVAL_STATE_FILE.write_text(json.dumps(state, indent=2, ensure_ascii=False), encoding="utf-8")
+    with STATE_LOCK:
+        _write_json_atomic(APPROVAL_STATE_FILE, state, indent=2)
+
+def load_offset() -> int:
+    try:
+        return int(json.loads(APPROVAL_OFFSET_FILE.read_text(encoding="utf-8")).get("offset") or 0)
+    except Exception:
+        return 0
+
+def save_offset(offset: int):
+    _write_json_atomic(
+        APPROVAL_OFFSET_FILE,
+        {"offset": offset, "updated_utc": datetime.now(timezone.utc).isoformat()},
+    )
+
+
+class MessageMap:
+    """message_id -> email_id from telegram_approval_messages.json (re-read when it changes)"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._sig = None
+        self._map = {}
+
+    def get(self, message_id) -> str:
+        try:
+            st = self.path.stat()
+            sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+        if sig != self._sig:
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                self._map = data if isinstance(data, dict) else {}
+            except Exception:
+                self._map = {}
+            self._sig = sig
+        return self._map.get(str(message_id))
 
 # =====================
 # PROCESS REACTIONS
@@ -99,14 +202,18 @@ def save_approval_state(state: dict):
 
 def process_reaction(email_id: str, emoji: str, state: dict) -> bool:
     """Process reaction: ✅ approve, ❌ skip"""
-    
+
     state_key = f"{email_id}_{emoji}"
-    
-    # Check if already processed
-    if state_key in state:
-        print(f"Already processed: {email_id} with {emoji}")
-        return False
-    
+
+    # Check if already processed; a failed send may be retried by reacting again
+    with STATE_LOCK:
+        previous = state.get(state_key)
+    if previous is not None:
+        if not (isinstance(previous, dict) and previous.get("status") == "error"):
+            print(f"Already processed: {email_id} with {emoji}")
+            return False
+        print(f"Retrying after failed send: {email_id} with {emoji}")
+
     # Map emoji to action
     if emoji == "✅":
         action = "approve"
@@ -115,9 +222,9 @@ def process_reaction(email_id: str, emoji: str, state: dict) -> bool:
     else:
         print(f"Unknown emoji: {emoji}")
         return False
-    
+
     print(f"Processing: {email_id} → {action}")
-    
+
     # Check AUTO_SEND flag
     if not AUTO_SEND:
         print(f"⚠️ AUTO_SEND disabled. Reaction logged but NOT sending email.")
@@ -128,109 +235,197 @@ def process_reaction(email_id: str, emoji: str, state: dict) -> bool:
             "status": "logged_only"
         }
         return True
-    
-    # Call gmail_send_reply.py
-    script_path = MAIL_SCRIPTS / "gmail_send_reply.py"
-    
-    if not script_path.exists():
-        print(f"Script not found: {script_path}")
-        return False
-    
+
     if DRY_RUN:
-        print(f"[DRY_RUN] Would execute: python {script_path} {email_id} {action}")
+        print(f"[DRY_RUN] Would send: {email_id} {action}")
         state[state_key] = {
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "action": action,
             "status": "dry_run"
         }
+        return True
+
+    with STATE_LOCK:
+        state[state_key] = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "action": action,
+            "status": "queued",
+            "email_id": email_id
+        }
+    DISPATCHER.submit(email_id, action)
+    return True
+
+def on_send_done(state: dict, email_id: str, action: str, status: str, note: str):
+    """Dispatcher callback: record the outcome under the reaction's state key"""
+    emoji = "✅" if action == "approve" else "❌"
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "action": action,
+        "status": "error" if status == "failed" else "success",
+        "email_id": email_id,
+        "result": status
+    }
+    if status == "failed":
+        entry["error"] = note[:200]
+        print(f"❌ Failed: {email_id} {action}: {note}")
     else:
+        print(f"✅ Success: {email_id} {action} ({status})")
+    with STATE_LOCK:
+        state[f"{email_id}_{emoji}"] = entry
+        save_approval_state(state)
+
+def start_dispatcher(state: dict):
+    """Warm Gmail client + workers; re-submit sends a previous run left queued"""
+    global DISPATCHER
+    DISPATCHER = ReplyDispatcher(
+        on_done=lambda *args: on_send_done(state, *args)
+    ).start()
+    with STATE_LOCK:
+        queued = [v for v in state.values() if isinstance(v, dict) and v.get("status") == "queued"]
+    for v in queued:
+        if v.get("email_id"):
+            DISPATCHER.submit(v["email_id"], v.get("action", ""))
+    if queued:
+        print(f"Re-queued {len(queued)} unfinished send(s)")
+
+def handle_update(update: dict, chat_id: str, state: dict, messages: MessageMap) -> bool:
+    """Apply one update; True if state changed"""
+    reactions = get_message_reactions(update)
+    if not reactions:
+        return False
+
+    reaction = update["message_reaction"]
+    if str((reaction.get("chat") or {}).get("id")) != str(chat_id):
+        return False
+
+    text = (update.get("message") or {}).get("text", "")
+    email_id = parse_email_id_from_message(text) or messages.get(reaction.get("message_id"))
+    if not email_id:
+        print(f"Could not extract email_id for message {reaction.get('message_id')}")
+        return False
+
+    changed = False
+    with STATE_LOCK:
+        for emoji in reactions:
+            changed = process_reaction(email_id, emoji, state) or changed
+    return changed
+
+# =====================
+# LONG POLLING
+# =====================
+
+def run_polling(token: str, chat_id: str, state: dict, messages: MessageMap):
+    offset = load_offset()
+    retry_s = 1.0
+    try:
+        # getUpdates is refused while a webhook is set
+        telegram_call(token, "deleteWebhook", {"drop_pending_updates": "false"})
+    except Exception as e:
+        print(f"deleteWebhook failed: {e}")
+
+    while True:
         try:
-            result = subprocess.run(
-                ["python", str(script_path), email_id, action],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if result.returncode == 0:
-                print(f"✅ Success: {email_id} {action}")
-                state[state_key] = {
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "action": action,
-                    "status": "success"
-                }
-            else:
-                print(f"❌ Failed: {result.stderr}")
-                state[state_key] = {
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "action": action,
-                    "status": "error",
-                    "error": result.stderr[:200]
-                }
+            updates = get_telegram_updates(token, offset)
+            retry_s = 1.0
+        except KeyboardInterrupt:
+            raise
+        except TelegramConflict as e:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Conflict: {e} (retry in {RETRY_MAX_S}s)")
+            time.sleep(RETRY_MAX_S)
+            continue
         except Exception as e:
-            print(f"Error executing script: {e}")
-            state[state_key] = {
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "action": action,
-                "status": "error",
-                "error": str(e)[:200]
-            }
-    
-    return True
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error getting updates: {e} (retry in {retry_s:.0f}s)")
+            time.sleep(retry_s)
+            retry_s = min(RETRY_MAX_S, retry_s * 2)
+            continue
+
+        if not updates:
+            continue
+
+        changed = False
+        for update in updates:
+            offset = max(offset, int(update.get("update_id", 0)) + 1)
+            changed = handle_update(update, chat_id, state, messages) or changed
+
+        # state before offset: after a crash in between, updates are fetched
+        # again and skipped by their state keys
+        if changed:
+            save_approval_state(state)
+        save_offset(offset)
+
+# =====================
+# WEBHOOK
+# =====================
+
+def run_webhook(token: str, chat_id: str, state: dict, messages: MessageMap, url: str, listen: str):
+    host, _, port = listen.rpartition(":")
+    secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+    updates: queue.Queue = queue.Queue()
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+                self.send_error(403)
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                updates.put(json.loads(self.rfile.read(length).decode("utf-8")))
+            except Exception:
+                self.send_error(400)
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), _Handler)
+    threading.Thread(target=server.serve_forever, name="webhook-http", daemon=True).start()
+    telegram_call(
+        token,
+        "setWebhook",
+        {"url": url, "secret_token": secret, "allowed_updates": ALLOWED_UPDATES},
+    )
+    print(f"Webhook set: {url} -> http://{host or '127.0.0.1'}:{port}")
+
+    # one worker: updates are handled in arrival order, like in polling mode
+    try:
+        while True:
+            try:
+                update = updates.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if handle_update(update, chat_id, state, messages):
+                save_approval_state(state)
+    finally:
+        server.shutdown()
 
 def main():
     """Main listener loop"""
-    
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--webhook", default=WEBHOOK_URL, help="public HTTPS URL; enables webhook mode")
+    ap.add_argument("--listen", default=WEBHOOK_LISTEN, help="host:port of the local webhook server")
+    args = ap.parse_args()
+
     token, chat_id = get_telegram_credentials()
     state = load_approval_state()
-    
+    messages = MessageMap(APPROVAL_MESSAGES_FILE)
+
     print(f"Starting Telegram approval listener (chat_id: {chat_id})")
     print("Monitoring for ✅ (approve) and ❌ (skip) reactions...")
     print()
-    
-    offset = 0
-    
-    while True:
-        try:
-            updates = get_telegram_updates(token, offset)
-            
-            if not updates:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] No updates")
-            else:
-                for update in updates:
-                    update_id = update.get("update_id")
-                    offset = max(offset, update_id + 1)
-                    
-                    # Check for message reactions
-                    reactions = get_message_reactions(update)
-                    
-                    if reactions:
-                        # Get message to extract email_id
-                        message = update.get("message", {})
-                        text = message.get("text", "")
-                        email_id = parse_email_id_from_message(text)
-                        
-                        if email_id:
-                            for emoji in reactions:
-                                process_reaction(email_id, emoji, state)
-                        else:
-                            print(f"Could not extract email_id from message")
-            
-            # Save state
-            save_approval_state(state)
-            
-            # Sleep before next check (Telegram long polling)
-            import time
-            time.sleep(5)
-        
-        except KeyboardInterrupt:
-            print("\nListener stopped")
-            save_approval_state(state)
-            break
-        except Exception as e:
-            print(f"Error in listener: {e}")
-            import time
-            time.sleep(5)
+
+    if AUTO_SEND and not DRY_RUN:
+        start_dispatcher(state)
+
+    try:
+        if args.webhook:
+            run_webhook(token, chat_id, state, messages, args.webhook, args.listen)
+        else:
+            run_polling(token, chat_id, state, messages)
+    except KeyboardInterrupt:
+        print("\nListener stopped")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Shared Telegram Bot API client for the notifier scripts.
+
+- Keep-alive connection pool (http.client): a run that sends dozens of
+  messages pays for one TCP/TLS setup. A connection the server closed while
+  idle is replaced once, transparently.
+- call(): JSON POST with retries: 429 waits for parameters.retry_after,
+  5xx and network errors back off exponentially, other 4xx raise at once.
+  Every failure surfaces as TelegramError.
+- send_message(): splits texts longer than MSG_LIMIT.
+- SendQueue: collects the messages of one run and sends them merged into as
+  few Telegram messages as fit; per-item callbacks run only for delivered
+  items, so callers update their state only for what really went out.
+- load_credentials(): token and chat id from _SECRETS, read once per process.
+
+The API base is swappable: ALIS_TELEGRAM_API_BASE=http://127.0.0.1:8081
+points every script at a local fake, e.g. `python telegram_client.py --fake 8081`
+(FakeTelegramServer: records calls, can inject 429/5xx).
+"""
+
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+
+# =====================
+# CONFIG
+# =====================
+
+ROOT = Path(__file__).resolve().parents[3]
+SECRETS_DIR = ROOT / "99_SYSTEM" / "_SECRETS"
+TOKEN_FILE = SECRETS_DIR / "telegram_bot_token.txt"
+CHAT_FILE = SECRETS_DIR / "telegram_chat_id.txt"
+
+API_BASE = os.environ.get("ALIS_TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
+
+MSG_LIMIT = 3900  # Telegram hard limit is 4096 characters
+BATCH_SEPARATOR = "\n\n"
+TIMEOUT_S = 20.0
+MAX_ATTEMPTS = 4
+BACKOFF_MAX_S = 30.0
+RETRY_AFTER_MAX_S = 120.0
+POOL_SIZE = 2
+
+# =====================
+# CREDENTIALS
+# =====================
+
+@lru_cache(maxsize=None)
+def read_secret(path: Path) -> str:
+    path = Path(path)
+    if not path.exists():
+        return ""
+    return path.read_text(encoding="utf-8").strip()
+
+
+def load_credentials(token_file: Path = TOKEN_FILE, chat_file: Path = CHAT_FILE) -> tuple:
+    """(token, chat_id); empty strings when not configured"""
+    return read_secret(token_file), read_secret(chat_file)
+
+# =====================
+# CLIENT
+# =====================
+
+class TelegramError(Exception):
+    def __init__(self, description: str, error_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
+class TelegramClient:
+    def __init__(
+        self,
+        token: str,
+        api_base: str = API_BASE,
+        timeout: float = TIMEOUT_S,
+        max_attempts: int = MAX_ATTEMPTS,
+        pool_size: int = POOL_SIZE,
+    ):
+        self.token = token
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        u = urlsplit(api_base)
+        self._https = u.scheme == "https"
+        self._host = u.hostname or "api.telegram.org"
+        self._port = u.port
+        self._prefix = u.path.rstrip("/")
+        self._idle: list = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, pool_size))
+        self.connects = 0  # connection setups so far (TCP, plus TLS for https)
+
+    # -----------------------------
+    # connection pool
+    # -----------------------------
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        with self._lock:
+            self.connects += 1
+        return cls(self._host, self._port, timeout=self.timeout)
+
+    def _checkout(self) -> tuple:
+        """(connection, reused)"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _checkin(self, conn) -> None:
+        with self._lock:
+            self._idle.append(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _post(self, method: str, params: dict, timeout: float) -> tuple:
+        """(HTTP status, decoded body) over a pooled keep-alive connection"""
+        body = json.dumps(params, ensure_ascii=False).encode("utf-8")
+        path = f"{self._prefix}/bot{self.token}/{method}"
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        with self._slots:
+            conn, reused = self._checkout()
+            while True:
+                try:
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    conn.request("POST", path, body=body, headers=headers)
+                    resp = conn.getresponse()
+                    raw = resp.read()
+                except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                        BrokenPipeError, ConnectionResetError):
+                    conn.close()
+                    if not reused:
+                        raise
+                    # idle keep-alive connection closed by the server: one fresh try
+                    conn, reused = self._connect(), False
+                    continue
+                except BaseException:
+                    conn.close()
+                    raise
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._checkin(conn)
+                break
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except Exception:
+            data = {"ok": False, "description": raw[:200].decode("utf-8", errors="replace")}
+        return resp.status, data
+
+    # -----------------------------
+    # API
+    # -----------------------------
+
+    def call(self, method: str, params: Optional[dict] = None, timeout: Optional[float] = None):
+        """Bot API call; returns result or raises TelegramError after retries"""
+        timeout = self.timeout if timeout is None else timeout
+        backoff = 1.0
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                status, data = self._post(method, params or {}, timeout)
+            except (OSError, http.client.HTTPException) as e:
+                err = TelegramError(f"{method}: {type(e).__name__}: {e}")
+            else:
+                if data.get("ok"):
+                    return data.get("result")
+                retry_after = (data.get("parameters") or {}).get("retry_after")
+                code = data.get("error_code") or status
+                err = TelegramError(f"{method}: {data.get('description') or f'HTTP {status}'}", code, retry_after)
+                if retry_after is None and code < 500:
+                    raise err
+            if attempt == self.max_attempts:
+                raise err
+            if err.retry_after is not None:
+                time.sleep(min(float(err.retry_after), RETRY_AFTER_MAX_S))
+            else:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX_S)
+        raise AssertionError("unreachable")
+
+    def send_message(self, chat_id, text: str, **extra) -> list:
+        """Send text (split at MSG_LIMIT); returns the sent Message objects"""
+        return [
+            self.call("sendMessage", {"chat_id": chat_id, "text": part, **extra})
+            for part in split_text(text)
+        ]
+
+
+def split_text(text: str, limit: int = MSG_LIMIT) -> list:
+    """Chunks of at most limit characters, cut at line breaks where possible"""
+    text = text or ""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+_CLIENTS: dict = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def shared_client(token: str) -> TelegramClient:
+    """One pooled client per token and process"""
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(token)
+        if client is None:
+            client = _CLIENTS[token] = TelegramClient(token)
+        return client
+
+# =====================
+# SEND QUEUE
+# =====================
+
+class SendQueue:
+    """
+    Messages for one chat, sent merged (BATCH_SEPARATOR between items) into as
+    few Telegram messages as fit MSG_LIMIT. flush() stops at the first batch
+    that fails; its items and everything after stay queued.
+    """
+
+    def __init__(self, client: TelegramClient, chat_id, limit: int = MSG_LIMIT, **extra):
+        self.client = client
+        self.chat_id = chat_id
+        self.limit = limit
+        self.extra = extra
+        self.pending: list = []  # (text, on_sent)
+
+    def add(self, text: str, on_sent: Optional[Callable[[], None]] = None) -> None:
+        self.pending.append(((text or "").strip(), on_sent))
+
+    def _batches(self) -> list:
+        batches, cur, size = [], [], 0
+        for item in self.pending:
+            n = len(item[0])
+            if cur and size + len(BATCH_SEPARATOR) + n > self.limit:
+                batches.append(cur)
+                cur, size = [], 0
+            size += n + (len(BATCH_SEPARATOR) if cur else 0)
+            cur.append(item)
+        if cur:
+            batches.append(cur)
+        return batches
+
+    def flush(self) -> int:
+        """Send everything queued; returns items delivered"""
+        delivered = 0
+        for batch in self._batches():
+            try:
+                self.client.send_message(self.chat_id, BATCH_SEPARATOR.join(t for t, _ in batch), **self.extra)
+            except TelegramError as e:
+                print(f"Telegram send failed: {e}")
+                break
+            for _, on_sent in batch:
+                if on_sent is not None:
+                    on_sent()
+            delivered += len(batch)
+        self.pending = self.pending[delivered:]
+        return delivered
+
+# =====================
+# FAKE SERVER (tests)
+# =====================
+
+class FakeTelegramServer:
+    """
+    Local Bot API stand-in: answers every method with ok, records
+    (method, params) in calls, counts TCP connections. fail_next(n, code,
+    retry_after) makes the next n calls fail. Use as a context manager;
+    url goes to TelegramClient(api_base=...) or ALIS_TELEGRAM_API_BASE.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.calls: list = []
+        self.connections = 0
+        self._failures: list = []
+        self._message_id = 0
+        self._lock = threading.Lock()
+        fake = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    params = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                except Exception:
+                    params = {}
+                status, payload = fake._answer(method, params)
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def fail_next(self, n: int = 1, code: int = 429, retry_after: Optional[float] = 1) -> None:
+        with self._lock:
+            self._failures.extend([(code, retry_after)] * n)
+
+    def _answer(self, method: str, params: dict) -> tuple:
+        with self._lock:
+            self.calls.append((method, params))
+            if self._failures:
+                code, retry_after = self._failures.pop(0)
+                payload = {"ok": False, "error_code": code, "description": f"fake error {code}"}
+                if retry_after is not None:
+                    payload["parameters"] = {"retry_after": retry_after}
+                return code, payload
+            self._message_id += 1
+            if method == "sendMessage":
+                result = {"message_id": self._message_id, "chat": {"id": params.get("chat_id")},
+                          "date": int(time.time()), "text": params.get("text", "")}
+            elif method == "getUpdates":
+                result = []
+            else:
+                result = True
+            return 200, {"ok": True, "result": result}
+
+    def start(self) -> "FakeTelegramServer":
+        threading.Thread(target=self.server.serve_forever, name="fake-telegram", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local fake Telegram Bot API (prints every call)")
+    ap.add_argument("--fake", type=int, default=8081, metavar="PORT")
+    args = ap.parse_args()
+    fake = FakeTelegramServer(port=args.fake).start()
+    print(f"Fake Telegram API on {fake.url} (set ALIS_TELEGRAM_API_BASE={fake.url})")
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for method, params in fake.calls[seen:]:
+                print(f"{method}: {json.dumps(params, ensure_ascii=False)[:300]}")
+            seen = len(fake.calls)
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
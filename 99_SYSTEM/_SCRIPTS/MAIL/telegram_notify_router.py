@@ -1,21 +1,34 @@
 """
 Send Telegram notifications with AI-based draft replies after routing.
-Reads router_log.csv and sends only new entries (state file).
+Reads router_log.csv from a byte-offset checkpoint and sends only new entries
+(state file: offset + bounded dedup keys). Drafts it notified about are
+registered in telegram_reminders.json for telegram_reminder_scheduler.py.
 """
 
 import csv
 import json
 import re
+import sys
+import time
 from datetime import datetime, timezone
 from pathlib import Path
-from urllib import request, parse
+
+sys.path.insert(0, str(Path(__file__).parent))
+from telegram_client import SendQueue, load_credentials, shared_client
+from telegram_reminder_scheduler import register_drafts
 
 ROOT = Path(r"C:\Users\alimg\Dropbox\Archiwum 3.0")
 LOG_CSV = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "router_log.csv"
 STATE_FILE = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "telegram_notify_state.json"
-REMINDERS_FILE = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "telegram_reminders.json"  # Persistent reminders
 DRAFTS_DIR = ROOT / "00_INBOX" / "_DRAFTS"
 
+# rows notified per run at most (older new rows are skipped, as before)
+TAIL_ROWS = 50
+TAIL_BLOCK = 64 * 1024
+# dedup keys only guard re-reads after a lost checkpoint; keep them bounded
+DEDUP_WINDOW_DAYS = 14
+DEDUP_MAX = 1000
+
 SECRETS_DIR = ROOT / "99_SYSTEM" / "_SECRETS"
 TOKEN_FILE = SECRETS_DIR / "telegram_bot_token.txt"
 CHAT_FILE = SECRETS_DIR / "telegram_chat_id.txt"
@@ -36,46 +49,147 @@ def slugify(text: str, max_len: int = 60) -> str:
     return t[:max_len] if t else "no_subject"
 
 
+def _uid_time(uid: str) -> float:
+    """Epoch seconds of the ts_utc a dedup key starts with (0 if unparsable)"""
+    try:
+        ts = datetime.fromisoformat(uid.split("|", 1)[0])
+    except ValueError:
+        return 0.0
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def prune_recent(recent: dict, now: float) -> dict:
+    """Keep keys younger than DEDUP_WINDOW_DAYS, newest DEDUP_MAX at most"""
+    cutoff = now - DEDUP_WINDOW_DAYS * 86400
+    kept = [(t, uid) for uid, t in recent.items() if t >= cutoff]
+    kept.sort(reverse=True)
+    return {uid: t for t, uid in kept[:DEDUP_MAX]}
+
+
 def load_state() -> dict:
+    state = {"log_offset": None, "log_header": [], "recent": {}, "unregistered": []}
     if not STATE_FILE.exists():
-        return {"sent": set(), "reminders": {}}
+        return state
     try:
         data = json.loads(STATE_FILE.read_text(encoding="utf-8"))
-        return {
-            "sent": set(data.get("sent", [])),
-            "reminders": data.get("reminders", {}),
-        }
     except Exception:
-        return {"sent": set(), "reminders": {}}
+        return state
+    if isinstance(data.get("log_offset"), int):
+        state["log_offset"] = data["log_offset"]
+        state["log_header"] = data.get("log_header", [])
+    state["recent"] = {k: float(v) for k, v in data.get("recent", {}).items()}
+    state["unregistered"] = [tuple(d) for d in data.get("unregistered", [])]
+    # old format: ever-growing "sent" list, keys start with the row's ts_utc
+    for uid in data.get("sent", []):
+        state["recent"].setdefault(uid, _uid_time(uid))
+    return state
 
 
 def save_state(state: dict):
     STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-    STATE_FILE.write_text(
+    tmp = STATE_FILE.with_suffix(".tmp")
+    tmp.write_text(
         json.dumps(
             {
-                "sent": sorted(state.get("sent", set())),
-                "reminders": state.get("reminders", {}),
+                "log_offset": state.get("log_offset"),
+                "log_header": state.get("log_header", []),
+                "recent": state.get("recent", {}),
+                "unregistered": state.get("unregistered", []),
             },
             ensure_ascii=False,
-            indent=2,
+            separators=(",", ":"),
         ),
         encoding="utf-8",
     )
-
-
-def read_secret(path: Path) -> str:
-    if not path.exists():
-        return ""
-    return path.read_text(encoding="utf-8").strip()
-
-
-def send_telegram(token: str, chat_id: str, text: str):
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    data = parse.urlencode({"chat_id": chat_id, "text": text}).encode()
-    req = request.Request(url, data=data)
-    with request.urlopen(req, timeout=20) as resp:
-        return resp.read().decode("utf-8")
+    tmp.replace(STATE_FILE)
+
+
+# =====================
+# ROUTER LOG READING
+# =====================
+
+def _parse_rows(data: bytes, base: int):
+    """
+    Yield (values, start, end) for the CSV records in data (complete lines only);
+    start/end are absolute byte offsets (base = offset of data[0]).
+    csv.reader pulls lines lazily, so after each record the consumed byte
+    count is exactly where that record ends, quoted newlines included.
+    """
+    pos = base
+
+    def lines():
+        nonlocal pos
+        for raw in data.splitlines(keepends=True):
+            pos += len(raw)
+            yield raw.decode("utf-8", errors="replace")
+
+    start = base
+    for values in csv.reader(lines()):
+        yield values, start, pos
+        start = pos
+
+
+def read_header(path: Path) -> list:
+    with path.open("rb") as f:
+        line = f.readline()
+    return next(csv.reader([line.decode("utf-8-sig", errors="replace")]), [])
+
+
+def tail_offset(path: Path, rows: int, header_end: int) -> int:
+    """Offset where the last `rows` complete lines start, reading blocks backwards from EOF"""
+    with path.open("rb") as f:
+        pos = f.seek(0, 2)
+        buf = b""
+        while pos > header_end:
+            step = min(TAIL_BLOCK, pos - header_end)
+            pos -= step
+            f.seek(pos)
+            buf = f.read(step) + buf
+            complete = buf[: buf.rfind(b"\n") + 1]
+            if complete.count(b"\n") > rows:
+                cut = len(complete) - 1
+                for _ in range(rows):
+                    cut = complete.rfind(b"\n", 0, cut)
+                return pos + cut + 1
+    return header_end
+
+
+def read_new_rows(path: Path, state: dict) -> tuple[list, int]:
+    """
+    Rows appended since state["log_offset"] as (row dict, start, end) and the
+    offset of the end of the last complete line read. Without a usable
+    checkpoint (first run, log truncated or rewritten with another header) only
+    the last TAIL_ROWS rows are read, from the end of the file.
+    """
+    size = path.stat().st_size
+    header = read_header(path)
+    if not header:
+        return [], 0
+    with path.open("rb") as f:
+        header_end = len(f.readline())
+    offset = state.get("log_offset")
+    cut = False
+    if offset is None or offset < header_end or offset > size or state.get("log_header") != header:
+        # quoted subjects may span lines: take twice the lines, drop the first
+        # record (the cut may fall inside one), callers keep the last TAIL_ROWS
+        offset = tail_offset(path, 2 * TAIL_ROWS, header_end)
+        cut = offset > header_end
+    state["log_header"] = header
+
+    with path.open("rb") as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    complete = data.rfind(b"\n") + 1
+    data = data[:complete]
+
+    rows = []
+    for values, start, end in _parse_rows(data, offset):
+        if not values:
+            continue
+        rows.append((dict(zip(header, values)), start, end))
+    return rows[1:] if cut else rows, offset + complete
 
 
 def find_meta(meta_name: str, decision: str) -> Path | None:
@@ -135,8 +249,7 @@ def build_draft(subject: str, from_addr: str, evaluation: dict) -> str:
 
 
 def main():
-    token = read_secret(TOKEN_FILE)
-    chat_id = read_secret(CHAT_FILE)
+    token, chat_id = load_credentials(TOKEN_FILE, CHAT_FILE)
     if not token or not chat_id:
         print("Telegram not configured. Missing token or chat_id.")
         return
@@ -146,24 +259,22 @@ def main():
         return
 
     state = load_state()
-    sent_ids = state.get("sent", set())
-    reminders = state.get("reminders", {})
-    new_sent = set(sent_ids)
+    recent = state["recent"]
+    # (draft name, created) of delivered notifications, for the reminder scheduler;
+    # drafts a previous run could not register go first
+    new_drafts = list(state["unregistered"])
 
     DRAFTS_DIR.mkdir(parents=True, exist_ok=True)
-    
-    # Sync with persistent reminders file
-    persistent_reminders = {}
-    if REMINDERS_FILE.exists():
-        persistent_reminders = json.loads(REMINDERS_FILE.read_text(encoding='utf-8')).get("pending", {})
+    # one keep-alive connection; messages of this run go out merged
+    outbox = SendQueue(shared_client(token), chat_id)
 
-    with LOG_CSV.open("r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+    rows, read_to = read_new_rows(LOG_CSV, state)
+    # (start offset, delivered) of each row message, in send order
+    row_msgs = []
 
-    for row in rows[-50:]:
+    for row, row_start, _ in rows[-TAIL_ROWS:]:
         uid = f"{row.get('ts_utc')}|{row.get('file')}|{row.get('meta')}"
-        if uid in sent_ids:
+        if uid in recent:
             continue
 
         decision = row.get("decision", "")
@@ -208,58 +319,31 @@ def main():
             "Tip: usuń plik draftu, jeśli temat zamknięty (stop reminder).\n"
         )
 
-        try:
-            send_telegram(token, chat_id, msg)
-            new_sent.add(uid)
-            reminders[draft_name] = {
-                "created_utc": datetime.now(timezone.utc).isoformat(),
-                "draft_path": str(draft_path),
-                "notified": False,
-            }
-        except Exception as e:
-            print(f"Telegram send failed: {e}")
-            break
-
-    # Reminders: send after 2 hours if draft still exists and not notified
-    now = datetime.now(timezone.utc)
-    for draft_name, info in list(reminders.items()):
-        try:
-            draft_path = Path(info.get("draft_path", ""))
-            created = datetime.fromisoformat(info.get("created_utc"))
-            age_hours = (now - created).total_seconds() / 3600.0
-
-            if info.get("notified"):
-                continue
-            if age_hours < 2:
-                continue
-            if not draft_path.exists():
-                # Draft deleted = handled
-                info["notified"] = True
-                continue
-
-            reminder_msg = (
-                "⏰ Reminder: draft waiting\n"
-                f"Plik: {draft_path.name}\n"
-                f"Ścieżka: {draft_path}\n"
-                "Jeśli temat zamknięty — usuń plik draftu, aby zatrzymać przypomnienia."
-            )
-            send_telegram(token, chat_id, reminder_msg)
-            info["notified"] = True
-        except Exception as e:
-            print(f"Reminder failed: {e}")
-
-    state["sent"] = new_sent
-    state["reminders"] = reminders
+        delivered = [False]
+        row_msgs.append((row_start, delivered))
+
+        def on_sent(uid=uid, draft_name=draft_name, delivered=delivered):
+            delivered[0] = True
+            recent[uid] = _uid_time(uid) or time.time()
+            new_drafts.append((draft_name, datetime.now(timezone.utc).isoformat()))
+
+        outbox.add(msg, on_sent)
+
+    # undelivered items are not marked: the next run tries them again
+    outbox.flush()
+
+    # checkpoint: up to the first row whose message did not go out; rows
+    # after it that did are skipped next time by their dedup key
+    state["log_offset"] = next((start for start, ok in row_msgs if not ok[0]), read_to)
+    state["recent"] = prune_recent(recent, time.time())
+    # 2-hour reminders are sent by telegram_reminder_scheduler.py
+    if register_drafts(new_drafts):
+        state["unregistered"] = []
+    else:
+        state["unregistered"] = new_drafts
+        print(f"Reminder store locked: {len(new_drafts)} draft(s) will be registered next run")
     save_state(state)
-    
-    # Sync reminders to persistent file
-    persistent_data = {"pending": {}}
-    for draft_name, info in reminders.items():
-        draft_path = Path(info.get("draft_path", ""))
-        if draft_path.exists():  # Only keep if draft still exists
-            persistent_data["pending"][draft_name] = info.get("created_utc")
-    REMINDERS_FILE.write_text(json.dumps(persistent_data, indent=2), encoding='utf-8')
-    
+
     print("Telegram notifications done.")
 
 
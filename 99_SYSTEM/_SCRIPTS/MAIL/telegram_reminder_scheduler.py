@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Telegram Reminder Scheduler
+One long-running process for the "draft still waiting" reminders (replaces
+telegram_reminders_check.py run every 30 minutes and the separate reminder
+list telegram_notify_router.py used to keep in its own state).
+
+- telegram_reminders.json is the only reminder store. telegram_notify_router.py
+  registers a draft there once its notification went out; this daemon marks
+  reminders sent and drops drafts that are gone. Both sides write under
+  telegram_reminders.lock (state_file_utils).
+- Due times sit in a min-heap: first reminder at created + REMIND_EVERY_H,
+  then every REMIND_EVERY_H while the draft exists. The process sleeps until
+  the earliest due time, so a reminder goes out at its mark, not at the next
+  cron tick.
+- Draft deletion and store changes arrive as filesystem events (watchdog).
+  Without watchdog the two directories are stat'ed every FALLBACK_POLL_S and
+  the drafts folder is listed only when its mtime changed. The one draft that
+  is due is checked right before its reminder is sent.
+
+Run:  python telegram_reminder_scheduler.py          (daemon)
+      python telegram_reminder_scheduler.py --once   (send what is due, exit)
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+sys.path.insert(0, str(Path(__file__).parent))
+from state_file_utils import acquire_lock, release_lock
+from telegram_client import SendQueue, TelegramClient, load_credentials, shared_client
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+# =====================
+# CONFIG
+# =====================
+
+ROOT = Path(r"C:\Users\alimg\Dropbox\Archiwum 3.0")
+REMINDERS_FILE = ROOT / "00_INBOX" / "_ROUTER_LOGS" / "telegram_reminders.json"
+DRAFTS_DIR = ROOT / "00_INBOX" / "_DRAFTS"
+
+SECRETS_DIR = ROOT / "99_SYSTEM" / "_SECRETS"
+TOKEN_FILE = SECRETS_DIR / "telegram_bot_token.txt"
+CHAT_FILE = SECRETS_DIR / "telegram_chat_id.txt"
+
+REMIND_EVERY_H = float(os.environ.get("ALIS_REMINDER_HOURS", "2"))
+RETRY_S = 60
+FALLBACK_POLL_S = 30
+
+# =====================
+# STORE
+# =====================
+
+def _parse_utc(value: str) -> Optional[float]:
+    try:
+        ts = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+def read_store(path: Path = REMINDERS_FILE) -> dict:
+    """{draft_name: {"created_utc": iso, "reminded": n}}; old {name: iso} entries are read as reminded=0"""
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        print(f"Reminder store unreadable: {e}")
+        return {}
+    pending = {}
+    for name, info in data.get("pending", {}).items():
+        if isinstance(info, str):
+            info = {"created_utc": info, "reminded": 0}
+        if _parse_utc(info.get("created_utc")) is None:
+            continue
+        pending[name] = {"created_utc": info["created_utc"], "reminded": int(info.get("reminded", 0))}
+    return pending
+
+
+def _write_store(pending: dict, path: Path = REMINDERS_FILE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"pending": pending}, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+def update_store(fn, path: Path = REMINDERS_FILE) -> bool:
+    """Read-modify-write under the lock file; fn(pending) edits the dict in place. False if the lock was not acquired."""
+    lock = path.with_suffix(".lock")
+    # a lock left by a crashed writer (pid no longer running) is broken by acquire_lock
+    if not acquire_lock(lock, timeout_seconds=10):
+        return False
+    try:
+        pending = read_store(path)
+        fn(pending)
+        _write_store(pending, path)
+    finally:
+        release_lock(lock)
+    return True
+
+
+def register_drafts(drafts: Iterable[tuple[str, str]], path: Path = REMINDERS_FILE) -> bool:
+    """Add (draft_name, created_utc iso) pairs; drafts already registered keep their state"""
+    drafts = list(drafts)
+    if not drafts:
+        return True
+
+    def add(pending):
+        for name, created in drafts:
+            pending.setdefault(name, {"created_utc": created, "reminded": 0})
+
+    return update_store(add, path)
+
+# =====================
+# SCHEDULE
+# =====================
+
+class ReminderHeap:
+    """Min-heap of due times; re-planned entries are skipped lazily by generation"""
+
+    def __init__(self, every_s: float):
+        self.every_s = every_s
+        self._heap: list[tuple[float, int, str, int]] = []
+        self._seq = itertools.count()
+        self._gen = itertools.count(1)
+        # draft_name -> (generation, created epoch, reminded)
+        self._plans: dict[str, tuple[int, float, int]] = {}
+
+    def get(self, name: str) -> Optional[tuple[float, int]]:
+        """(created epoch, reminders sent) of a planned draft"""
+        plan = self._plans.get(name)
+        return plan[1:] if plan is not None else None
+
+    def names(self) -> list[str]:
+        return list(self._plans)
+
+    def due_at(self, name: str) -> Optional[float]:
+        plan = self._plans.get(name)
+        if plan is None:
+            return None
+        return plan[1] + (plan[2] + 1) * self.every_s
+
+    def plan(self, name: str, created: float, reminded: int, at: Optional[float] = None):
+        old = self._plans.get(name)
+        if old is not None and old[1:] == (created, reminded) and at is None:
+            return
+        gen = next(self._gen)
+        self._plans[name] = (gen, created, reminded)
+        heapq.heappush(self._heap, (at if at is not None else self.due_at(name), next(self._seq), name, gen))
+
+    def sync(self, pending: dict):
+        """Bring plans in line with the store (only changed entries are pushed)"""
+        for name, info in pending.items():
+            created = _parse_utc(info["created_utc"])
+            reminded = info["reminded"]
+            old = self._plans.get(name)
+            if old is not None and old[1] == created:
+                # a reminder sent but not yet saved to the store is not undone by a reload
+                reminded = max(reminded, old[2])
+            self.plan(name, created, reminded)
+        for name in [n for n in self._plans if n not in pending]:
+            del self._plans[name]
+        if len(self._heap) > 2 * len(self._plans) + 64:
+            self._heap = [e for e in self._heap if self._valid(e)]
+            heapq.heapify(self._heap)
+
+    def forget(self, name: str) -> bool:
+        return self._plans.pop(name, None) is not None
+
+    def _valid(self, entry) -> bool:
+        plan = self._plans.get(entry[2])
+        return plan is not None and plan[0] == entry[3]
+
+    def next_at(self) -> Optional[float]:
+        while self._heap and not self._valid(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> list[str]:
+        out = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._valid(entry):
+                out.append(entry[2])
+        return out
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._plans
+
+    def __len__(self) -> int:
+        return len(self._plans)
+
+# =====================
+# DAEMON
+# =====================
+
+def reminder_text(draft_path: Path) -> str:
+    subject = draft_path.stem.split("__", 1)[-1].replace("_draft", "").replace("_", " ")
+    return f"""⏰ REMINDER ({REMIND_EVERY_H:g} hours):
+
+Draft still pending:
+{subject}
+
+Action:
+- ✏️ Edit & send reply
+- 🗑️ Delete draft (closes topic + stops reminders)
+
+Draft: {draft_path}"""
+
+
+class _Events(FileSystemEventHandler):
+    def __init__(self, daemon: "ReminderDaemon"):
+        self.daemon = daemon
+
+    def on_any_event(self, event):
+        src = Path(event.src_path)
+        dest = Path(getattr(event, "dest_path", "") or src)
+        if self.daemon.store_path in (src, dest):
+            # the store is replaced via a temp file, so this is usually a move
+            self.daemon.notify(reload=True)
+        elif event.event_type in ("deleted", "moved") and src.parent == self.daemon.drafts_dir:
+            self.daemon.notify(deleted=src.name)
+
+
+class ReminderDaemon:
+    def __init__(self, client: TelegramClient, chat_id, store_path: Path = REMINDERS_FILE,
+                 drafts_dir: Path = DRAFTS_DIR, every_h: float = REMIND_EVERY_H):
+        self.client = client
+        self.chat_id = chat_id
+        self.store_path = store_path
+        self.drafts_dir = drafts_dir
+        self.heap = ReminderHeap(every_h * 3600)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._reload = True
+        self._deleted: set = set()
+        self._stop = False
+        self._store_sig = None
+        self._drafts_mtime = None
+        # store writes that failed (lock not acquired), retried every round
+        self._unsaved_marks: dict[str, int] = {}
+        self._unsaved_drops: set = set()
+
+    def notify(self, reload: bool = False, deleted: Optional[str] = None):
+        with self._lock:
+            self._reload = self._reload or reload
+            if deleted:
+                self._deleted.add(deleted)
+        self._wake.set()
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+
+    # -----------------------------
+    # state changes
+    # -----------------------------
+
+    def _load(self):
+        try:
+            st = self.store_path.stat()
+            sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            sig = None
+        if sig == self._store_sig:
+            return
+        self._store_sig = sig
+        pending = read_store(self.store_path)
+        for name in self._unsaved_drops:
+            pending.pop(name, None)
+        self.heap.sync(pending)
+
+    def _persist(self) -> bool:
+        """Write reminder counts / removed drafts to the store; False if the lock was not acquired"""
+        if not self._unsaved_marks and not self._unsaved_drops:
+            return True
+        marks, drops = dict(self._unsaved_marks), set(self._unsaved_drops)
+
+        def apply(pending):
+            for name in drops:
+                pending.pop(name, None)
+            for name, reminded in marks.items():
+                if name in pending:
+                    pending[name]["reminded"] = max(reminded, pending[name]["reminded"])
+
+        if not update_store(apply, self.store_path):
+            print(f"[ERROR] Reminder store locked, {len(marks) + len(drops)} change(s) kept for the next round")
+            return False
+        self._unsaved_marks.clear()
+        self._unsaved_drops.clear()
+        return True
+
+    def _drop(self, names: set):
+        names = {n for n in names if n in self.heap}
+        if not names:
+            return
+        for name in names:
+            self.heap.forget(name)
+            self._unsaved_marks.pop(name, None)
+            print(f"[CLEANUP] Draft gone, reminders stopped: {name}")
+        self._unsaved_drops |= names
+        self._persist()
+
+    def _scan_drafts(self):
+        """One listing of the drafts folder; drops registered drafts that are not in it"""
+        try:
+            present = {e.name for e in os.scandir(self.drafts_dir)}
+        except OSError:
+            present = set()
+        self._drop({n for n in self.heap.names() if n not in present})
+
+    def _poll_fallback(self):
+        """Without watchdog: two stats per FALLBACK_POLL_S, a listing only when the folder changed"""
+        try:
+            mtime = self.drafts_dir.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._drafts_mtime:
+            self._drafts_mtime = mtime
+            self._scan_drafts()
+        self._load()
+
+    # -----------------------------
+    # firing
+    # -----------------------------
+
+    def fire_due(self, now: float) -> int:
+        due = self.heap.pop_due(now)
+        if not due:
+            return 0
+        gone = set()
+        sent: list[str] = []
+        # a queue per round: failed items must not ride along with the next
+        # one, their retry is planned on the heap below
+        outbox = SendQueue(self.client, self.chat_id)
+        for name in due:
+            draft_path = self.drafts_dir / name
+            if not draft_path.exists():
+                gone.add(name)
+                continue
+            outbox.add(reminder_text(draft_path), lambda name=name: sent.append(name))
+        self._drop(gone)
+        outbox.flush()
+
+        # reminders due again are counted from created, so a long outage sends one, not a burst
+        every = self.heap.every_s
+        marks = {}
+        for name in sent:
+            created, _ = self.heap.get(name)
+            marks[name] = max(int((now - created) // every), 1)
+            print(f"[REMINDER] Sent for: {name}")
+
+        if marks:
+            for name, reminded in marks.items():
+                self.heap.plan(name, self.heap.get(name)[0], reminded)
+            self._unsaved_marks.update(marks)
+            self._persist()
+
+        failed = [n for n in due if n not in gone and n not in marks]
+        for name in failed:
+            created, reminded = self.heap.get(name)
+            self.heap.plan(name, created, reminded, at=now + RETRY_S)
+        if failed:
+            print(f"[ERROR] Failed to send {len(failed)} reminder(s), retry in {RETRY_S}s")
+        return len(marks)
+
+    # -----------------------------
+    # loop
+    # -----------------------------
+
+    def run_once(self) -> int:
+        self._load()
+        self._scan_drafts()
+        return self.fire_due(time.time())
+
+    def run(self):
+        observer = None
+        if WATCHDOG_AVAILABLE:
+            observer = Observer()
+            handler = _Events(self)
+            self.drafts_dir.mkdir(parents=True, exist_ok=True)
+            self.store_path.parent.mkdir(parents=True, exist_ok=True)
+            observer.schedule(handler, str(self.drafts_dir), recursive=False)
+            if self.store_path.parent != self.drafts_dir:
+                observer.schedule(handler, str(self.store_path.parent), recursive=False)
+            observer.start()
+            print("Watching drafts and reminder store (watchdog)")
+        else:
+            print(f"watchdog not installed: checking folders every {FALLBACK_POLL_S}s")
+
+        # drafts deleted while the daemon was down
+        self._load()
+        self._scan_drafts()
+        try:
+            while not self._stop:
+                with self._lock:
+                    reload, self._reload = self._reload, False
+                    deleted, self._deleted = self._deleted, set()
+                if reload:
+                    self._load()
+                if deleted:
+                    self._drop(deleted)
+                if observer is None:
+                    self._poll_fallback()
+
+                now = time.time()
+                self.fire_due(now)
+                saved = self._persist()
+
+                next_at = self.heap.next_at()
+                timeout = None if next_at is None else max(0.0, next_at - time.time())
+                if observer is None or not saved:
+                    poll = FALLBACK_POLL_S if saved else RETRY_S
+                    timeout = poll if timeout is None else min(timeout, poll)
+                self._wake.wait(timeout)
+                self._wake.clear()
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--once", action="store_true", help="send the reminders that are due and exit")
+    args = ap.parse_args()
+
+    token, chat_id = load_credentials(TOKEN_FILE, CHAT_FILE)
+    if not token or not chat_id:
+        print("Telegram not configured. Missing token or chat_id.")
+        return
+
+    daemon = ReminderDaemon(shared_client(token), chat_id)
+    if args.once:
+        sent = daemon.run_once()
+        print(f"Reminders done. Sent: {sent}, pending: {len(daemon.heap)}")
+        return
+
+    print(f"Reminder scheduler started (every {REMIND_EVERY_H:g}h, {len(read_store())} pending)")
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print("\nReminder scheduler stopped")
+
+
+if __name__ == "__main__":
+    main()
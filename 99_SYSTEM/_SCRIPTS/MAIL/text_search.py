@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Diacritic-insensitive fuzzy search for Polish/Russian text.
+
+- fold(): casefold + NFKD + strip diacritics (ą→a, ł→l, ё→е), keeps punctuation
+- normalize(): fold() + non-alphanumerics collapsed to single spaces
+- TrigramIndex: posting lists per trigram, lookups touch only documents
+  that share at least one trigram with the query (no linear scan)
+"""
+
+import heapq
+import json
+import unicodedata
+from pathlib import Path
+from typing import Optional
+
+# Share of query trigrams a document must contain to count as a match.
+DEFAULT_MIN_SIMILARITY = 0.5
+
+# Letters NFKD does not split into base + combining mark.
+_EXTRA_FOLD = str.maketrans({
+    "ł": "l",
+    "đ": "d",
+    "ø": "o",
+    "ß": "ss",
+    "æ": "ae",
+    "œ": "oe",
+})
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip diacritics: 'Wyciąg SKŁADKA Ёлка' -> 'wyciag skladka елка'"""
+    t = (text or "").casefold()
+    t = unicodedata.normalize("NFKD", t)
+    t = "".join(ch for ch in t if not unicodedata.combining(ch))
+    return t.translate(_EXTRA_FOLD)
+
+
+def normalize(text: str) -> str:
+    """fold() + every non-alphanumeric run replaced by one space"""
+    out = []
+    prev_space = True
+    for ch in fold(text):
+        if ch.isalnum():
+            out.append(ch)
+            prev_space = False
+        elif not prev_space:
+            out.append(" ")
+            prev_space = True
+    return "".join(out).strip()
+
+
+def trigrams(text: str) -> set:
+    """Word trigrams of normalized text, padded like pg_trgm ('  w', ' wy', ..., 'ag ')"""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+class TrigramIndex:
+    """In-memory trigram index; doc ids are sequential ints (insertion order)."""
+
+    def __init__(self):
+        self.postings: dict[str, list[int]] = {}
+        self.sizes: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def add(self, text: str) -> int:
+        doc_id = len(self.sizes)
+        grams = trigrams(text)
+        self.sizes.append(len(grams))
+        for g in grams:
+            self.postings.setdefault(g, []).append(doc_id)
+        return doc_id
+
+    def search(self, query: str, limit: Optional[int] = 10,
+               min_similarity: float = DEFAULT_MIN_SIMILARITY) -> list:
+        """
+        Returns [(doc_id, score)] best first.
+        score = share of query trigrams found in the document (1.0 = every query word present);
+        ties are broken by Jaccard similarity so shorter, closer documents win.
+        limit=None returns all matches.
+        """
+        q = trigrams(query)
+        if not q:
+            return []
+
+        shared: dict[int, int] = {}
+        for g in q:
+            for doc_id in self.postings.get(g, ()):
+                shared[doc_id] = shared.get(doc_id, 0) + 1
+
+        nq = len(q)
+        need = max(1, int(min_similarity * nq + 0.999999))
+        scored = []
+        for doc_id, n in shared.items():
+            if n < need:
+                continue
+            jaccard = n / (nq + self.sizes[doc_id] - n)
+            scored.append((n / nq, jaccard, -doc_id))
+
+        if limit is None:
+            scored.sort(reverse=True)
+        else:
+            scored = heapq.nlargest(limit, scored)
+        return [(-neg_id, round(score, 3)) for score, _, neg_id in scored]
+
+    def to_dict(self) -> dict:
+        return {"version": 1, "sizes": self.sizes, "postings": self.postings}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TrigramIndex":
+        idx = cls()
+        if isinstance(data, dict) and data.get("version") == 1:
+            idx.sizes = list(data.get("sizes") or [])
+            idx.postings = dict(data.get("postings") or {})
+        return idx
+
+    def save(self, path: Path, extra: Optional[dict] = None) -> None:
+        """Write index (plus optional side data, e.g. line offsets) as compact JSON"""
+        payload = self.to_dict()
+        if extra:
+            payload.update(extra)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> tuple:
+        """Returns (index, raw_payload); empty index if the file is missing/broken"""
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            return cls(), {}
+        return cls.from_dict(data), data
+
+
+if __name__ == "__main__":
+    idx = TrigramIndex()
+    for doc in ["Wyciąg z rachunku mBank", "Składka ZUS styczeń", "Выписка по счёту", "Kuchnia Legionowo"]:
+        idx.add(doc)
+    for q in ["wyciag", "skladka", "skladak", "выписка", "kuchna"]:
+        print(q, "->", idx.search(q))
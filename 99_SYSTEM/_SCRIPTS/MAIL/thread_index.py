@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Thread / conversation index over Gmail reply exports (*.jsonl).
+
+Sidecar file <export>.threads.json maps:
+- thread_id  -> [[dt_utc, byte_offset], ...] ordered by time
+- message_id -> thread_id
+- RFC Message-ID header -> thread_id (In-Reply-To / References resolve through it)
+
+Built in one streaming pass; refresh() only reads bytes appended since the
+last run, so loading a conversation costs O(thread size), not O(export).
+"""
+
+import bisect
+import hashlib
+import json
+import sys
+from pathlib import Path
+from typing import Optional
+
+INDEX_VERSION = 1
+FINGERPRINT_BYTES = 4096
+
+
+def index_path_for(jsonl_path: Path) -> Path:
+    return jsonl_path.with_name(jsonl_path.name + ".threads.json")
+
+
+def _split_ids(raw: str) -> list:
+    """'<a@x> <b@y>' -> ['<a@x>', '<b@y>']"""
+    return [p for p in (raw or "").replace(",", " ").split() if p.startswith("<") and p.endswith(">")]
+
+
+def _fingerprint(f, size: int) -> str:
+    """sha1 of the first indexed bytes, to tell a rewrite from an append"""
+    f.seek(0)
+    return hashlib.sha1(f.read(min(size, FINGERPRINT_BYTES))).hexdigest()
+
+
+class ThreadIndex:
+    def __init__(self, jsonl_path: Path):
+        self.jsonl_path = Path(jsonl_path)
+        self.index_path = index_path_for(self.jsonl_path)
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.fingerprint = ""
+        self.threads: dict[str, list] = {}
+        self.messages: dict[str, str] = {}
+        self.rfc_ids: dict[str, str] = {}
+
+    # -----------------------------
+    # persistence
+    # -----------------------------
+
+    @classmethod
+    def open(cls, jsonl_path: Path, refresh: bool = True) -> "ThreadIndex":
+        """Load sidecar (if any) and catch up with appended lines"""
+        idx = cls(jsonl_path)
+        try:
+            data = json.loads(idx.index_path.read_text(encoding="utf-8"))
+            if data.get("version") == INDEX_VERSION:
+                idx.size = int(data.get("size", 0))
+                idx.fingerprint = data.get("fingerprint", "")
+                idx.threads = data.get("threads", {})
+                idx.messages = data.get("messages", {})
+                idx.rfc_ids = data.get("rfc_ids", {})
+        except Exception:
+            idx._reset()
+        if refresh and idx.refresh():
+            idx.save()
+        return idx
+
+    def save(self) -> None:
+        payload = {
+            "version": INDEX_VERSION,
+            "size": self.size,
+            "fingerprint": self.fingerprint,
+            "threads": self.threads,
+            "messages": self.messages,
+            "rfc_ids": self.rfc_ids,
+        }
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        tmp.replace(self.index_path)
+
+    # -----------------------------
+    # building
+    # -----------------------------
+
+    def refresh(self) -> bool:
+        """Index lines appended since last run (full rebuild if the file was rewritten). Returns True if changed."""
+        if not self.jsonl_path.exists():
+            changed = self.size > 0
+            self._reset()
+            return changed
+
+        with self.jsonl_path.open("rb") as f:
+            f.seek(0, 2)
+            file_size = f.tell()
+            if file_size == self.size:
+                return False
+
+            if file_size < self.size or (self.size and _fingerprint(f, self.size) != self.fingerprint):
+                self._reset()  # file was rewritten, not appended
+
+            f.seek(self.size)
+            offset = self.size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # partial line still being written
+                self._add_line(line, offset)
+                offset += len(line)
+            self.size = offset
+            self.fingerprint = _fingerprint(f, self.size)
+        return True
+
+    def _add_line(self, line: bytes, offset: int) -> None:
+        try:
+            row = json.loads(line.decode("utf-8"))
+        except Exception:
+            return
+        if not isinstance(row, dict):
+            return
+
+        mid = str(row.get("message_id") or "")
+        rfc_id = str(row.get("rfc_message_id") or "").strip()
+        parents = _split_ids(row.get("in_reply_to") or "") + _split_ids(row.get("references") or "")
+
+        tid = str(row.get("thread_id") or "")
+        if not tid:
+            for p in parents:
+                if p in self.rfc_ids:
+                    tid = self.rfc_ids[p]
+                    break
+        if not tid:
+            tid = mid or rfc_id or f"offset:{offset}"
+
+        dt = str(row.get("dt_utc") or row.get("date_utc") or "")
+        bisect.insort(self.threads.setdefault(tid, []), [dt, offset])
+        if mid:
+            self.messages[mid] = tid
+        if rfc_id:
+            self.rfc_ids[rfc_id] = tid
+        for p in parents:
+            self.rfc_ids.setdefault(p, tid)
+
+    # -----------------------------
+    # lookups
+    # -----------------------------
+
+    def thread_for(self, key: str) -> Optional[str]:
+        """Resolve thread_id from a thread_id, Gmail message_id or RFC Message-ID / In-Reply-To value"""
+        key = (key or "").strip()
+        if not key:
+            return None
+        if key in self.threads:
+            return key
+        return self.messages.get(key) or self.rfc_ids.get(key)
+
+    def load_thread(self, key: str) -> list:
+        """All messages of the conversation, oldest first (reads only those lines)"""
+        tid = self.thread_for(key)
+        if not tid:
+            return []
+        rows = []
+        with self.jsonl_path.open("rb") as f:
+            for _, offset in self.threads.get(tid, []):
+                f.seek(offset)
+                try:
+                    rows.append(json.loads(f.readline().decode("utf-8")))
+                except Exception:
+                    continue
+        return rows
+
+
+def format_thread(rows: list, max_chars: int = 3000, body_chars: int = 600) -> str:
+    """Compact text rendering of a conversation for prompts (newest messages kept if trimmed)"""
+    parts = []
+    for r in rows:
+        dt = str(r.get("dt_utc") or r.get("date_utc") or "")[:16]
+        body = (r.get("body") or r.get("snippet") or "").strip()
+        parts.append(
+            f"[{dt}] {r.get('from', '')} -> {r.get('to', '')}\n"
+            f"Subject: {r.get('subject', '')}\n"
+            f"{body[:body_chars]}"
+        )
+    text = "\n\n".join(parts)
+    return text[-max_chars:] if len(text) > max_chars else text
+
+
+def update_thread_index(jsonl_path: Path) -> ThreadIndex:
+    """Convenience for exporters: bring the sidecar index up to date"""
+    return ThreadIndex.open(jsonl_path, refresh=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python thread_index.py <export.jsonl> [thread_or_message_id]")
+        sys.exit(1)
+    idx = update_thread_index(Path(sys.argv[1]))
+    print(f"Threads: {len(idx.threads)} | messages: {len(idx.messages)} | indexed bytes: {idx.size}")
+    if len(sys.argv) > 2:
+        print(format_thread(idx.load_thread(sys.argv[2])))